@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+"""Synthetic datasets served by the benchmark server.
+
+Items are generated from their position, so pages can be built
+on demand without keeping the whole dataset in memory, and the
+same parameters always produce the same data.
+"""
+
+import datetime
+
+
+EPOCH = datetime.datetime(2014, 1, 1)
+
+PUPPET_TIMESTAMP = '%Y-%m-%d %H:%M:%S -0700'
+GITHUB_TIMESTAMP = '%Y-%m-%dT%H:%M:%SZ'
+
+# Number of modules owned by each Puppet user
+MODULES_PER_USER = 5
+
+
+class PuppetForgeDataset(object):
+    """Puppet Forge with `nmodules` modules and `nreleases` releases.
+
+    Releases are spread evenly among modules. Modules are listed
+    from the most recently updated one. Releases of each module are
+    sorted by their last update, as the Forge does when they are
+    sorted by 'release_date'.
+    """
+
+    def __init__(self, nmodules=50000, nreleases=500000):
+        self.nmodules = nmodules
+        self.nreleases = nreleases
+
+    def modules_page(self, offset, limit):
+        end = min(offset + limit, self.nmodules)
+        results = [self.module(i) for i in range(offset, end)]
+
+        return {'pagination' : _pagination('/v3/modules', offset, limit,
+                                           self.nmodules),
+                'results' : results}
+
+    def releases_page(self, module, offset, limit):
+        i = self._module_index(module)
+
+        if i is None:
+            return {'message' : '400 Bad Request',
+                    'errors' : ["Module %s does not exist" % module]}
+
+        nreleases = self.module_releases(i)
+        end = min(offset + limit, nreleases)
+        results = [self.release(i, k) for k in range(offset, end)]
+
+        path = '/v3/releases?module=%s' % module
+
+        return {'pagination' : _pagination(path, offset, limit, nreleases),
+                'results' : results}
+
+    def module(self, i):
+        username, name = self._module_names(i)
+
+        return {'uri' : '/v3/modules/%s-%s' % (username, name),
+                'name' : name,
+                'downloads' : i * 7,
+                'created_at' : _timestamp(EPOCH, PUPPET_TIMESTAMP),
+                'updated_at' : _timestamp(self._module_updated_on(i),
+                                          PUPPET_TIMESTAMP),
+                'owner' : {'uri' : '/v3/users/%s' % username,
+                           'username' : username}}
+
+    def module_releases(self, i):
+        nreleases = self.nreleases / self.nmodules
+
+        if i < self.nreleases % self.nmodules:
+            nreleases += 1
+        return nreleases
+
+    def release(self, i, k):
+        username, name = self._module_names(i)
+        version = '1.0.%s' % (self.module_releases(i) - k)
+        slug = '%s-%s-%s' % (username, name, version)
+
+        # The newest release was published when the module was updated
+        updated_on = self._module_updated_on(i) - datetime.timedelta(hours=k)
+
+        return {'uri' : '/v3/releases/' + slug,
+                'file_uri' : '/v3/files/%s.tar.gz' % slug,
+                'version' : version,
+                'created_at' : _timestamp(updated_on, PUPPET_TIMESTAMP),
+                'updated_at' : _timestamp(updated_on, PUPPET_TIMESTAMP),
+                'metadata' : {'name' : '%s-%s' % (username, name),
+                              'version' : version}}
+
+    def _module_names(self, i):
+        return 'user%s' % (i / MODULES_PER_USER), 'module%s' % i
+
+    def _module_updated_on(self, i):
+        return EPOCH + datetime.timedelta(minutes=self.nmodules - i)
+
+    def _module_index(self, module):
+        try:
+            i = int(module.rsplit('-module', 1)[1])
+        except (IndexError, ValueError):
+            return None
+
+        if i >= self.nmodules or module != '-'.join(self._module_names(i)):
+            return None
+        return i
+
+
+class DockerHubDataset(object):
+    """Docker Hub with `nrepos` repositories for each owner"""
+
+    def __init__(self, nrepos=10000):
+        self.nrepos = nrepos
+
+    def repositories_page(self, owner, page, page_size):
+        offset = (page - 1) * page_size
+        end = min(offset + page_size, self.nrepos)
+
+        results = [{'name' : 'repo%s' % i,
+                    'namespace' : owner,
+                    'star_count' : i % 1000,
+                    'pull_count' : i * 13}
+                   for i in range(offset, end)]
+
+        path = '/v2/repositories/%s/?page=%s&page_size=%s'
+
+        return {'count' : self.nrepos,
+                'next' : path % (owner, page + 1, page_size) if end < self.nrepos else None,
+                'previous' : path % (owner, page - 1, page_size) if page > 1 else None,
+                'results' : results}
+
+
+class GitHubDataset(object):
+    """GitHub Enterprise with `nrepos` repositories for each organization"""
+
+    def __init__(self, nrepos=1000):
+        self.nrepos = nrepos
+
+    def organization(self, base_url, owner):
+        api_url = base_url + 'api/v3/orgs/' + owner
+
+        org = {'login' : owner,
+               'id' : 1,
+               'url' : api_url,
+               'html_url' : base_url + owner,
+               'avatar_url' : base_url + 'avatars/' + owner,
+               'description' : 'Synthetic organization',
+               'public_repos' : self.nrepos,
+               'followers' : 0,
+               'following' : 0,
+               'created_at' : _timestamp(EPOCH, GITHUB_TIMESTAMP),
+               'type' : 'Organization'}
+
+        for name in ('events', 'hooks', 'issues', 'repos'):
+            org[name + '_url'] = api_url + '/' + name
+        org['members_url'] = api_url + '/members{/member}'
+        org['public_members_url'] = api_url + '/public_members{/member}'
+
+        return org
+
+    def repositories_page(self, base_url, owner, page, per_page):
+        """Return the repositories of a page and whether there are more"""
+
+        offset = (page - 1) * per_page
+        end = min(offset + per_page, self.nrepos)
+
+        repos = [self.repository(base_url, owner, i) for i in range(offset, end)]
+
+        return repos, end < self.nrepos
+
+    def repository(self, base_url, owner, i):
+        name = 'repo%s' % i
+        full_name = owner + '/' + name
+        api_url = base_url + 'api/v3/repos/' + full_name
+
+        repo = {'id' : i + 1,
+                'name' : name,
+                'full_name' : full_name,
+                'description' : None,
+                'fork' : False,
+                'private' : False,
+                'url' : api_url,
+                'html_url' : base_url + full_name,
+                'clone_url' : base_url + full_name + '.git',
+                'stargazers_count' : i % 500,
+                'forks_count' : i % 50,
+                # GitHub sends the stargazers as watchers
+                'watchers_count' : i % 500,
+                'owner' : self._owner(base_url, owner)}
+
+        # API links of the repository
+        for name in ('archive', 'assignees', 'blobs', 'branches',
+                     'collaborators', 'comments', 'commits', 'compare',
+                     'contents', 'contributors', 'deployments', 'downloads',
+                     'events', 'forks', 'git_commits', 'git_refs', 'git_tags',
+                     'hooks', 'issue_comment', 'issue_events', 'issues', 'keys',
+                     'labels', 'languages', 'merges', 'milestones',
+                     'notifications', 'pulls', 'releases', 'stargazers',
+                     'statuses', 'subscribers', 'subscription', 'tags',
+                     'teams', 'trees'):
+            repo[name + '_url'] = api_url + '/' + name
+
+        return repo
+
+    def graphql_organization(self, owner, cursor, first):
+        """Return the organization field of a GraphQL query"""
+
+        offset = int(cursor or 0)
+        end = min(offset + first, self.nrepos)
+
+        nodes = [{'name' : 'repo%s' % i,
+                  'url' : 'https://github.com/%s/repo%s' % (owner, i),
+                  'stargazers' : {'totalCount' : i % 500},
+                  'forkCount' : i % 50,
+                  'watchers' : {'totalCount' : i % 37}}
+                 for i in range(offset, end)]
+
+        return {'url' : 'https://github.com/' + owner,
+                'repositories' : {'pageInfo' : {'hasNextPage' : end < self.nrepos,
+                                                'endCursor' : str(end)},
+                                  'nodes' : nodes}}
+
+    def _owner(self, base_url, owner):
+        api_url = base_url + 'api/v3/users/' + owner
+
+        user = {'login' : owner,
+                'id' : 1,
+                'type' : 'Organization',
+                'url' : api_url,
+                'html_url' : base_url + owner,
+                'avatar_url' : base_url + 'avatars/' + owner,
+                'gravatar_id' : ''}
+
+        for name in ('events', 'followers', 'following', 'gists',
+                     'organizations', 'received_events', 'repos',
+                     'starred', 'subscriptions'):
+            user[name + '_url'] = api_url + '/' + name
+
+        return user
+
+
+def _pagination(path, offset, limit, total):
+    sep = '&' if '?' in path else '?'
+    page = path + sep + 'limit=%s&offset=%s'
+
+    return {'limit' : limit,
+            'offset' : offset,
+            'total' : total,
+            'current' : page % (limit, offset),
+            'next' : page % (limit, offset + limit) if offset + limit < total else None}
+
+
+def _timestamp(dt, fmt):
+    return dt.strftime(fmt)
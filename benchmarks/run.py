@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+"""Run the backends end to end against the synthetic datasets.
+
+Each backend runs in its own process, with a fresh HTTP server
+and, unless a database URL is given, a fresh SQLite database.
+For each one, it reports the number of requests and rows written
+per second, the peak memory used and the total time.
+
+Usage (from the root of the repository):
+
+    $ python -m benchmarks.run --latency 20 puppet docker github
+"""
+
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser
+
+import requests
+
+from sqlalchemy import func, select
+
+from benchmarks.datasets import PuppetForgeDataset, DockerHubDataset,\
+    GitHubDataset
+from benchmarks.server import BenchmarkServer, STATS_PATH
+from octopus.backends.docker import DockerRegistry
+from octopus.backends.github import GitHubPlatform
+from octopus.backends.puppet import PuppetForge
+from octopus.database import Database
+from octopus.httpclient import HTTPClient, set_client
+from octopus.model import ModelBase
+
+
+BACKENDS = ('puppet', 'docker', 'github', 'github-graphql')
+
+DOCKER_OWNER = 'library'
+GITHUB_OWNER = 'octopus'
+
+REPORT_COLUMNS = (('backend', 'backend', '%s'),
+                  ('requests', 'requests', '%d'),
+                  ('req/s', 'requests_per_second', '%.1f'),
+                  ('rows', 'rows', '%d'),
+                  ('rows/s', 'rows_per_second', '%.1f'),
+                  ('peak RSS (MB)', 'peak_rss', '%.1f'),
+                  ('time (s)', 'seconds', '%.2f'))
+
+
+def main():
+    args = parse_args()
+
+    results = []
+
+    for name in args.backends:
+        result = run_process(name, args)
+        results.append(result)
+
+    print_report(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+def run_process(name, args):
+    """Run a backend on a new process, so its peak memory is measured apart"""
+
+    queue = multiprocessing.Queue()
+
+    process = multiprocessing.Process(target=_run_child, args=(name, args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+
+    if 'error' in result:
+        raise RuntimeError('%s: %s' % (name, result['error']))
+
+    return result
+
+
+def _run_child(name, args, queue):
+    try:
+        queue.put(run_backend(name, args))
+    except Exception, e:
+        queue.put({'backend' : name, 'error' : repr(e)})
+
+
+def run_backend(name, args):
+    server, base_url = start_server(args)
+
+    tmpdir = None
+
+    if args.db_url:
+        db_url = args.db_url
+    else:
+        tmpdir = tempfile.mkdtemp(prefix='octopus-benchmark-')
+        db_url = 'sqlite:///' + os.path.join(tmpdir, 'octopus.db')
+
+    try:
+        db = Database(url=db_url)
+        set_client(HTTPClient(max_connections=args.http_connections))
+
+        session = db.connect()
+        backend = create_backend(name, session, base_url, args)
+
+        before = count_rows(session)
+        start = time.time()
+
+        if args.commit_every:
+            writer = db.writer(session, args.commit_every)
+            backend.fetch(writer)
+            writer.close()
+        else:
+            platform = backend.fetch()
+            db.store(session, platform)
+
+        seconds = time.time() - start
+        rows = count_rows(session) - before
+        session.close()
+
+        nrequests = requests.get(base_url + STATS_PATH.lstrip('/')).json()['requests']
+    finally:
+        server.terminate()
+
+        if tmpdir:
+            shutil.rmtree(tmpdir)
+
+    return {'backend' : name,
+            'requests' : nrequests,
+            'requests_per_second' : nrequests / seconds,
+            'rows' : rows,
+            'rows_per_second' : rows / seconds,
+            'peak_rss' : peak_rss(),
+            'seconds' : seconds}
+
+
+def start_server(args):
+    """Start the HTTP server on a new process and return its URL"""
+
+    queue = multiprocessing.Queue()
+
+    process = multiprocessing.Process(target=_serve, args=(args, queue))
+    process.daemon = True
+    process.start()
+
+    port = queue.get()
+
+    return process, 'http://127.0.0.1:%s/' % port
+
+
+def _serve(args, queue):
+    server = BenchmarkServer('127.0.0.1', args.port,
+                             puppet=PuppetForgeDataset(args.modules, args.releases),
+                             docker=DockerHubDataset(args.docker_repos),
+                             github=GitHubDataset(args.github_repos),
+                             latency=args.latency / 1000.0)
+    queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def create_backend(name, session, base_url, args):
+    if name == 'puppet':
+        return PuppetForge(session, base_url, jobs=args.jobs)
+    elif name == 'docker':
+        return DockerRegistry(session, base_url, DOCKER_OWNER, jobs=args.jobs)
+    else:
+        return GitHubPlatform(session, GITHUB_OWNER, url=base_url,
+                              oauth_token='benchmark',
+                              graphql=(name == 'github-graphql'))
+
+
+def count_rows(session):
+    nrows = 0
+
+    for table in ModelBase.metadata.sorted_tables:
+        nrows += session.execute(select([func.count()]).select_from(table)).scalar()
+    return nrows
+
+
+def peak_rss():
+    # Linux reports the maximum resident set size in KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def print_report(results):
+    rows = [[fmt % result[key] for _, key, fmt in REPORT_COLUMNS]
+            for result in results]
+    headers = [title for title, _, _ in REPORT_COLUMNS]
+
+    widths = [max([len(headers[i])] + [len(row[i]) for row in rows])
+              for i in range(len(headers))]
+
+    for row in [headers] + rows:
+        print '  '.join([value.rjust(width) for value, width in zip(row, widths)])
+
+
+def parse_args():
+    parser = ArgumentParser(description='Benchmark the backends of Octopus')
+
+    # Datasets
+    group = parser.add_argument_group('Dataset options')
+    group.add_argument('--modules', type=int, default=50000,
+                       help='Number of Puppet modules')
+    group.add_argument('--releases', type=int, default=500000,
+                       help='Number of Puppet releases')
+    group.add_argument('--docker-repos', dest='docker_repos', type=int, default=10000,
+                       help='Number of Docker repositories')
+    group.add_argument('--github-repos', dest='github_repos', type=int, default=1000,
+                       help='Number of GitHub repositories')
+    group.add_argument('--latency', type=float, default=0,
+                       help='Milliseconds each response is delayed')
+    group.add_argument('--port', type=int, default=0,
+                       help='Port of the HTTP server; any free port by default')
+
+    # Octopus options
+    group = parser.add_argument_group('Octopus options')
+    group.add_argument('--db-url', dest='db_url', default=None,
+                       help='SQLAlchemy URL of the database; a temporary SQLite database by default')
+    group.add_argument('--commit-every', dest='commit_every', type=int, default=None,
+                       help='Commit fetched data every N objects')
+    group.add_argument('--jobs', type=int, default=1,
+                       help='Number of worker threads of the backends')
+    group.add_argument('--http-connections', dest='http_connections', type=int, default=10,
+                       help='Maximum number of connections kept alive for each host')
+
+    parser.add_argument('--json', default=None,
+                        help='Write the results to this JSON file')
+    parser.add_argument('backends', nargs='*', metavar='backend',
+                        help='Backends to run (%s); all of them by default'
+                        % ', '.join(BACKENDS))
+
+    args = parser.parse_args()
+
+    for name in args.backends:
+        if name not in BACKENDS:
+            parser.error('unknown backend %s' % name)
+
+    if not args.backends:
+        args.backends = list(BACKENDS)
+
+    return args
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+"""HTTP server for the benchmarks.
+
+It serves the synthetic datasets using the APIs of the Puppet
+Forge, Docker Hub and GitHub Enterprise. Every response can be
+delayed to simulate the latency of the network.
+"""
+
+import json
+import threading
+import time
+import urlparse
+
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from benchmarks.datasets import PuppetForgeDataset, DockerHubDataset,\
+    GitHubDataset
+
+
+# Path of the statistics of the server
+STATS_PATH = '/_stats'
+
+# Number of GitHub repositories returned by default on each page
+GITHUB_PER_PAGE = 30
+
+
+class BenchmarkHandler(BaseHTTPRequestHandler):
+    """Serve the datasets of the server"""
+
+    # Keep connections alive, as the real servers do
+    protocol_version = 'HTTP/1.1'
+
+    # Send each response in one write; otherwise, headers are sent
+    # one by one and delayed ACKs stall keep-alive connections
+    wbufsize = -1
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        path = url.path
+
+        if path == STATS_PATH:
+            self.send_json(self.server.stats())
+            return
+
+        self.server.count_request()
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if path == '/v3/modules':
+            self.send_json(self.server.puppet.modules_page(int(params.get('offset', 0)),
+                                                           int(params.get('limit', 20))))
+        elif path == '/v3/releases':
+            self.send_json(self.server.puppet.releases_page(params.get('module', ''),
+                                                            int(params.get('offset', 0)),
+                                                            int(params.get('limit', 20))))
+        elif path.startswith('/u/'):
+            self.send_body('text/html', '<html></html>')
+        elif path.startswith('/v2/repositories/'):
+            owner = path.split('/')[3]
+            self.send_json(self.server.docker.repositories_page(owner,
+                                                                int(params.get('page', 1)),
+                                                                int(params.get('page_size', 10))))
+        elif path.startswith('/api/v3/orgs/'):
+            self.do_github(path.split('/')[4:], params)
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.getheader('Content-Length', 0))
+        body = self.rfile.read(length)
+
+        self.server.count_request()
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.path != '/api/graphql':
+            self.send_error(404)
+            return
+
+        variables = json.loads(body)['variables']
+        organization = self.server.github.graphql_organization(variables['owner'],
+                                                               variables.get('cursor'),
+                                                               variables.get('first', 100))
+        self.send_json({'data' : {'organization' : organization}})
+
+    def do_github(self, parts, params):
+        base_url = 'http://%s:%s/' % self.server.server_address
+        owner = parts[0]
+
+        if len(parts) == 1:
+            self.send_json(self.server.github.organization(base_url, owner))
+            return
+
+        page = int(params.get('page', 1))
+        per_page = int(params.get('per_page', GITHUB_PER_PAGE))
+
+        repos, has_next = self.server.github.repositories_page(base_url, owner,
+                                                               page, per_page)
+        headers = {}
+
+        if has_next:
+            link = '%sapi/v3/orgs/%s/repos?per_page=%s&page=%s'
+            headers['Link'] = '<%s>; rel="next"' % (link % (base_url, owner,
+                                                             per_page, page + 1))
+
+        self.send_json(repos, headers)
+
+    def send_json(self, data, headers=None):
+        self.send_body('application/json', json.dumps(data), headers)
+
+    def send_body(self, content_type, body, headers=None):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Do not write a line for every request
+        pass
+
+
+class BenchmarkServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server that serves the synthetic datasets.
+
+    `latency` is the number of seconds each response is delayed.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host, port, puppet=None, docker=None, github=None,
+                 latency=0):
+        HTTPServer.__init__(self, (host, port), BenchmarkHandler)
+
+        self.puppet = puppet or PuppetForgeDataset()
+        self.docker = docker or DockerHubDataset()
+        self.github = github or GitHubDataset()
+        self.latency = latency
+        self.nrequests = 0
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        with self._lock:
+            self.nrequests += 1
+
+    def stats(self):
+        with self._lock:
+            return {'requests' : self.nrequests}
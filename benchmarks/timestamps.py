@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+"""Compare the timestamp parser with dateutil.
+
+Usage (from the root of the repository):
+
+    $ python -m benchmarks.timestamps
+"""
+
+import timeit
+
+import dateutil.parser
+
+from octopus.timestamps import parse_timestamp
+
+
+SAMPLES = ('2014-05-14 04:41:21 -0700',
+           '2015-03-04T10:20:30Z',
+           '2015-03-04T10:20:30.123456+02:00')
+
+NUMBER = 20000
+
+
+def parse_dateutil(ts):
+    return dateutil.parser.parse(ts).replace(tzinfo=None)
+
+
+def measure(func, ts, number=NUMBER):
+    """Return the best time of a call to `func` in microseconds"""
+
+    times = timeit.repeat(lambda: func(ts), repeat=3, number=number)
+    return min(times) / number * 1000000
+
+
+def main():
+    print '%-34s %14s %14s %8s' % ('timestamp', 'dateutil (us)', 'octopus (us)', 'speedup')
+
+    for ts in SAMPLES:
+        slow = measure(parse_dateutil, ts)
+        fast = measure(parse_timestamp, ts)
+
+        print '%-34s %14.2f %14.2f %7.1fx' % (ts, slow, fast, slow / fast)
+
+
+if __name__ == '__main__':
+    main()
@@ -22,18 +22,24 @@
 
 
 class Backend(object):
-    """Abstract class for backends."""
+    """Abstract class for backends.
+
+    Backends that can fetch part of their data when other
+    parts fail add the errors to `errors` and return the rest.
+    """
 
     def __init__(self, name):
         self._name = name
+        self.errors = []
 
     @property
     def name(self):
         return self._name
 
-    def export(self):
+    def export(self, output, fmt, table=None):
         raise NotImplementedError
 
+
 class ProjectsIterator(object):
     """Abstract projects iterator"""
 
@@ -52,3 +58,14 @@ class ReleasesIterator(object):
 
     def next(self):
         raise NotImplementedError
+
+
+def wait_result(result):
+    """Wait for the result of an asynchronous call.
+
+    Waiting with a timeout keeps the main thread
+    responsive to Ctrl-C signals.
+    """
+    while not result.ready():
+        result.wait(1)
+    return result.get()
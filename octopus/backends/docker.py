@@ -20,29 +20,49 @@
 #     Santiago Dueñas <sduenas@bitergia.com>
 #
 
+import collections
 import datetime
 import urlparse
 
+from multiprocessing.pool import ThreadPool
+
 import requests
 
-from octopus.backends import Backend
-from octopus.model import Platform, Project, Repository, RepositoryLog
+from octopus.backends import Backend, wait_result
+from octopus.export import JSON_LINES, export, find_table, set_export_arguments
+from octopus.httpclient import HEADERS, get_client
+from octopus.instrumentation import timer
+from octopus.model import Platform, Project, Repository, RepositoryLog,\
+    RepositoryLogDaily, RepositoryLogWeekly
+from octopus.query import PlatformQuery
+from octopus.snapshots import add_snapshot, preload_snapshots
 
 
 DOCKER_OWNER_PATH = '/u/'
 DOCKER_REPOSITORY_PATH = '/r/'
 DOCKER_API_REPOSITORIES = '/v2/repositories/'
-HEADERS = {'User-Agent': 'Octopus/0.0.1'}
+
+# Largest number of repositories per page allowed by the API
+DOCKER_PAGE_SIZE = 100
+
+# Number of pages per worker that can be waiting
+# to be parsed when fetching concurrently
+PENDING_PAGES_PER_JOB = 2
 
 
 class DockerRegistry(Backend):
 
-    def __init__(self, session, url, owner):
+    EXPORT_TABLES = (Repository, RepositoryLog,
+                     RepositoryLogDaily, RepositoryLogWeekly)
+
+    def __init__(self, session, url, owner, client=None, jobs=1):
         super(DockerRegistry, self).__init__('docker')
 
         self.session = session
         self.base_url = url
         self.owner = owner
+        self.client = client or get_client()
+        self.jobs = jobs
 
     @classmethod
     def set_arguments_subparser(cls, parser):
@@ -54,28 +74,41 @@ class DockerRegistry(Backend):
         subparser.add_argument('owner',
                                help='Owner of the repositories on Docker Hub')
 
-    def fetch(self):
+        # Docker options
+        group = subparser.add_argument_group('Docker options')
+        group.add_argument('--jobs', dest='jobs', type=int,
+                           help='Number of pages of repositories fetched concurrently',
+                           default=1)
+
+        set_export_arguments(subparser, [t.__tablename__ for t in cls.EXPORT_TABLES])
+
+    def fetch(self, writer=None):
         platform = Platform.as_unique(self.session, url=self.base_url)
 
         if not platform.id:
             platform.type = 'docker'
 
-        platform = self._fetch(self.owner, platform)
+        platform = self._fetch(self.owner, platform, writer)
 
         return platform
 
-    def _fetch(self, owner, platform):
-        project = self._fetch_project(owner, platform)
+    def export(self, output, fmt=JSON_LINES, table=None):
+        alchemy_object = find_table(self.EXPORT_TABLES, table)
+        query = PlatformQuery(self.session, alchemy_object, self.name, self.base_url)
+        return export(query, output, fmt)
+
+    def _fetch(self, owner, platform, writer=None):
+        project = self._fetch_project(owner, platform, writer)
         platform.projects.append(project)
 
         return platform
 
-    def _fetch_project(self, owner, platform):
+    def _fetch_project(self, owner, platform, writer=None):
         url = urlparse.urljoin(self.base_url, DOCKER_OWNER_PATH)
         url = urlparse.urljoin(url, owner)
 
         try:
-            r = requests.get(url, headers=HEADERS)
+            r = self.client.get(url, headers=HEADERS)
             r.raise_for_status()
         except requests.exceptions.HTTPError, e:
             msg = "Docker - owner %s. Error: %s" % (owner, str(e))
@@ -87,52 +120,97 @@ class DockerRegistry(Backend):
         if not project.id:
             project.name = owner
 
+        # Snapshots are only written when counters change
+        preload_snapshots(self.session, platform)
+
         repositories = self._fetch_repositories(owner)
 
         for repo in repositories:
-            project.repositories.append(repo)
+            if writer:
+                # Avoid loading the collection of repositories
+                repo.project = project
+                writer.add(repo)
+            else:
+                project.repositories.append(repo)
 
         return project
 
     def _fetch_repositories(self, owner):
-        page = 1
-        fetching = True
-        repositories = []
-
-        while fetching:
-            json_data = self._fetch_repositories_json(owner, page)
-            page += 1
+        for json_data in self._fetch_repositories_pages(owner):
+            # Resolve the repositories of the page at once
+            Repository.preload(self.session,
+                               [{'url' : self._repository_url(owner, raw_repo['name'])}
+                                for raw_repo in json_data['results']])
 
             for raw_repo in json_data['results']:
-                repo = self._parse_repository_json(owner, raw_repo)
-                repositories.append(repo)
+                yield self._parse_repository_json(owner, raw_repo)
+
+    def _fetch_repositories_pages(self, owner):
+        """Fetch the pages of repositories of an owner.
+
+        The number of pages is calculated from the total number
+        of repositories given in the first page. The remaining
+        pages are fetched by a pool of worker threads and
+        returned in order.
+        """
+        json_data = self._fetch_repositories_json(owner, 1)
+        yield json_data
+
+        if not json_data['next']:
+            return
 
-                if not json_data['next']:
-                    fetching = False
+        if 'count' not in json_data:
+            # Without the total, pages can only be followed one by one
+            page = 1
 
-        return repositories
+            while json_data['next']:
+                page += 1
+                json_data = self._fetch_repositories_json(owner, page)
+                yield json_data
+            return
+
+        npages = (json_data['count'] + DOCKER_PAGE_SIZE - 1) / DOCKER_PAGE_SIZE
+
+        pool = ThreadPool(self.jobs)
+        pending = collections.deque()
+        max_pending = self.jobs * PENDING_PAGES_PER_JOB
+
+        try:
+            for page in range(2, npages + 1):
+                result = pool.apply_async(self._fetch_repositories_json,
+                                          (owner, page))
+                pending.append(result)
+
+                if len(pending) >= max_pending:
+                    yield wait_result(pending.popleft())
+
+            while pending:
+                yield wait_result(pending.popleft())
+        finally:
+            pool.terminate()
+            pool.join()
 
     def _fetch_repositories_json(self, owner, page=1):
         url = urlparse.urljoin(self.base_url, DOCKER_API_REPOSITORIES)
         url = urlparse.urljoin(url, owner)
 
-        params = {'page' : page}
+        params = {'page' : page,
+                  'page_size' : DOCKER_PAGE_SIZE}
 
         try:
-            r = requests.get(url, headers=HEADERS, params=params)
+            r = self.client.get(url, headers=HEADERS, params=params)
             r.raise_for_status()
         except requests.exceptions.HTTPError, e:
             msg = "Docker - repositories %s. Error: %s" \
                 % (owner, str(e))
             raise Exception(msg)
 
-        return r.json()
+        with timer('json.decode'):
+            return r.json()
 
     def _parse_repository_json(self, owner, raw_repo):
         name = raw_repo['name']
-
-        url = urlparse.urljoin(self.base_url, DOCKER_REPOSITORY_PATH)
-        url = urlparse.urljoin(url, owner + '/' + name)
+        url = self._repository_url(owner, name)
 
         repo = Repository().as_unique(self.session, url=url)
 
@@ -143,9 +221,15 @@ class DockerRegistry(Backend):
         repo.starred = int(raw_repo['star_count'])
         repo.pulls = int(raw_repo['pull_count'])
 
-        repo_log = RepositoryLog(date=datetime.datetime.now(),
-                                 starred=repo.starred,
-                                 pulls=repo.pulls)
-        repo.log.append(repo_log)
+        # Snapshots are written in bulk when data is stored
+        add_snapshot(self.session, repo,
+                     date=datetime.datetime.now(),
+                     starred=repo.starred,
+                     pulls=repo.pulls)
 
         return repo
+
+    def _repository_url(self, owner, name):
+        url = urlparse.urljoin(self.base_url, DOCKER_REPOSITORY_PATH)
+        url = urlparse.urljoin(url, owner + '/' + name)
+        return url
@@ -20,19 +20,67 @@
 #     Daniel Izquierdo <dizquierdo@bitergia.com>
 #
 
-from octopus.backends import Backend
+import collections
+import errno
+import json
+import os
+import subprocess
+import tempfile
+
+from multiprocessing.pool import ThreadPool
+
+from octopus.backends import Backend, wait_result
+from octopus.export import JSON_LINES, export, find_table, set_export_arguments
+from octopus.instrumentation import timer
 from octopus.model import Platform, GerritRepository
-from octopus.query import Query
+from octopus.query import PlatformQuery
+
+
+GERRIT_SSH_PORT = 29418
+
+# Directory of the sockets of the SSH master connections and
+# seconds they are kept open after the last command
+CONTROL_DIR = os.path.join(os.path.expanduser('~'), '.octopus', 'ssh')
+CONTROL_PERSIST = 600
+
+# Bytes read from the output of ssh at once
+READ_SIZE = 64 * 1024
 
-import subprocess
 
 class Gerrit(Backend):
+    """Gerrit backend.
 
-    def __init__(self, session, gerrit_user, gerrit_url):
+    Projects are listed running 'gerrit ls-projects' over SSH.
+    Several servers can be given on `gerrit_url`; up to `jobs`
+    of them are listed at the same time. Servers that cannot be
+    listed are added to `errors` and the rest are updated.
+
+    Commands sent to the same server reuse a master SSH connection,
+    kept open for `control_persist` seconds, so the handshake is
+    not repeated on each run. Setting it to 0 disables it.
+    """
+
+    EXPORT_TABLES = (GerritRepository,)
+
+    def __init__(self, session, gerrit_user, gerrit_url, jobs=1,
+                 control_dir=CONTROL_DIR, control_persist=CONTROL_PERSIST):
         super(Gerrit, self).__init__('gerrit')
         self.session = session
         self.gerrit_user = gerrit_user
-        self.url = gerrit_url
+        self.jobs = jobs
+        self.control_dir = control_dir
+        self.control_persist = control_persist
+
+        if not gerrit_url:
+            self.urls = []
+        elif isinstance(gerrit_url, basestring):
+            self.urls = [gerrit_url]
+        else:
+            self.urls = list(gerrit_url)
+
+    @property
+    def url(self):
+        return self.urls[0] if len(self.urls) == 1 else self.urls
 
     @classmethod
     def set_arguments_subparser(cls, parser):
@@ -43,32 +91,247 @@ class Gerrit(Backend):
         group.add_argument('--gerrit-user', dest='gerrit_user',
                            help='Gerrit user name. Public key has to already be in server',
                            default=None)
-        group.add_argument('--gerrit-url', dest='gerrit_url',
-                           help='Gerrit URL', default=None)
-        group.add_argument('--export', dest="export",
-                           help="When enabled, other options are ignored", default=False,
-                           action='store_true')
-
-    def fetch(self):
-        platform = Platform.as_unique(self.session, url=self.url)
-
-        if not platform.id:
-            platform.type = 'gerrit'
-
-        for repository in self._repositories(self.url, self.session, self.gerrit_user):
-            repo = GerritRepository()
-            repo.name = repository
-            platform.gerrit_repositories.append(repo)
-
-        return platform
-
-    def _repositories(self, url, platform, session):
-        proc = subprocess.Popen(["ssh", "-l", self.gerrit_user, "-p", "29418", self.url, "gerrit", "ls-projects"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        output = proc.communicate()
-        return output[0].split("\n")
-
-    def export(self):
-        query_object = Query(self.session, GerritRepository)
-        gerrit_repositories = query_object.data()
-        for repo in gerrit_repositories:
-            print str(repo[1])
+        group.add_argument('--gerrit-url', dest='gerrit_url', action='append',
+                           help='Gerrit URL. It can be given many times',
+                           default=None)
+        group.add_argument('--jobs', dest='jobs', type=int,
+                           help='Number of Gerrit servers fetched concurrently',
+                           default=1)
+        group.add_argument('--gerrit-control-dir', dest='gerrit_control_dir',
+                           help='Directory of the sockets of the SSH master connections',
+                           default=CONTROL_DIR)
+        group.add_argument('--gerrit-control-persist', dest='gerrit_control_persist',
+                           type=int,
+                           help='Seconds SSH master connections are kept open. 0 disables them',
+                           default=CONTROL_PERSIST)
+
+        set_export_arguments(subparser, [t.__tablename__ for t in cls.EXPORT_TABLES])
+
+    def fetch(self, writer=None):
+        """Fetch the projects of the servers.
+
+        Returns the platform of the first server listed; the
+        platforms of the rest are added to the session. An error
+        is raised only when no server could be listed.
+        """
+        if not self.urls:
+            raise Exception("Gerrit - URL not set")
+
+        if self.control_persist:
+            self._make_control_dir()
+
+        platforms = []
+        self.errors = []
+
+        for url, names, error in self._fetch_servers(self.urls):
+            if error:
+                # Projects stored for the server are kept
+                self.errors.append(error)
+                continue
+
+            platform = Platform.as_unique(self.session, url=url)
+
+            if not platform.id:
+                platform.type = 'gerrit'
+
+                # Repositories are linked using the id of the platform
+                self.session.flush()
+
+            self._update_repositories(platform, names)
+            platforms.append(platform)
+
+        if not platforms:
+            raise Exception('; '.join(self.errors))
+
+        return platforms[0]
+
+    def _make_control_dir(self):
+        try:
+            os.makedirs(self.control_dir, 0700)
+        except OSError, e:
+            # Other processes may create it at the same time
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _fetch_servers(self, urls):
+        """Yield the names of the projects of each server.
+
+        Servers are listed by a pool of worker threads and
+        returned in order, with the error of the ones that
+        failed. Only the main thread uses the session.
+        """
+        if self.jobs <= 1 or len(urls) == 1:
+            for url in urls:
+                yield (url,) + self._list_server(url)
+            return
+
+        pool = ThreadPool(min(self.jobs, len(urls)))
+        pending = collections.deque()
+
+        try:
+            for url in urls:
+                pending.append((url, pool.apply_async(self._list_server, (url,))))
+
+            while pending:
+                url, result = pending.popleft()
+                yield (url,) + wait_result(result)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _list_server(self, url):
+        try:
+            return self._repositories(url), None
+        except Exception, e:
+            return None, str(e)
+
+    def _update_repositories(self, platform, names):
+        """Insert new repositories and delete the missing ones.
+
+        Only the repositories of the given platform are modified.
+        Changes are written using one statement for the new
+        repositories and one for the deleted ones.
+        """
+        q = self.session.query(GerritRepository.name, GerritRepository.id)
+        q = q.filter(GerritRepository.platform_id == platform.id)
+        stored = dict(q.all())
+
+        table = GerritRepository.__table__
+
+        added = [{'name' : name, 'platform_id' : platform.id}
+                 for name in sorted(names) if name not in stored]
+        deleted = [repo_id for name, repo_id in stored.items()
+                   if name not in names]
+
+        if added:
+            self.session.execute(table.insert(), added)
+        if deleted:
+            self.session.execute(table.delete().where(table.c.id.in_(deleted)))
+
+    def _repositories(self, url):
+        """Return the set of names of the projects of a server.
+
+        The JSON output of ls-projects is decoded while it is read,
+        so it is never kept in memory as a whole.
+        """
+        # Errors are read once the command has finished
+        stderr = tempfile.TemporaryFile()
+
+        with timer('gerrit.ls_projects'):
+            proc = subprocess.Popen(self._ssh_command(url),
+                                    stdout=subprocess.PIPE, stderr=stderr)
+            try:
+                names = set([name for name, _ in iter_json_object(proc.stdout)])
+                error = None
+            except ValueError, e:
+                error = e
+            finally:
+                proc.stdout.close()
+                returncode = proc.wait()
+
+        stderr.seek(0)
+        msg = stderr.read().strip()
+        stderr.close()
+
+        if returncode != 0:
+            raise Exception("Gerrit - %s. Error: %s" % (url, msg or returncode))
+        elif error:
+            raise Exception("Gerrit - %s. Invalid list of projects: %s" % (url, str(error)))
+
+        return names
+
+    def _ssh_command(self, url):
+        cmd = ['ssh', '-p', str(GERRIT_SSH_PORT),
+               '-o', 'BatchMode=yes']
+
+        if self.gerrit_user:
+            cmd += ['-l', self.gerrit_user]
+
+        if self.control_persist:
+            # %C is a hash of the connection, short enough for a socket path
+            cmd += ['-o', 'ControlMaster=auto',
+                    '-o', 'ControlPath=' + os.path.join(self.control_dir, '%C'),
+                    '-o', 'ControlPersist=%s' % self.control_persist]
+
+        cmd += [url, 'gerrit', 'ls-projects', '--format', 'JSON']
+
+        return cmd
+
+    def export(self, output, fmt=JSON_LINES, table=None):
+        # Without a URL, repositories of every Gerrit server are exported
+        alchemy_object = find_table(self.EXPORT_TABLES, table)
+        query = PlatformQuery(self.session, alchemy_object, self.name, self.url)
+        return export(query, output, fmt)
+
+
+def iter_json_object(stream, read_size=READ_SIZE):
+    """Yield the members of a JSON object while it is read from a stream.
+
+    Each member is returned as a (name, value) pair as soon as it
+    has been read completely, so only one member at a time is kept
+    in memory. Raises ValueError when the data is not a JSON object.
+    """
+    decoder = json.JSONDecoder()
+
+    buf = ''
+    eof = False
+    state = 'start'
+    name = None
+
+    while True:
+        buf = buf.lstrip()
+
+        if state in ('name', 'value') and buf:
+            try:
+                value, end = decoder.raw_decode(buf)
+
+                # Numbers and literals may go on in the next chunk
+                complete = eof or end < len(buf)
+            except ValueError:
+                if eof:
+                    raise
+                complete = False
+
+            if complete:
+                buf = buf[end:]
+
+                if state == 'name':
+                    if not isinstance(value, basestring):
+                        raise ValueError("Expecting property name")
+                    name = value
+                    state = 'colon'
+                else:
+                    yield name, value
+                    state = 'next'
+                continue
+        elif buf:
+            c = buf[0]
+
+            if state == 'start' and c == '{':
+                state = 'first'
+            elif state == 'first' and c == '}':
+                return
+            elif state == 'first':
+                state = 'name'
+                continue
+            elif state == 'colon' and c == ':':
+                state = 'value'
+            elif state == 'next' and c == ',':
+                state = 'name'
+            elif state == 'next' and c == '}':
+                return
+            else:
+                raise ValueError("Unexpected character %r" % c)
+
+            buf = buf[1:]
+            continue
+
+        if eof:
+            raise ValueError("Unexpected end of data")
+
+        chunk = stream.read(read_size)
+
+        if chunk:
+            buf += chunk
+        else:
+            eof = True
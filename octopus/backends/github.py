@@ -20,24 +20,73 @@
 #     Santiago Dueñas <sduenas@bitergia.com>
 #
 
+import datetime
+import json
+import urlparse
+
 import github3
+import requests
 
 from octopus.backends import Backend
-from octopus.model import Platform, Project, Repository
+from octopus.export import JSON_LINES, export, find_table, set_export_arguments
+from octopus.httpclient import get_client
+from octopus.instrumentation import timer
+from octopus.model import Platform, Project, Repository, RepositoryLog,\
+    RepositoryLogDaily, RepositoryLogWeekly
+from octopus.query import PlatformQuery
+from octopus.snapshots import add_snapshot, preload_snapshots
 
 
 GITHUB_URL = 'https://github.com/'
+GITHUB_GRAPHQL_URL = 'https://api.github.com/graphql'
+GITHUB_ENTERPRISE_GRAPHQL_PATH = 'api/graphql'
+
+# Maximum number of repositories returned by a GraphQL query
+GRAPHQL_PAGE_SIZE = 100
+
+GRAPHQL_REPOSITORY_FIELDS = """
+    name
+    url
+    stargazers { totalCount }
+    forkCount
+"""
+
+GRAPHQL_ORGANIZATION_QUERY = """
+query ($owner: String!, $first: Int!, $cursor: String) {
+  organization(login: $owner) {
+    url
+    repositories(first: $first, after: $cursor) {
+      pageInfo { hasNextPage endCursor }
+      nodes { %s }
+    }
+  }
+}
+""" % GRAPHQL_REPOSITORY_FIELDS
+
+GRAPHQL_REPOSITORY_QUERY = """
+query ($owner: String!, $name: String!) {
+  organization(login: $owner) {
+    url
+  }
+  repository(owner: $owner, name: $name) { %s }
+}
+""" % GRAPHQL_REPOSITORY_FIELDS
 
 
 class GitHubPlatform(Backend):
 
+    EXPORT_TABLES = (Repository, Project, RepositoryLog,
+                     RepositoryLogDaily, RepositoryLogWeekly)
+
     def __init__(self, session, owner, repository=None, url=None,
-                 user=None, password=None, oauth_token=None):
+                 user=None, password=None, oauth_token=None, client=None,
+                 graphql=False):
         super(GitHubPlatform, self).__init__('github')
 
         self.session = session
         self.owner = owner
         self.repository = repository
+        self.graphql = graphql
 
         if oauth_token:
             kwargs = {'token' : oauth_token}
@@ -52,6 +101,17 @@ class GitHubPlatform(Backend):
             self.gh = github3.login(**kwargs)
             self.url = GITHUB_URL
 
+        # Share the pool of connections with the rest of backends
+        self.client = client or get_client()
+        self.client.mount(self.gh.session)
+
+        if graphql:
+            self.fetcher = GitHubGraphQLFetcher(url, self.client, user=user,
+                                                password=password,
+                                                oauth_token=oauth_token)
+        else:
+            self.fetcher = None
+
     @classmethod
     def set_arguments_subparser(cls, parser):
         subparser = parser.add_parser('github', help='GitHub backend')
@@ -70,6 +130,9 @@ class GitHubPlatform(Backend):
         group.add_argument('--gh-url', dest='gh_url',
                            help='URL of the GitHub Enterprise instance',
                            default=None)
+        group.add_argument('--gh-graphql', dest='gh_graphql',
+                           help='Fetch repositories in bulk using the GraphQL API',
+                           default=False, action='store_true')
 
         # Positional arguments
         subparser.add_argument('owner',
@@ -77,18 +140,29 @@ class GitHubPlatform(Backend):
         subparser.add_argument('repository', nargs='?', default=None,
                                help='Name of the repository on GitHub')
 
+        set_export_arguments(subparser, [t.__tablename__ for t in cls.EXPORT_TABLES])
 
-    def fetch(self):
+    def fetch(self, writer=None):
         platform = Platform.as_unique(self.session, url=self.url)
 
         if not platform.id:
             platform.type = 'github'
 
+        # Snapshots are only written when counters change
+        preload_snapshots(self.session, platform)
+
         try:
-            project = self._fetch_project(self.owner, self.repository, platform)
+            if self.graphql:
+                project = self._fetch_project_graphql(self.owner, self.repository,
+                                                      platform, writer)
+            else:
+                project = self._fetch_project(self.owner, self.repository,
+                                              platform, writer)
         except github3.exceptions.ForbiddenError, e:
-            msg = "GitHub - " + e.message + "To resume, wait some minutes"
-            raise Exception(msg)
+            # Rate limits are handled by the HTTP client, so
+            # this is raised when the request is not allowed
+            # or the limit was hit too many times in a row
+            raise Exception("GitHub - " + e.message)
         except github3.exceptions.AuthenticationFailed, e:
             raise Exception("GitHub - " + e.message)
 
@@ -96,10 +170,15 @@ class GitHubPlatform(Backend):
 
         return platform
 
-    def _fetch_project(self, owner, repository, platform):
+    def export(self, output, fmt=JSON_LINES, table=None):
+        alchemy_object = find_table(self.EXPORT_TABLES, table)
+        query = PlatformQuery(self.session, alchemy_object, self.name, self.url)
+        return export(query, output, fmt)
+
+    def _fetch_project(self, owner, repository, platform, writer=None):
         o = self.gh.organization(owner)
 
-        if isinstance(o, github3.null.NullObject):
+        if _is_null(o):
             raise Exception("GitHub - organization %s does not exist."
                             % owner)
 
@@ -111,29 +190,201 @@ class GitHubPlatform(Backend):
         if repository:
             r = self.gh.repository(owner, repository)
 
-            if isinstance(r, github3.null.NullObject):
+            if _is_null(r):
                 raise Exception("GitHub - repository %s:%s does not exist."
                                 % (owner, repository))
             repositories = [r]
         else:
             repositories = [r for r in o.repositories()]
 
+        # Resolve the stored repositories at once
+        Repository.preload(self.session,
+                           [{'url' : r.html_url} for r in repositories])
+
         for r in repositories:
             repo = self._fetch_repository(r)
-            project.repositories.append(repo)
+
+            if writer:
+                # Avoid loading the collection of repositories
+                repo.project = project
+                writer.add(repo)
+            else:
+                project.repositories.append(repo)
+
+        return project
+
+    def _fetch_project_graphql(self, owner, repository, platform, writer=None):
+        """Fetch the repositories of an owner using GraphQL.
+
+        Repositories and all the fields needed are fetched in pages
+        of 100, so each query costs the same as a single REST request.
+        """
+        if repository:
+            url, pages = self.fetcher.repository(owner, repository)
+        else:
+            url, pages = self.fetcher.repositories(owner)
+
+        project = Project().as_unique(self.session, url=url,
+                                      platform=platform)
+        if not project.id:
+            project.name = owner
+
+        for nodes in pages:
+            # Resolve the stored repositories of the page at once
+            Repository.preload(self.session,
+                               [{'url' : node['url']} for node in nodes])
+
+            for node in nodes:
+                repo = self._fetch_repository_node(node)
+
+                if writer:
+                    # Avoid loading the collection of repositories
+                    repo.project = project
+                    writer.add(repo)
+                else:
+                    project.repositories.append(repo)
 
         return project
 
+    def _fetch_repository_node(self, node):
+        repo = Repository().as_unique(self.session, url=node['url'])
+
+        if not repo.id:
+            repo.name = node['name']
+            repo.clone_url = node['url'] + '.git'
+            repo.type = 'git'
+
+        repo.starred = node['stargazers']['totalCount']
+        repo.forks = node['forkCount']
+
+        # The REST API sets watchers_count to the number of
+        # stargazers; 'watchers' of GraphQL are the subscribers
+        repo.watchers = repo.starred
+
+        self._add_snapshot(repo)
+
+        return repo
+
     def _fetch_repository(self, r):
         repo = Repository().as_unique(self.session, url=r.html_url)
 
+        # Repositories of listings do not have every attribute
+        # on newer versions of github3, but the data was sent
+        data = r.as_dict()
+
         if not repo.id:
             repo.name = r.name
-            repo.clone_url = r.clone_url
+            repo.clone_url = data.get('clone_url')
             repo.type = 'git'
 
-        repo.starred = r.stargazers_count
-        repo.forks = r.fork_count
-        repo.watchers = r.watchers
+        repo.starred = data.get('stargazers_count')
+        repo.forks = data.get('forks_count')
+        repo.watchers = data.get('watchers_count')
+
+        self._add_snapshot(repo)
 
         return repo
+
+    def _add_snapshot(self, repo):
+        # Snapshots are written in bulk when data is stored
+        add_snapshot(self.session, repo,
+                     date=datetime.datetime.now(),
+                     starred=repo.starred,
+                     forks=repo.forks,
+                     watchers=repo.watchers)
+
+
+class GitHubGraphQLFetcher(object):
+    """Run queries on the GraphQL API of GitHub.
+
+    When `url` is given, queries are sent to that GitHub
+    Enterprise instance. GraphQL requests must be authenticated
+    with an OAuth token or with a user and password.
+    """
+
+    def __init__(self, url=None, client=None, user=None, password=None,
+                 oauth_token=None):
+        if url:
+            self.url = urlparse.urljoin(url, GITHUB_ENTERPRISE_GRAPHQL_PATH)
+        else:
+            self.url = GITHUB_GRAPHQL_URL
+
+        self.client = client or get_client()
+        self.headers = {'Content-Type' : 'application/json'}
+        self.auth = None
+
+        if oauth_token:
+            self.headers['Authorization'] = 'bearer ' + oauth_token
+        elif user:
+            self.auth = (user, password)
+
+    def repositories(self, owner):
+        """Return the url of an organization and a generator of
+        the pages of its repositories"""
+
+        data = self._organization_page(owner, None)
+
+        return data['url'], self._repositories_pages(owner, data)
+
+    def repository(self, owner, name):
+        """Return the url of an organization and the page
+        with one of its repositories"""
+
+        data = self.query(GRAPHQL_REPOSITORY_QUERY,
+                          {'owner' : owner, 'name' : name})
+
+        if not data['organization']:
+            raise Exception("GitHub - organization %s does not exist."
+                            % owner)
+        if not data['repository']:
+            raise Exception("GitHub - repository %s:%s does not exist."
+                            % (owner, name))
+
+        return data['organization']['url'], [[data['repository']]]
+
+    def query(self, query, variables):
+        try:
+            data = json.dumps({'query' : query, 'variables' : variables})
+            r = self.client.post(self.url, data=data,
+                                 headers=self.headers, auth=self.auth)
+            r.raise_for_status()
+        except requests.exceptions.HTTPError, e:
+            raise Exception("GitHub - GraphQL query failed. Error: %s" % str(e))
+
+        with timer('json.decode'):
+            result = r.json()
+
+        if result.get('errors'):
+            messages = [error.get('message', '') for error in result['errors']]
+            raise Exception("GitHub - " + '; '.join(messages))
+
+        return result['data']
+
+    def _repositories_pages(self, owner, data):
+        while True:
+            repositories = data['repositories']
+            yield repositories['nodes']
+
+            if not repositories['pageInfo']['hasNextPage']:
+                break
+
+            data = self._organization_page(owner,
+                                           repositories['pageInfo']['endCursor'])
+
+    def _organization_page(self, owner, cursor):
+        data = self.query(GRAPHQL_ORGANIZATION_QUERY,
+                          {'owner' : owner,
+                           'first' : GRAPHQL_PAGE_SIZE,
+                           'cursor' : cursor})
+
+        if not data['organization']:
+            raise Exception("GitHub - organization %s does not exist."
+                            % owner)
+
+        return data['organization']
+
+
+def _is_null(obj):
+    # Missing objects are returned as NullObject instances
+    # by old versions of github3 and as None by newer ones
+    return obj is None or type(obj).__name__ == 'NullObject'
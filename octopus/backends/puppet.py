@@ -20,27 +20,57 @@
 #     Santiago Dueñas <sduenas@bitergia.com>
 #
 
+import argparse
+import collections
+import datetime
 import urlparse
-import dateutil.parser
 
-import requests
+from multiprocessing.pool import ThreadPool
 
-from octopus.backends import Backend, ProjectsIterator, ReleasesIterator
-from octopus.model import Platform, Project, User, Release
+from octopus.backends import Backend, ProjectsIterator, ReleasesIterator,\
+    wait_result
+from octopus.export import JSON_LINES, export, find_table, set_export_arguments
+from octopus.httpclient import HEADERS, get_client
+from octopus.instrumentation import timer
+from octopus.model import Checkpoint, Platform, Project, User, Release, Watermark
+from octopus.query import PlatformQuery
+from octopus.timestamps import parse_timestamp, to_utc, unmarshal_timestamp
 
 
 PROJECTS_LIMIT = 20
 RELEASES_LIMIT = 20
+MAX_PAGE_SIZE = 100
 PUPPET_MODULES_PATH = '/v3/modules'
 PUPPET_RELEASES_PATH = '/v3/releases'
+PUPPET_RELEASES_SORT_BY = 'release_date'
+
+# Number of projects per worker that can be waiting
+# for their releases when fetching concurrently
+PENDING_PROJECTS_PER_JOB = 2
+
+# Threads that download the next pages of modules
+# and releases while the current ones are processed
+PREFETCH_JOBS = 2
 
 
 class PuppetForge(Backend):
 
-    def __init__(self, session, url):
+    EXPORT_TABLES = (Project, Release)
+
+    def __init__(self, session, url, jobs=1, incremental=False,
+                 page_size=PROJECTS_LIMIT, resume=False):
         super(PuppetForge, self).__init__('puppet')
+
+        if page_size < 1 or page_size > MAX_PAGE_SIZE:
+            raise ValueError('Page size must be between 1 and %s' % MAX_PAGE_SIZE)
+
         self.url = url
         self.session = session
+        self.jobs = jobs
+        self.incremental = incremental
+        self.page_size = page_size
+        self.resume = resume
+        self._prefetch_pool = None
 
     @classmethod
     def set_arguments_subparser(cls, parser):
@@ -50,33 +80,190 @@ class PuppetForge(Backend):
         subparser.add_argument('url',
                                help='Puppet forge url')
 
-    def fetch(self):
+        # Puppet options
+        group = subparser.add_argument_group('Puppet options')
+        group.add_argument('--jobs', dest='jobs', type=int,
+                           help='Number of projects whose releases are fetched concurrently',
+                           default=1)
+        group.add_argument('--incremental', dest='incremental',
+                           help='Fetch only the modules and releases updated since the last run',
+                           default=False, action='store_true')
+        group.add_argument('--page-size', dest='page_size', type=page_size,
+                           help='Number of modules and releases requested on each page (max. %s)'
+                           % MAX_PAGE_SIZE,
+                           default=PROJECTS_LIMIT)
+        group.add_argument('--resume', dest='resume',
+                           help='Continue from the last checkpoint of an interrupted run',
+                           default=False, action='store_true')
+
+        set_export_arguments(subparser, [t.__tablename__ for t in cls.EXPORT_TABLES])
+
+    def fetch(self, writer=None):
+        """Fetch the modules and releases of the Forge.
+
+        When a writer is given, a checkpoint with the position of the
+        last module given to the writer is saved on each of its commits.
+        With `resume`, the listing of modules continues from there.
+        """
         platform = Platform.as_unique(self.session, url=self.url)
 
         if not platform.id:
             platform.type = 'puppet'
 
-        for project in self._projects(self.url, platform, self.session):
-            for release in self._releases(self.url, project, project.users[0], self.session):
-                project.releases.append(release)
+        watermark = Watermark.as_unique(self.session, platform=platform)
+        since = watermark.updated_on if self.incremental else None
+        latest = watermark.updated_on
+
+        offset, after = 0, None
+        checkpoint = None
+
+        if writer:
+            checkpoint = Checkpoint.as_unique(self.session, platform=platform)
+
+            if self.resume and checkpoint.offset is not None:
+                offset, after = checkpoint.offset, checkpoint.last_url
+                latest = _latest(latest, checkpoint.latest)
 
-            platform.projects.append(project)
+        self._prefetch_pool = ThreadPool(PREFETCH_JOBS)
+
+        try:
+            if self.jobs > 1:
+                projects = self._fetch_projects_concurrently(platform, since,
+                                                             offset, after)
+            else:
+                projects = self._fetch_projects(platform, since, offset, after)
+
+            for project, page_offset in projects:
+                latest = _latest(latest, to_utc(project.updated_on,
+                                                project.updated_on_tz))
+
+                if writer:
+                    # Saved on the same commit as the project
+                    checkpoint.offset = page_offset
+                    checkpoint.last_url = project.url
+                    checkpoint.latest = latest
+                    checkpoint.updated_on = datetime.datetime.now()
+
+                    writer.add(project, *project.releases)
+                else:
+                    platform.projects.append(project)
+        finally:
+            self._prefetch_pool.terminate()
+            self._prefetch_pool.join()
+            self._prefetch_pool = None
+
+        # Next incremental runs will start from here
+        watermark.updated_on = latest
+
+        if writer:
+            # The run finished, so there is nothing to resume
+            checkpoint.offset = None
+            checkpoint.last_url = None
+            checkpoint.latest = None
+            writer.add(watermark)
 
         return platform
 
-    def _projects(self, url, platform, session):
-        return PuppetForgeProjectsIterator(url, platform, session)
+    def export(self, output, fmt=JSON_LINES, table=None):
+        alchemy_object = find_table(self.EXPORT_TABLES, table)
+        query = PlatformQuery(self.session, alchemy_object, self.name, self.url)
+        return export(query, output, fmt)
+
+    def _fetch_projects(self, platform, since=None, offset=0, after=None):
+        """Fetch the projects and their releases.
+
+        Each project is returned with the offset of the page
+        where it was listed.
+        """
+        projects = self._projects(self.url, platform, self.session, since,
+                                  offset, after)
+
+        for project in projects:
+            page_offset = projects.page_offset
+
+            for release in self._releases(self.url, project, project.users[0], self.session):
+                project.releases.append(release)
+
+            yield project, page_offset
+
+    def _fetch_projects_concurrently(self, platform, since=None, offset=0,
+                                     after=None):
+        """Fetch the releases of several projects at the same time.
+
+        Pages of releases are downloaded by a pool of worker threads.
+        Projects and releases objects are only built on the calling
+        thread, which is the only one that uses the database session.
+        Projects are returned in the same order they were listed,
+        with the offset of the page where they were listed.
+        """
+        pool = ThreadPool(self.jobs)
+        pending = collections.deque()
+        max_pending = self.jobs * PENDING_PROJECTS_PER_JOB
+
+        projects = self._projects(self.url, platform, self.session, since,
+                                  offset, after)
+
+        try:
+            for project in projects:
+                user = project.users[0]
+                stored = self._stored_releases(project)
+                result = pool.apply_async(fetch_releases_pages,
+                                          (self.url, project.name, user.username,
+                                           stored, self.page_size))
+                pending.append((project, projects.page_offset, user, result))
+
+                if len(pending) >= max_pending:
+                    yield self._add_fetched_releases(*pending.popleft())
+
+            while pending:
+                yield self._add_fetched_releases(*pending.popleft())
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _add_fetched_releases(self, project, page_offset, user, result):
+        pages = wait_result(result)
+
+        releases = PuppetForgeReleasesIterator(self.url, project, user,
+                                               self.session, pages=pages,
+                                               incremental=self.incremental)
+        for release in releases:
+            project.releases.append(release)
+
+        return project, page_offset
+
+    def _stored_releases(self, project):
+        # Workers cannot use the session, so they get the
+        # update time of the stored releases of the project
+        if not self.incremental or not project.id:
+            return None
+
+        q = self.session.query(Release.url, Release.updated_on)
+        q = q.filter(Release.project_id == project.id)
+
+        return dict(q.all())
+
+    def _projects(self, url, platform, session, since=None, offset=0,
+                  after=None):
+        return PuppetForgeProjectsIterator(url, platform, session, since,
+                                           page_size=self.page_size,
+                                           pool=self._prefetch_pool,
+                                           offset=offset, after=after)
 
     def _releases(self, url, project, user, session):
-        return PuppetForgeReleasesIterator(url, project, user, session)
+        return PuppetForgeReleasesIterator(url, project, user, session,
+                                           incremental=self.incremental,
+                                           page_size=self.page_size,
+                                           pool=self._prefetch_pool)
 
 
 class PuppetForgeFetcher(object):
 
-    HEADERS = {'User-Agent': 'Octopus/0.0.1'}
+    HEADERS = HEADERS
 
-    def __init__(self, base_url):
+    def __init__(self, base_url, client=None):
         self.base_url = base_url
+        self.client = client or get_client()
         self._last_url = None
 
     @property
@@ -88,124 +275,220 @@ class PuppetForgeFetcher(object):
                   'limit' : limit}
         url = urlparse.urljoin(self.base_url, PUPPET_MODULES_PATH)
 
-        r = requests.get(url, params=params,
-                         headers=PuppetForgeFetcher.HEADERS)
+        r = self.client.get(url, params=params,
+                            headers=PuppetForgeFetcher.HEADERS)
 
         self._last_url = r.url
-        return r.json()
 
-    def releases(self, project, username, offset, limit=RELEASES_LIMIT):
+        with timer('json.decode'):
+            return r.json()
+
+    def releases(self, project, username, offset, limit=RELEASES_LIMIT,
+                 sort_by=None):
         module = username + '-' + project
         params = {'offset' : offset,
                   'limit' : limit,
                   'module' : module}
 
+        if sort_by:
+            params['sort_by'] = sort_by
+
         url = urlparse.urljoin(self.base_url, PUPPET_RELEASES_PATH)
 
-        r = requests.get(url, params=params,
-                         headers=PuppetForgeFetcher.HEADERS)
+        r = self.client.get(url, params=params,
+                            headers=PuppetForgeFetcher.HEADERS)
 
         self._last_url = r.url
-        return r.json()
+
+        with timer('json.decode'):
+            return r.json()
 
 
 class PuppetForgeProjectsIterator(ProjectsIterator):
+    """Iterate over the modules of a Puppet Forge.
+
+    When a thread `pool` is given, the next page is downloaded
+    in the background while the current one is processed.
+
+    The listing starts at `offset`. When `after` is given, the modules
+    of the first page up to the one with that url are skipped.
+    """
 
-    def __init__(self, base_url, platform, session):
+    def __init__(self, base_url, platform, session, since=None,
+                 page_size=PROJECTS_LIMIT, pool=None, offset=0, after=None):
         super(PuppetForgeProjectsIterator, self).__init__()
         self.fetcher = PuppetForgeFetcher(base_url)
         self.base_url = base_url
         self.session = session
         self.platform = platform
-        self.projects = []
-        self.users = {}
+        self.since = since
+        self.page_size = page_size
+        self.pool = pool
+        self.projects = collections.deque()
         self.has_next = True
-        self.offset = 0
+        self.offset = offset
+        self.page_offset = offset
+        self.after = after
+        self._next_page = None
 
     def __iter__(self):
         return self
 
     def next(self):
-        # Check if there are parsed projects in the queue
-        if self.projects:
-            return self.projects.pop(0)
-
-        # Check if there are more projects to fetch
-        if not self.has_next:
-            raise StopIteration
-
-        # Fetch new set of projects
-        json = self.fetcher.projects(self.offset, PROJECTS_LIMIT)
-
-        if not json['pagination']['next']:
-            self.has_next = False
-        else:
-            self.offset += PROJECTS_LIMIT
-
-        for r in json['results']:
+        # Pages without projects to return are skipped in a loop;
+        # incremental runs may skip thousands of them in a row
+        while not self.projects:
+            # Check if there are more projects to fetch
+            if not self.has_next:
+                raise StopIteration
+
+            # Fetch and parse new set of projects
+            self._parse_page(self._fetch_page())
+
+        return self.projects.popleft()
+
+    def _parse_page(self, json):
+        # Parse the update time of each module only once
+        results = [(r, parse_timestamp(r['updated_at']))
+                   for r in json['results']]
+
+        if self.after:
+            results = self._listed_after(results)
+
+        if self.since:
+            results = self._updated_since(results)
+
+        # Resolve the projects and users of the page at once
+        Project.preload(self.session,
+                        [{'url' : self.base_url + r['uri'],
+                          'platform' : self.platform}
+                         for r, _ in results])
+        User.preload(self.session,
+                     [{'username' : r['owner']['username']}
+                      for r, _ in results])
+
+        for r, (updated_on, updated_on_tz) in results:
             url = self.base_url + r['uri']
 
             project = Project().as_unique(self.session, url=url,
                                           platform=self.platform)
-            project.updated_on = unmarshal_timestamp(r['updated_at'])
+            project.updated_on = updated_on
+            project.updated_on_tz = updated_on_tz
 
             if not project.id:
                 project.name = r['name']
-                project.created_on = unmarshal_timestamp(r['created_at'])
+                project.created_on, project.created_on_tz = parse_timestamp(r['created_at'])
 
             # Assign owner of the project
-            username = r['owner']['username']
-
-            if not username in self.users:
-                user = User().as_unique(self.session, username=username)
-                self.users[username] = user
-            else:
-                user = self.users[username]
-
+            user = User().as_unique(self.session,
+                                    username=r['owner']['username'])
             project.users.append(user)
 
             self.projects.append(project)
 
-        return self.projects.pop(0)
+    def _fetch_page(self):
+        self.page_offset = self.offset
+
+        if self._next_page:
+            json = wait_result(self._next_page)
+            self._next_page = None
+        else:
+            json = self.fetcher.projects(self.offset, self.page_size)
+
+        if not json['pagination']['next']:
+            self.has_next = False
+            return json
+
+        self.offset += self.page_size
+
+        if self.pool:
+            self._next_page = self.pool.apply_async(self.fetcher.projects,
+                                                    (self.offset, self.page_size))
+        return json
+
+    def _listed_after(self, results):
+        urls = [self.base_url + r['uri'] for r, _ in results]
+        after = self.after
+        self.after = None
+
+        if after not in urls:
+            # The listing changed; process the whole page again
+            return results
+
+        return results[urls.index(after) + 1:]
+
+    def _updated_since(self, results):
+        # The Forge cannot sort modules by their last update, so
+        # every page is listed and the updated modules are kept.
+        # The watermark is in UTC, like the times compared with it.
+        return [(r, parsed) for r, parsed in results
+                if to_utc(*parsed) >= self.since]
 
 
 class PuppetForgeReleasesIterator(ReleasesIterator):
+    """Iterate over the releases of a Puppet module.
+
+    Pages can be given when they were already downloaded. Otherwise,
+    when a thread `pool` is given, the next page is downloaded in the
+    background while the current one is processed.
+    """
 
-    def __init__(self, base_url, project, user, session):
+    def __init__(self, base_url, project, user, session, pages=None,
+                 incremental=False, page_size=RELEASES_LIMIT, pool=None):
         super(PuppetForgeReleasesIterator, self).__init__()
         self.fetcher = PuppetForgeFetcher(base_url)
         self.base_url = base_url
         self.project = project
         self.user = user
         self.session = session
-        self.releases = []
+        self.incremental = incremental
+        self.page_size = page_size
+        self.pool = pool
+        self.releases = collections.deque()
         self.has_next = True
         self.offset = 0
+        self._next_page = None
+
+        # Pages already fetched, i.e by a worker thread
+        if pages is not None:
+            self.pages = collections.deque(pages)
+        else:
+            self.pages = None
 
     def __iter__(self):
         return self
 
     def next(self):
-        # Check if there are parsed releases in the queue
-        if self.releases:
-            return self.releases.pop(0)
+        # Pages without releases to return are skipped in a loop
+        while not self.releases:
+            # Check if there are more releases to fetch
+            if not self.has_next:
+                raise StopIteration
+
+            # Fetch new set of releases
+            if self.pages is not None:
+                if not self.pages:
+                    raise StopIteration
+                json = self.pages.popleft()
+            else:
+                json = self._fetch_page()
 
-        # Check if there are more releases to fetch
-        if not self.has_next:
-            raise StopIteration
+            if 'errors' in json:
+                print "Warning: " + json['errors'][0]
+                raise StopIteration
 
-        # Fetch new set of releases
-        json = self.fetcher.releases(self.project.name, self.user.username,
-                                     self.offset, RELEASES_LIMIT)
+            if not json['pagination']['next']:
+                self.has_next = False
 
-        if 'errors' in json:
-            print "Warning: " + json['errors'][0]
-            raise StopIteration
+            self._parse_page(json)
 
-        if not json['pagination']['next']:
-            self.has_next = False
-        else:
-            self.offset += RELEASES_LIMIT
+        return self.releases.popleft()
+
+    def _parse_page(self, json):
+        # Resolve the releases of the page at once
+        Release.preload(self.session,
+                        [{'url' : self.base_url + r['uri']}
+                         for r in json['results']])
 
         for r in json['results']:
             version = r['metadata']['version']
@@ -218,24 +501,105 @@ class PuppetForgeReleasesIterator(ReleasesIterator):
                 name = r['metadata']['name']
 
             url = self.base_url + r['uri']
+            updated_on, updated_on_tz = parse_timestamp(r['updated_at'])
 
             release = Release().as_unique(self.session,
                                           url=url)
 
+            if self.incremental and release.id and release.updated_on == updated_on:
+                # Releases are sorted by date, so the
+                # next ones are already stored too
+                self.has_next = False
+                break
+
             if not release.id:
                 release.name = name
                 release.version = version
                 release.user = self.user
                 release.file_url = self.base_url + r['file_uri']
-                release.created_on = unmarshal_timestamp(r['created_at'])
+                release.created_on, release.created_on_tz = parse_timestamp(r['created_at'])
 
-            release.updated_on = unmarshal_timestamp(r['updated_at'])
+            release.updated_on = updated_on
+            release.updated_on_tz = updated_on_tz
 
             self.releases.append(release)
 
-        return self.releases.pop(0)
+    def _fetch_page(self):
+        if self.incremental:
+            sort_by = PUPPET_RELEASES_SORT_BY
+        else:
+            sort_by = None
+
+        if self._next_page:
+            json = wait_result(self._next_page)
+            self._next_page = None
+        else:
+            json = self.fetcher.releases(self.project.name, self.user.username,
+                                         self.offset, self.page_size, sort_by)
+
+        if 'errors' in json or not json['pagination']['next']:
+            return json
+
+        self.offset += self.page_size
+
+        if self.pool:
+            self._next_page = self.pool.apply_async(self.fetcher.releases,
+                                                    (self.project.name,
+                                                     self.user.username,
+                                                     self.offset, self.page_size,
+                                                     sort_by))
+        return json
+
+
+def page_size(value):
+    """Parse the page size given on the command line"""
+
+    size = int(value)
+
+    if size < 1 or size > MAX_PAGE_SIZE:
+        raise argparse.ArgumentTypeError('must be between 1 and %s' % MAX_PAGE_SIZE)
+    return size
+
+
+def fetch_releases_pages(base_url, project, username, stored=None,
+                         page_size=RELEASES_LIMIT):
+    """Fetch every page of releases of a module.
+
+    When `stored` is given, a dict with the update time of the
+    stored releases indexed by url, pages are fetched until one
+    of these releases is found without changes.
+
+    The database session is not used here, so this function
+    can be safely called from worker threads.
+    """
+    fetcher = PuppetForgeFetcher(base_url)
+    sort_by = PUPPET_RELEASES_SORT_BY if stored is not None else None
+    pages = []
+    offset = 0
+
+    while True:
+        json = fetcher.releases(project, username, offset,
+                                page_size, sort_by)
+        pages.append(json)
+
+        if 'errors' in json or not json['pagination']['next']:
+            break
+        if stored and _has_stored_release(base_url, json, stored):
+            break
+        offset += page_size
+
+    return pages
+
+
+def _has_stored_release(base_url, json, stored):
+    for r in json['results']:
+        url = base_url + r['uri']
+
+        if stored.get(url) == unmarshal_timestamp(r['updated_at']):
+            return True
+    return False
 
 
-def unmarshal_timestamp(ts):
-    # FIXME: store time zone data
-    return dateutil.parser.parse(ts).replace(tzinfo=None)
+def _latest(*dates):
+    dates = [d for d in dates if d]
+    return max(dates) if dates else None
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import collections
+import json
+import multiprocessing
+import sys
+import threading
+import time
+
+from multiprocessing.pool import ThreadPool
+
+from sqlalchemy.exc import IntegrityError
+
+from octopus.instrumentation import get_profiler
+
+
+# Seconds between checks of the running processes
+POLL_INTERVAL = 0.1
+
+
+class Target(object):
+    """Backend and options of one of the targets of a batch"""
+
+    def __init__(self, backend, **options):
+        self.backend = backend
+        self.options = options
+
+    @property
+    def platform(self):
+        url = self.options.get('url') or self.options.get('gh_url') \
+            or self.options.get('gerrit_url')
+
+        # Gerrit targets may list several servers
+        if isinstance(url, list):
+            url = tuple(url)
+        return (self.backend, url)
+
+    @property
+    def name(self):
+        values = [self.options.get(opt) for opt in ('url', 'gh_url', 'gerrit_url',
+                                                    'owner', 'repository')]
+        values = [' '.join(v) if isinstance(v, list) else v for v in values]
+        return ' '.join([self.backend] + [v for v in values if v])
+
+
+class Result(object):
+    """Outcome of running a target"""
+
+    def __init__(self, target, error=None, seconds=0, exitcode=None):
+        self.target = target
+        self.error = error
+        self.seconds = seconds
+        self.exitcode = exitcode
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class ProcessError(Exception):
+    """Error of a target run on its own process"""
+
+    def __init__(self, message, exitcode, conflict=False):
+        super(ProcessError, self).__init__(message)
+        self.exitcode = exitcode
+        self.conflict = conflict
+
+
+class Batch(object):
+    """Run many targets in the same process.
+
+    Targets share the database engine and the HTTP client of the
+    process. Up to `jobs` targets run at the same time, each one
+    on its own thread and with its own database session.
+
+    `run_target` is the function that fetches and stores the
+    data of a target; it is called with the target as argument.
+
+    The first target of each platform runs before the rest, so
+    shared rows like the platform itself are already stored when
+    targets run concurrently. Targets that fail anyway because
+    another one inserted the same rows at the same time are run
+    again once the rest have finished.
+    """
+
+    def __init__(self, targets, run_target, jobs=1):
+        self.targets = targets
+        self.run_target = run_target
+        self.jobs = jobs
+        self._lock = threading.Lock()
+
+    def run(self):
+        first = []
+        rest = []
+        platforms = set()
+
+        for target in self.targets:
+            if target.platform in platforms:
+                rest.append(target)
+            else:
+                platforms.add(target.platform)
+                first.append(target)
+
+        results = self._run_first(first)
+        results += self._run_concurrently(rest)
+
+        for i, result in enumerate(results):
+            if _is_conflict(result.error):
+                results[i] = self._run(result.target)
+
+        return results
+
+    def _run_first(self, targets):
+        return [self._run(target) for target in targets]
+
+    def _run_concurrently(self, targets):
+        if not targets:
+            return []
+
+        pool = ThreadPool(self.jobs)
+
+        try:
+            results = pool.map_async(self._run, targets)
+
+            # Waiting with a timeout keeps the main thread
+            # responsive to Ctrl-C signals
+            while not results.ready():
+                results.wait(1)
+            results = results.get()
+        finally:
+            pool.terminate()
+            pool.join()
+
+        return results
+
+    def _run(self, target):
+        start = time.time()
+
+        try:
+            self.run_target(target)
+            result = Result(target, seconds=time.time() - start)
+        except Exception, e:
+            result = Result(target, error=e, seconds=time.time() - start)
+
+        self._report(result)
+
+        return result
+
+    def _report(self, result):
+        with self._lock:
+            if result.ok:
+                print('%s: completed in %.2f s' % (result.target.name, result.seconds))
+            else:
+                print('%s: failed in %.2f s. Error: %s' % (result.target.name,
+                                                          result.seconds,
+                                                          str(result.error)))
+
+
+class ProcessBatch(Batch):
+    """Run each target of a batch on its own process.
+
+    Targets do not share any state: each process opens its own
+    database and HTTP connections. The main process supervises
+    them, collecting the exit status, the time and the profile
+    of each target. Up to `jobs` processes run at the same time.
+
+    The first targets of different platforms share no rows, so
+    they run at the same time too and a batch takes as long as
+    its slowest target. Conflicts are retried like on `Batch`.
+
+    Processes are forked, so the database connections of the
+    main process must be closed before running the batch.
+    """
+
+    def _run_first(self, targets):
+        return self._run_concurrently(targets)
+
+    def _run(self, target):
+        return self._run_concurrently([target])[0]
+
+    def _run_concurrently(self, targets):
+        pending = collections.deque(enumerate(targets))
+        running = {}
+        results = [None] * len(targets)
+
+        try:
+            while pending or running:
+                while pending and len(running) < self.jobs:
+                    i, target = pending.popleft()
+                    running[i] = self._start(target)
+
+                time.sleep(POLL_INTERVAL)
+
+                for i, child in running.items():
+                    result = self._poll(*child)
+
+                    if result:
+                        results[i] = result
+                        del running[i]
+                        self._report(result)
+        finally:
+            for process, _, _, _ in running.values():
+                process.terminate()
+                process.join()
+
+        return results
+
+    def _start(self, target):
+        reader, writer = multiprocessing.Pipe(duplex=False)
+
+        process = multiprocessing.Process(target=self._run_child,
+                                          args=(target, writer))
+        process.start()
+        writer.close()
+
+        return process, reader, target, time.time()
+
+    def _run_child(self, target, conn):
+        # Times of the main process were already counted
+        get_profiler().reset()
+
+        try:
+            self.run_target(target)
+            error = None
+        except Exception, e:
+            error = (str(e), isinstance(e, IntegrityError))
+
+        conn.send((error, get_profiler().report()))
+        conn.close()
+
+        if error:
+            sys.exit(1)
+
+    def _poll(self, process, conn, target, start):
+        """Return the result of a process or None if it is running"""
+
+        # The message is read before joining, so the
+        # process is not blocked writing on the pipe
+        if not conn.poll() and process.is_alive():
+            return None
+
+        try:
+            message = conn.recv()
+        except EOFError:
+            # The process died without sending anything
+            message = None
+
+        process.join()
+        conn.close()
+
+        seconds = time.time() - start
+
+        if message is None:
+            error = ProcessError('process exited with status %s' % process.exitcode,
+                                 process.exitcode)
+        else:
+            error, profile = message
+            get_profiler().merge(profile)
+
+            if error:
+                error = ProcessError(error[0], process.exitcode, conflict=error[1])
+
+        return Result(target, error=error, seconds=seconds,
+                      exitcode=process.exitcode)
+
+
+def _is_conflict(error):
+    return isinstance(error, IntegrityError) or \
+        getattr(error, 'conflict', False)
+
+
+def set_arguments_subparser(parser):
+    subparser = parser.add_parser('batch', help='Run the targets of a manifest')
+
+    # Batch options
+    group = subparser.add_argument_group('Batch options')
+    group.add_argument('--jobs', dest='batch_jobs', type=int,
+                       help='Number of targets run concurrently',
+                       default=1)
+    group.add_argument('--processes', dest='batch_processes',
+                       help='Run each target on its own process',
+                       action='store_true', default=False)
+
+    # Positional arguments
+    subparser.add_argument('manifest',
+                           help='JSON file with the list of targets')
+
+
+def read_manifest(filepath):
+    """Read the targets of a manifest.
+
+    A manifest is a JSON list of objects. Each object sets the
+    backend of a target and its options, using the destination
+    names of the command line options (e.g. 'gh_token' for
+    '--gh-token'). For instance:
+
+        [{"backend" : "docker", "url" : "https://registry.hub.docker.com",
+          "owner" : "library"},
+         {"backend" : "github", "owner" : "MetricsGrimoire", "gh_token" : "XXXX"}]
+    """
+    with open(filepath, 'r') as f:
+        content = json.load(f)
+
+    if not isinstance(content, list):
+        raise ValueError('Manifest %s must be a list of targets' % filepath)
+
+    targets = []
+
+    for entry in content:
+        options = dict([(str(k), v) for k, v in entry.items()])
+
+        if 'backend' not in options:
+            raise ValueError('Backend not set on target %s' % entry)
+
+        targets.append(Target(**options))
+
+    return targets
@@ -20,36 +20,92 @@
 #         Santiago Dueñas <sduenas@bitergia.com>
 #
 
-from sqlalchemy import create_engine
-from sqlalchemy.engine.url import URL
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import URL, make_url
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 
-from octopus.model import ModelBase
+from octopus.instrumentation import timer
+from octopus.migrations import migrate
+from octopus.model import ModelBase, clear_unique_cache
+from octopus.snapshots import clear_snapshots, write_snapshots
+
+
+# Connection pool settings
+POOL_SIZE = 5
+POOL_MAX_OVERFLOW = 10
+POOL_RECYCLE = 3600
+
+# Settings of SQLite connections. Writes go to a write-ahead log,
+# which is synced less often, and the page cache is set in KB
+SQLITE_PRAGMAS = (('journal_mode', 'WAL'),
+                  ('synchronous', 'NORMAL'),
+                  ('cache_size', -64 * 1024),
+                  ('temp_store', 'MEMORY'))
+
+# Seconds to wait for a lock held by another connection
+SQLITE_TIMEOUT = 30
 
 
 class Database(object):
+    """Database where fetched data is stored.
+
+    Connections are kept in a pool of `pool_size` connections that
+    can grow up to `max_overflow` extra connections when all of them
+    are in use. Connections older than `pool_recycle` seconds are
+    replaced, so they are not closed by the server while idle. With
+    `pool_pre_ping`, connections are tested before using them.
+    Setting `pool_size` to 0 disables the pool.
 
-    def __init__(self, user, password, database, host='localhost', port='3306'):
+    By default, data is stored on a MySQL server. Any other database
+    can be set giving its SQLAlchemy `url`. SQLite databases are
+    tuned for bulk writes using a write-ahead log.
+    """
+
+    def __init__(self, user=None, password=None, database=None,
+                 host='localhost', port='3306',
+                 pool_size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW,
+                 pool_recycle=POOL_RECYCLE, pool_pre_ping=False, url=None):
         # Create an engine
-        self.url = URL('mysql', user, password, host, port, database,
-                       query={'charset' : 'utf8'})
-        self._engine = create_engine(self.url, poolclass=NullPool, echo=False)
+        self.url = database_url(user, password, database, host, port, url)
+        self._engine = create_database_engine(self.url, pool_size, max_overflow,
+                                              pool_recycle, pool_pre_ping)
+
         self._Session = sessionmaker(bind=self._engine)
 
         # Create the schema on the database.
         # It won't replace any existing schema
         ModelBase.metadata.create_all(self._engine)
 
+        # Update schemas created by previous versions
+        migrate(self._engine)
+
     def connect(self):
         return self._Session()
 
+    def dispose(self):
+        """Close the connections of the pool.
+
+        New connections are opened when needed. Call it before
+        forking, so processes do not share connections.
+        """
+        self._engine.dispose()
+
+    def writer(self, session, chunk_size=None, interval=None):
+        return ChunkedWriter(session, chunk_size, interval)
+
     def store(self, session, obj):
         try:
             session.add(obj)
-            session.commit()
+            write_snapshots(session)
+
+            with timer('db.commit'):
+                session.commit()
         except:
             session.rollback()
+            clear_snapshots(session)
             raise
 
     def clear(self):
@@ -59,3 +115,107 @@ class Database(object):
             session.execute(table.delete())
             session.commit()
         session.close()
+
+
+def database_url(user=None, password=None, database=None, host='localhost',
+                 port='3306', url=None):
+    """Return the URL of a MySQL database, or the given `url`"""
+
+    if url:
+        return make_url(url)
+    return URL('mysql', user, password, host, port, database,
+               query={'charset' : 'utf8'})
+
+
+def create_database_engine(url, pool_size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW,
+                           pool_recycle=POOL_RECYCLE, pool_pre_ping=False):
+    """Create the engine of a database; it does not connect to it"""
+
+    is_sqlite = url.drivername.split('+')[0] == 'sqlite'
+
+    if is_sqlite:
+        # SQLite chooses its own pool
+        kwargs = {'connect_args' : {'timeout' : SQLITE_TIMEOUT}}
+    elif pool_size:
+        kwargs = {'pool_size' : pool_size,
+                  'max_overflow' : max_overflow,
+                  'pool_recycle' : pool_recycle}
+
+        if pool_pre_ping:
+            kwargs['pool_pre_ping'] = True
+    else:
+        kwargs = {'poolclass' : NullPool}
+
+    engine = create_engine(url, echo=False, **kwargs)
+
+    if is_sqlite:
+        event.listen(engine, 'connect', set_sqlite_pragmas)
+
+    return engine
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply SQLITE_PRAGMAS to a new SQLite connection"""
+
+    cursor = dbapi_connection.cursor()
+
+    for name, value in SQLITE_PRAGMAS:
+        cursor.execute('PRAGMA %s = %s' % (name, value))
+    cursor.close()
+
+
+class ChunkedWriter(object):
+    """Store objects on the database in chunks.
+
+    Objects are committed every `chunk_size` objects or every
+    `interval` seconds, whatever happens first. Once committed,
+    they are expunged from the session, so the memory used does
+    not depend on the number of objects stored.
+
+    Snapshots buffered on the session are written on each commit.
+    """
+
+    def __init__(self, session, chunk_size=None, interval=None):
+        self.session = session
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self._objects = []
+        self._last_commit = time.time()
+
+    def add(self, *objs):
+        self.session.add_all(objs)
+        self._objects.extend(objs)
+
+        if self._is_chunk_full():
+            self.commit()
+
+    def commit(self):
+        try:
+            write_snapshots(self.session)
+
+            with timer('db.commit'):
+                self.session.commit()
+        except:
+            self.session.rollback()
+            clear_snapshots(self.session)
+            raise
+
+        for obj in self._objects:
+            if obj in self.session:
+                self.session.expunge(obj)
+
+        # Cached objects might have been expunged
+        clear_unique_cache(self.session)
+
+        self._objects = []
+        self._last_commit = time.time()
+
+    def close(self):
+        self.commit()
+
+    def _is_chunk_full(self):
+        if self.chunk_size and len(self._objects) >= self.chunk_size:
+            return True
+        if self.interval and time.time() - self._last_commit >= self.interval:
+            return True
+        return False
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import collections
+import csv
+import datetime
+import json
+import sys
+
+from octopus.query import BATCH_SIZE
+
+
+JSON_LINES = 'jsonl'
+CSV = 'csv'
+FORMATS = (JSON_LINES, CSV)
+
+# Bytes buffered before writing to the output file
+BUFFER_SIZE = 1024 * 1024
+
+
+def set_export_arguments(subparser, tables):
+    """Add the export options to the subparser of a backend"""
+
+    group = subparser.add_argument_group('Export options')
+    group.add_argument('--export', dest='export',
+                       help='When enabled, other options are ignored',
+                       default=False, action='store_true')
+    group.add_argument('--export-format', dest='export_format',
+                       help='Format of the exported data',
+                       choices=FORMATS, default=JSON_LINES)
+    group.add_argument('--export-table', dest='export_table',
+                       help='Table to export',
+                       choices=tables, default=tables[0])
+    group.add_argument('--export-file', dest='export_file',
+                       help='File where data will be written. By default, standard output',
+                       default=None)
+
+
+def find_table(alchemy_objects, name=None):
+    """Return the model class of a table; by default, the first one"""
+
+    for alchemy_object in alchemy_objects:
+        if alchemy_object.__tablename__ == name:
+            return alchemy_object
+    return alchemy_objects[0]
+
+
+def open_output(filename=None):
+    if not filename:
+        return sys.stdout
+    return open(filename, 'wb', BUFFER_SIZE)
+
+
+def close_output(output):
+    if output is sys.stdout:
+        output.flush()
+    else:
+        output.close()
+
+
+def export(query, output, fmt=JSON_LINES, batch_size=BATCH_SIZE):
+    """Write the results of a query in the given format.
+
+    Rows are read in batches from a server side cursor and
+    each batch is written at once, so the memory used does not
+    depend on the number of rows exported.
+    """
+    if fmt == JSON_LINES:
+        writer = JSONLinesWriter(output)
+    elif fmt == CSV:
+        writer = CSVWriter(output)
+    else:
+        raise ValueError('Export format %s not supported' % fmt)
+
+    result = query.stream()
+    nrows = 0
+
+    try:
+        writer.header(result.keys())
+
+        while True:
+            rows = result.fetchmany(batch_size)
+
+            if not rows:
+                break
+
+            writer.write(rows)
+            nrows += len(rows)
+    finally:
+        result.close()
+
+    return nrows
+
+
+class JSONLinesWriter(object):
+    """Write each row as a JSON object in its own line"""
+
+    def __init__(self, output):
+        self.output = output
+        self.keys = None
+
+    def header(self, keys):
+        self.keys = keys
+
+    def write(self, rows):
+        lines = [json.dumps(collections.OrderedDict(zip(self.keys, row)),
+                            default=_encode_json, separators=(',', ':'))
+                 for row in rows]
+        lines.append('')
+        self.output.write('\n'.join(lines))
+
+
+class CSVWriter(object):
+    """Write rows as comma separated values"""
+
+    def __init__(self, output):
+        self.writer = csv.writer(output)
+
+    def header(self, keys):
+        self.writer.writerow(keys)
+
+    def write(self, rows):
+        self.writer.writerows([[_encode_csv(value) for value in row]
+                               for row in rows])
+
+
+def _encode_json(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(repr(value) + ' is not JSON serializable')
+
+
+def _encode_csv(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    elif isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
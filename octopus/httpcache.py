@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import hashlib
+import json
+import os
+import os.path
+import tempfile
+import threading
+
+from requests.structures import CaseInsensitiveDict
+
+
+# Maximum size of the cache in bytes
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+META_EXT = '.json'
+BODY_EXT = '.body'
+
+# Request headers that change the content of a response
+VARY_HEADERS = ('Accept', 'Authorization')
+
+# Response headers that are not stored or updated
+SKIP_HEADERS = ('Content-Length', 'Content-Encoding', 'Transfer-Encoding')
+
+
+class HTTPCache(object):
+    """On-disk cache of HTTP responses.
+
+    Only responses with an `ETag` or a `Last-Modified` header are
+    stored. These validators are sent on later requests of the same
+    resource using `If-None-Match` and `If-Modified-Since` headers.
+    When the server replies with `304 Not Modified`, the body is
+    read from the cache.
+
+    When the size of the stored bodies exceeds `max_size` bytes,
+    least recently used entries are removed. The directory may be
+    shared by several processes.
+
+    A 304 response whose body is missing from the cache is
+    returned as it is and the entry is removed; the request must
+    be sent again without validators (see `strip_validators`).
+    """
+
+    def __init__(self, dirpath, max_size=DEFAULT_MAX_SIZE):
+        self.dirpath = dirpath
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+        if not os.path.exists(self.dirpath):
+            os.makedirs(self.dirpath)
+
+        self._size = self._disk_size()
+
+    @property
+    def size(self):
+        return self._size
+
+    def validate(self, request):
+        """Add validators of the stored response to a request.
+
+        Returns the stored entry or None when the
+        resource is not cached.
+        """
+        entry = self._read_meta(self._key(request))
+
+        if not entry:
+            return None
+
+        if entry['etag']:
+            request.headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            request.headers['If-Modified-Since'] = entry['last_modified']
+
+        return entry
+
+    def update(self, request, response, entry=None):
+        """Update the cache using the response of the server.
+
+        On a 304 response, the stored response is returned
+        and the given one is discarded.
+        """
+        key = self._key(request)
+
+        if response.status_code == 304 and entry:
+            body = self._read_body(key)
+
+            if body is not None:
+                return self._build_response(response, entry, body)
+
+            # The body was evicted or removed
+            self._remove(key)
+        elif response.status_code == 200:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+
+            if etag or last_modified:
+                self._write(key, response, etag, last_modified)
+
+        return response
+
+    def _build_response(self, response, entry, body):
+        # Release the connection of the empty response
+        response.content
+
+        headers = CaseInsensitiveDict(entry['headers'])
+
+        for name, value in response.headers.items():
+            if name not in SKIP_HEADERS:
+                headers[name] = value
+
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = headers
+        response.encoding = entry['encoding']
+        response._content = body
+        response.from_cache = True
+
+        return response
+
+    def _write(self, key, response, etag, last_modified):
+        body = response.content
+
+        headers = dict([(name, value) for name, value in response.headers.items()
+                        if name not in SKIP_HEADERS])
+        entry = {'url' : response.url,
+                 'etag' : etag,
+                 'last_modified' : last_modified,
+                 'encoding' : response.encoding,
+                 'headers' : headers}
+
+        body_path = self._path(key, BODY_EXT)
+
+        with self._lock:
+            try:
+                self._size -= os.path.getsize(body_path)
+            except OSError:
+                pass
+
+            self._atomic_write(body_path, body)
+            self._atomic_write(self._path(key, META_EXT), json.dumps(entry))
+            self._size += len(body)
+
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        # Other processes may share the directory, so the size is
+        # computed again and files removed by them are skipped
+        bodies = self._stat_bodies()
+        self._size = sum([size for _, _, size in bodies])
+
+        # Remove least recently used entries until the
+        # cache takes up to 90% of its maximum size
+        limit = self.max_size * 0.9
+        bodies.sort(key=lambda body: body[1])
+
+        for body_path, _, size in bodies:
+            if self._size <= limit:
+                break
+
+            meta_path = body_path[:-len(BODY_EXT)] + META_EXT
+            _remove_file(body_path)
+            _remove_file(meta_path)
+            self._size -= size
+
+    def _remove(self, key):
+        with self._lock:
+            _remove_file(self._path(key, BODY_EXT))
+            _remove_file(self._path(key, META_EXT))
+
+            # Bodies may have been removed by others
+            self._size = self._disk_size()
+
+    def _read_meta(self, key):
+        path = self._path(key, META_EXT)
+
+        try:
+            with open(path, 'rb') as f:
+                return json.loads(f.read())
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _read_body(self, key):
+        path = self._path(key, BODY_EXT)
+
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+            # Mark the entry as recently used
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+
+        return body
+
+    def _atomic_write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.dirpath)
+
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+
+    def _bodies(self):
+        return [os.path.join(self.dirpath, name)
+                for name in os.listdir(self.dirpath)
+                if name.endswith(BODY_EXT)]
+
+    def _stat_bodies(self):
+        # Tuples of (path, mtime, size) of the bodies that still exist
+        bodies = []
+
+        for path in self._bodies():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            bodies.append((path, st.st_mtime, st.st_size))
+
+        return bodies
+
+    def _disk_size(self):
+        return sum([size for _, _, size in self._stat_bodies()])
+
+    def _path(self, key, ext):
+        return os.path.join(self.dirpath, key + ext)
+
+    def _key(self, request):
+        parts = [request.method, request.url]
+        parts += [request.headers.get(name, '') for name in VARY_HEADERS]
+        return hashlib.sha1('\n'.join(parts)).hexdigest()
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        # Removed by another process
+        pass
+
+
+def strip_validators(request):
+    """Remove the validators added to a request by the cache"""
+
+    for name in ('If-None-Match', 'If-Modified-Since'):
+        request.headers.pop(name, None)
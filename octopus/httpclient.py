@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import threading
+
+import requests
+import requests.adapters
+
+from octopus.httpcache import strip_validators
+from octopus.instrumentation import count, timer
+
+
+USER_AGENT = 'Octopus/0.0.1'
+HEADERS = {'User-Agent' : USER_AGENT}
+
+# Seconds to wait for connecting and reading
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+DEFAULT_TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+# Number of hosts whose pools are kept and
+# number of connections kept alive for each host
+POOL_HOSTS = 10
+POOL_MAX_CONNECTIONS = 10
+
+# Times a request rejected by a rate limit is sent again
+RATE_LIMIT_RETRIES = 3
+
+
+def make_timeout(read_timeout=READ_TIMEOUT):
+    """Return the timeouts for waiting `read_timeout` seconds a response.
+
+    Connecting never waits longer than `CONNECT_TIMEOUT` seconds,
+    so unreachable servers are given up early.
+    """
+    return (min(CONNECT_TIMEOUT, read_timeout), read_timeout)
+
+
+class HTTPAdapter(requests.adapters.HTTPAdapter):
+    """Keep-alive adapter that sets a default timeout on requests.
+
+    When a cache is given, GET requests are sent as conditional
+    requests and not modified resources are read from the cache.
+
+    When a rate limiter is given, requests wait until the limiter
+    allows them and the ones rejected by a rate limit are retried.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, cache=None,
+                 rate_limiter=None, **kwargs):
+        self.timeout = timeout
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        super(HTTPAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+
+        if not self.rate_limiter:
+            return self._send(request, **kwargs)
+
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            with timer('http.rate_limit_wait'):
+                self.rate_limiter.wait(request)
+            response = self._send(request, **kwargs)
+
+            retry_after = self.rate_limiter.update(request, response)
+
+            if retry_after is None or attempt == RATE_LIMIT_RETRIES:
+                break
+
+            # Release the connection before trying again
+            response.content
+
+        return response
+
+    def _send(self, request, **kwargs):
+        count('http.requests')
+
+        if not self.cache or request.method != 'GET' or kwargs.get('stream'):
+            with timer('http.request'):
+                return super(HTTPAdapter, self).send(request, **kwargs)
+
+        entry = self.cache.validate(request)
+
+        with timer('http.request'):
+            response = super(HTTPAdapter, self).send(request, **kwargs)
+
+        response = self.cache.update(request, response, entry)
+
+        if entry and response.status_code == 304:
+            # The stored body is gone, so the whole resource is requested
+            response.content
+            strip_validators(request)
+
+            with timer('http.request'):
+                response = super(HTTPAdapter, self).send(request, **kwargs)
+
+            response = self.cache.update(request, response)
+        elif getattr(response, 'from_cache', False):
+            count('http.cache_hits')
+
+        return response
+
+
+class HTTPClient(object):
+    """HTTP client shared by the backends.
+
+    Connections are kept alive and reused between requests to
+    the same host. The number of connections opened to a host
+    is limited by `max_connections`; when all of them are in use,
+    requests wait for a free one.
+
+    Responses can be cached on disk setting an `HTTPCache` object
+    and requests can be scheduled according to the rate limits of
+    the servers setting a `RateLimiter` object.
+
+    The client is thread safe, so it can be shared by worker threads.
+    """
+
+    def __init__(self, max_connections=POOL_MAX_CONNECTIONS,
+                 timeout=DEFAULT_TIMEOUT, headers=None, cache=None,
+                 rate_limiter=None):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.headers = dict(HEADERS)
+
+        if headers:
+            self.headers.update(headers)
+
+        self.adapter = HTTPAdapter(timeout=timeout,
+                                   cache=cache,
+                                   rate_limiter=rate_limiter,
+                                   pool_connections=POOL_HOSTS,
+                                   pool_maxsize=max_connections,
+                                   pool_block=True)
+        self.session = requests.Session()
+        self.mount(self.session)
+
+    def mount(self, session):
+        """Make a requests session to use the pool of this client.
+
+        This is useful for third party clients, like github3,
+        which manage their own session.
+        """
+        session.mount('http://', self.adapter)
+        session.mount('https://', self.adapter)
+        session.headers.update(self.headers)
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.session.post(url, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the HTTP client shared by the backends"""
+
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient()
+    return _client
+
+
+def set_client(client):
+    """Set the HTTP client shared by the backends"""
+
+    global _client
+
+    with _client_lock:
+        _client = client
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import contextlib
+import functools
+import json
+import threading
+import time
+
+
+class Profiler(object):
+    """Named timers and counters.
+
+    Timers sum the time spent on each call and keep the number
+    of calls and the slowest one. Times of calls run by worker
+    threads are added too, so the total of a timer can be larger
+    than the time of the whole run.
+
+    While the profiler is disabled, timers and counters do nothing.
+    The profiler is thread safe.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._timers = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.time()
+
+        try:
+            yield
+        finally:
+            self.add_time(name, time.time() - start)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            timer = self._timers.setdefault(name, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def merge(self, report):
+        """Add the timers and counters of a report of another process"""
+
+        with self._lock:
+            for name, values in report['timers'].items():
+                timer = self._timers.setdefault(name, [0, 0.0, 0.0])
+                timer[0] += values['calls']
+                timer[1] += values['total']
+                timer[2] = max(timer[2], values['max'])
+
+            for name, value in report['counters'].items():
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._timers = {}
+            self._counters = {}
+
+    def report(self):
+        """Return the values of timers and counters as a dict"""
+
+        with self._lock:
+            timers = dict([(name, {'calls' : calls,
+                                   'total' : total,
+                                   'max' : slowest})
+                           for name, (calls, total, slowest) in self._timers.items()])
+            counters = dict(self._counters)
+
+        return {'timers' : timers, 'counters' : counters}
+
+    def format_table(self):
+        """Return the values of timers and counters as a text table"""
+
+        report = self.report()
+        lines = ['%-24s %10s %12s %10s %10s' % ('timer', 'calls', 'total (s)',
+                                                'mean (ms)', 'max (ms)')]
+
+        for name, timer in sorted(report['timers'].items()):
+            mean = timer['total'] / timer['calls'] * 1000
+            lines.append('%-24s %10d %12.3f %10.3f %10.3f'
+                         % (name, timer['calls'], timer['total'],
+                            mean, timer['max'] * 1000))
+
+        if report['counters']:
+            lines.append('')
+            lines.append('%-24s %10s' % ('counter', 'value'))
+
+            for name, value in sorted(report['counters'].items()):
+                lines.append('%-24s %10d' % (name, value))
+
+        return '\n'.join(lines)
+
+    def write_json(self, filepath):
+        with open(filepath, 'w') as f:
+            json.dump(self.report(), f, indent=4, sort_keys=True)
+
+
+_profiler = Profiler()
+
+
+def get_profiler():
+    """Return the profiler shared by the whole process"""
+
+    return _profiler
+
+
+def timer(name):
+    """Time a block of code with the shared profiler"""
+
+    return _profiler.timer(name)
+
+
+def count(name, value=1):
+    """Increase a counter of the shared profiler"""
+
+    _profiler.count(name, value)
+
+
+def timed(name):
+    """Decorator that times every call to a function"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _profiler.enabled:
+                return func(*args, **kwargs)
+
+            with _profiler.timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -20,50 +20,220 @@
 #     Santiago Dueñas <sduenas@bitergia.com>
 #
 
-from argparse import ArgumentParser
+import sys
+import time
 
+from argparse import ArgumentParser, Namespace
+
+import octopus.batch
+import octopus.rollup
 from octopus.backends.docker import DockerRegistry
 from octopus.backends.github import GitHubPlatform
-from octopus.backends.puppet import PuppetForge
-from octopus.backends.gerrit import Gerrit
-from octopus.database import Database
+from octopus.backends.puppet import PuppetForge, PROJECTS_LIMIT
+from octopus.backends.gerrit import Gerrit, CONTROL_DIR, CONTROL_PERSIST
+from octopus.database import Database, POOL_MAX_OVERFLOW, POOL_RECYCLE, POOL_SIZE
+from octopus.export import open_output, close_output
+from octopus.httpcache import DEFAULT_MAX_SIZE, HTTPCache
+from octopus.httpclient import POOL_MAX_CONNECTIONS, READ_TIMEOUT, HTTPClient,\
+    make_timeout, set_client
+from octopus.instrumentation import get_profiler, timer
+from octopus.ratelimit import RateLimiter
 
 
 def main():
+    """Run Octopus and return its exit status"""
+
     args = parse_args()
 
-    db = Database(args.db_user, args.db_password, args.db_name)
+    profiler = get_profiler()
+    profiler.enabled = args.profile or args.profile_file is not None
+
+    try:
+        return run(args)
+    finally:
+        if profiler.enabled:
+            # Keep stdout for exported data
+            sys.stderr.write(profiler.format_table() + '\n')
+
+            if args.profile_file:
+                profiler.write_json(args.profile_file)
+
+
+def run(args):
+    if args.http_cache:
+        cache = HTTPCache(args.http_cache, args.http_cache_size * 1024 * 1024)
+    else:
+        cache = None
+
+    set_client(HTTPClient(max_connections=args.http_connections,
+                          timeout=make_timeout(args.http_timeout), cache=cache,
+                          rate_limiter=RateLimiter()))
+
+    db = Database(args.db_user, args.db_password, args.db_name,
+                  host=args.db_hostname, port=args.db_port,
+                  pool_size=args.db_pool_size, max_overflow=args.db_max_overflow,
+                  pool_recycle=args.db_pool_recycle, pool_pre_ping=args.db_pool_pre_ping,
+                  url=args.db_url)
+
+    if args.backend == 'batch':
+        return run_batch(db, args)
+    elif args.backend == 'rollup':
+        run_rollup(db, args)
+        return 0
+
     session = db.connect()
+    backend = create_backend(session, args)
+
+    if not backend:
+        print('Backend %s not found' % args.backend)
+        return 1
+
+    if args.export:
+        # Write the data linked to the selected backend
+        output = open_output(args.export_file)
+
+        try:
+            backend.export(output, args.export_format, args.export_table)
+        finally:
+            close_output(output)
+    else:
+        print('Fetching...')
+
+        if args.commit_every or args.commit_interval:
+            # Objects are stored while they are fetched
+            writer = db.writer(session, args.commit_every, args.commit_interval)
+
+            with timer('fetch'):
+                backend.fetch(writer)
+            print('Fetch processes completed')
+
+            with timer('store'):
+                store_chunks(writer)
+        else:
+            with timer('fetch'):
+                platform = backend.fetch()
+            print('Fetch processes completed')
+
+            with timer('store'):
+                store(db, session, platform)
+        print('Storage processes completed')
+
+        check_errors(backend)
+
+    session.close()
 
+    return 0
+
+
+def create_backend(session, args):
     if args.backend == 'docker':
-        backend = DockerRegistry(session, args.url, args.owner)
+        backend = DockerRegistry(session, args.url, args.owner,
+                                 jobs=getattr(args, 'jobs', 1))
     elif args.backend == 'puppet':
-        backend = PuppetForge(session, args.url)
+        backend = PuppetForge(session, args.url, jobs=getattr(args, 'jobs', 1),
+                              incremental=getattr(args, 'incremental', False),
+                              page_size=getattr(args, 'page_size', PROJECTS_LIMIT),
+                              resume=getattr(args, 'resume', False))
     elif args.backend == 'github':
-        backend = GitHubPlatform(session, owner=args.owner, repository=args.repository,
-                                 url=args.gh_url, user=args.gh_user, password=args.gh_password,
-                                 oauth_token=args.gh_token)
+        backend = GitHubPlatform(session, owner=args.owner,
+                                 repository=getattr(args, 'repository', None),
+                                 url=getattr(args, 'gh_url', None),
+                                 user=getattr(args, 'gh_user', None),
+                                 password=getattr(args, 'gh_password', None),
+                                 oauth_token=getattr(args, 'gh_token', None),
+                                 graphql=getattr(args, 'gh_graphql', False))
     elif args.backend == 'gerrit':
-        backend = Gerrit(session, gerrit_user=args.gerrit_user, gerrit_url=args.gerrit_url)
+        backend = Gerrit(session, gerrit_user=getattr(args, 'gerrit_user', None),
+                         gerrit_url=getattr(args, 'gerrit_url', None),
+                         jobs=getattr(args, 'jobs', 1),
+                         control_dir=getattr(args, 'gerrit_control_dir', CONTROL_DIR),
+                         control_persist=getattr(args, 'gerrit_control_persist',
+                                                 CONTROL_PERSIST))
     else:
-        print('Backend %s not found' % args.backend)
-        return
+        backend = None
+
+    return backend
+
+
+def run_batch(db, args):
+    targets = octopus.batch.read_manifest(args.manifest)
+
+    def target_args(target):
+        # Options of the target override the global ones
+        options = vars(args).copy()
+        options.update(target.options)
+        options['backend'] = target.backend
+        return Namespace(**options)
+
+    # Check every target before running any of them
+    for target in targets:
+        if not can_resume(target_args(target)):
+            raise ValueError('Target %s resumes without committing data while '
+                             'it is fetched; set commit_every or commit_interval'
+                             % target.name)
 
-    if hasattr(args, 'export'):
-        # This write in stdout info linked to the selected backend
-        backend.export()
+    def run_target(target):
+        fetch_target(db, target_args(target))
+
+    if args.batch_processes:
+        # Each process opens its own connections
+        db.dispose()
+        batch = octopus.batch.ProcessBatch(targets, run_target, jobs=args.batch_jobs)
     else:
-        print('Fetching...')
-        if args.backend == 'gerrit':
-            # Restart the database
-            db.clear()
-        platform = backend.fetch()
-        print('Fetch processes completed')
+        batch = octopus.batch.Batch(targets, run_target, jobs=args.batch_jobs)
 
-        store(db, session, platform)
-        print('Storage processes completed')
+    start = time.time()
+    results = batch.run()
 
-    session.close()
+    failed = len([r for r in results if not r.ok])
+    print('Batch completed: %s targets, %s failed in %.2f s'
+          % (len(results), failed, time.time() - start))
+
+    # Failed targets make the whole batch fail
+    return 1 if failed else 0
+
+
+def run_rollup(db, args):
+    session = db.connect()
+
+    try:
+        rollup = octopus.rollup.Rollup(session, batch_size=args.rollup_batch_size)
+
+        nsamples = rollup.refresh()
+        print('Rollup completed: %s samples aggregated' % nsamples)
+
+        if args.retention_days is not None:
+            nsamples = rollup.prune(args.retention_days)
+            print('Retention completed: %s samples removed' % nsamples)
+    finally:
+        session.close()
+
+
+def fetch_target(db, args):
+    session = db.connect()
+
+    try:
+        backend = create_backend(session, args)
+
+        if not backend:
+            raise Exception('Backend %s not found' % args.backend)
+
+        if args.commit_every or args.commit_interval:
+            writer = db.writer(session, args.commit_every, args.commit_interval)
+
+            with timer('fetch'):
+                backend.fetch(writer)
+            with timer('store'):
+                writer.close()
+        else:
+            with timer('fetch'):
+                platform = backend.fetch()
+            with timer('store'):
+                db.store(session, platform)
+
+        check_errors(backend)
+    finally:
+        session.close()
 
 
 def parse_args():
@@ -85,12 +255,56 @@ def parse_args():
     group.add_argument('--port', dest='db_port',
                        help='Port of the host where the database server is running',
                        default='3306')
+    group.add_argument('--db-url', dest='db_url',
+                       help='SQLAlchemy URL of the database; overrides the MySQL options',
+                       default=None)
+    group.add_argument('--db-pool-size', dest='db_pool_size', type=int,
+                       help='Number of connections kept in the pool. 0 disables the pool',
+                       default=POOL_SIZE)
+    group.add_argument('--db-max-overflow', dest='db_max_overflow', type=int,
+                       help='Connections that can be opened when the pool is exhausted',
+                       default=POOL_MAX_OVERFLOW)
+    group.add_argument('--db-pool-recycle', dest='db_pool_recycle', type=int,
+                       help='Seconds after which pooled connections are replaced',
+                       default=POOL_RECYCLE)
+    group.add_argument('--db-pool-pre-ping', dest='db_pool_pre_ping',
+                       help='Test pooled connections before using them',
+                       action='store_true', default=False)
+    group.add_argument('--commit-every', dest='commit_every', type=int,
+                       help='Commit fetched data every N objects',
+                       default=None)
+    group.add_argument('--commit-interval', dest='commit_interval', type=float,
+                       help='Commit fetched data every N seconds',
+                       default=None)
+
+    # HTTP options
+    group = parser.add_argument_group('HTTP options')
+    group.add_argument('--http-timeout', dest='http_timeout', type=float,
+                       help='Seconds to wait for a response from a server',
+                       default=READ_TIMEOUT)
+    group.add_argument('--http-connections', dest='http_connections', type=int,
+                       help='Maximum number of connections kept alive for each host',
+                       default=POOL_MAX_CONNECTIONS)
+    group.add_argument('--http-cache', dest='http_cache',
+                       help='Directory where HTTP responses are cached',
+                       default=None)
+    group.add_argument('--http-cache-size', dest='http_cache_size', type=int,
+                       help='Maximum size of the HTTP cache in MB',
+                       default=DEFAULT_MAX_SIZE / (1024 * 1024))
 
     # Debugging parameter
     parser.add_argument('-g', '--debug', help='Enable debug mode',
                        action='store_true', dest='debug',
                        default=False)
 
+    # Profiling parameters
+    parser.add_argument('--profile', help='Print where time was spent after running',
+                        action='store_true', dest='profile',
+                        default=False)
+    parser.add_argument('--profile-file', dest='profile_file',
+                        help='Write the profile to this JSON file',
+                        default=None)
+
     # Add specific backend subparsers
     subparsers = parser.add_subparsers(dest='backend',
                                        help='Backend help')
@@ -100,14 +314,41 @@ def parse_args():
     PuppetForge.set_arguments_subparser(subparsers)
     Gerrit.set_arguments_subparser(subparsers)
 
+    octopus.batch.set_arguments_subparser(subparsers)
+    octopus.rollup.set_arguments_subparser(subparsers)
+
     # Parse arguments
     args = parser.parse_args()
 
+    if not can_resume(args):
+        parser.error('--resume needs data committed while it is fetched; '
+                     'set --commit-every or --commit-interval')
+
     return args
 
 
+def can_resume(args):
+    # Resuming needs the checkpoints saved on each commit
+    if not getattr(args, 'resume', False):
+        return True
+    return bool(args.commit_every or args.commit_interval)
+
+
 def store(db, session, platform):
     try:
         db.store(session, platform)
     except Exception, e:
         raise RuntimeError(str(e))
+
+
+def check_errors(backend):
+    # Raised once the data fetched by the backend is stored
+    if backend.errors:
+        raise RuntimeError('; '.join(backend.errors))
+
+
+def store_chunks(writer):
+    try:
+        writer.close()
+    except Exception, e:
+        raise RuntimeError(str(e))
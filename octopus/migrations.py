@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import datetime
+
+from sqlalchemy import Table, Column, DateTime, Integer, MetaData, String,\
+    inspect, select
+
+from octopus.model import ModelBase
+
+
+# The version table is not part of the model, so it is
+# not removed when the database is cleared
+metadata = MetaData()
+
+schema_version_table = Table('schema_version', metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(128)),
+    Column('applied_on', DateTime()),
+    mysql_charset='utf8'
+)
+
+
+def migrate(engine):
+    """Apply the migrations not applied yet on the database.
+
+    Applied migrations are recorded on the 'schema_version' table.
+    Migrations check the state of the schema before changing it,
+    so schemas created by `create_all` are only stamped with
+    the latest version.
+    """
+    metadata.create_all(engine)
+
+    with engine.connect() as conn:
+        current = schema_version(conn)
+
+        for version, description, func in MIGRATIONS:
+            if version <= current:
+                continue
+
+            with conn.begin():
+                func(conn)
+                conn.execute(schema_version_table.insert(),
+                             version=version,
+                             description=description,
+                             applied_on=datetime.datetime.now())
+
+
+def schema_version(conn):
+    """Return the version of the schema; 0 when no migration was applied"""
+
+    q = select([schema_version_table.c.version])
+    q = q.order_by(schema_version_table.c.version.desc()).limit(1)
+    version = conn.execute(q).scalar()
+    return version or 0
+
+
+def _create_indexes(conn, *names):
+    inspector = inspect(conn)
+    tables = ModelBase.metadata.tables
+
+    for table in tables.values():
+        indexes = [index for index in table.indexes if index.name in names]
+
+        if not indexes:
+            continue
+
+        existing = [index['name'] for index in inspector.get_indexes(table.name)]
+
+        for index in indexes:
+            if index.name not in existing:
+                index.create(conn)
+
+
+def _add_columns(conn, table_name, *names):
+    inspector = inspect(conn)
+    table = ModelBase.metadata.tables[table_name]
+
+    existing = [column['name'] for column in inspector.get_columns(table_name)]
+
+    for name in names:
+        if name in existing:
+            continue
+
+        column = table.c[name]
+        column_type = column.type.compile(dialect=conn.dialect)
+
+        conn.execute('ALTER TABLE %s ADD COLUMN %s %s'
+                     % (table_name, name, column_type))
+
+
+def _add_analytical_indexes(conn):
+    _create_indexes(conn,
+                    '_projects_users_idx',
+                    '_users_projects_idx',
+                    '_project_platform_idx',
+                    '_repo_log_date_idx',
+                    '_release_project_date_idx')
+
+
+def _add_timezones(conn):
+    for table_name in ('projects', 'releases'):
+        _add_columns(conn, table_name, 'created_on_tz', 'updated_on_tz')
+
+
+# Migrations applied to the schema, sorted by version.
+# Each one is a tuple of (version, description, function)
+MIGRATIONS = [
+    (1, 'Add secondary indexes for analytical queries', _add_analytical_indexes),
+    (2, 'Add UTC offsets of projects and releases dates', _add_timezones),
+]
@@ -21,30 +21,62 @@
 #
 
 from sqlalchemy import Table, Column, DateTime, Integer, String,\
-    ForeignKey, UniqueConstraint
+    ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.declarative import declarative_base, declared_attr
+
+from octopus.instrumentation import count, timer
 
 
 ModelBase = declarative_base()
 
 
+# Maximum number of keys sent on a single IN clause
+UNIQUE_BULK_SIZE = 500
+
+
 class UniqueObject(object):
 
+    @classmethod
+    def unique_hash(cls, *arg, **kw):
+        raise NotImplementedError
+
     @classmethod
     def unique_filter(cls, query, *arg, **kw):
         raise NotImplementedError
 
+    @classmethod
+    def unique_bulk_filter(cls, query, keys):
+        raise NotImplementedError
+
     @classmethod
     def as_unique(cls, session, *arg, **kw):
         return _unique(
                     session,
                     cls,
+                    cls.unique_hash,
                     cls.unique_filter,
                     cls,
                     arg, kw
                )
 
+    @classmethod
+    def preload(cls, session, keys):
+        """Resolve many unique objects with a single query.
+
+        `keys` is a list of dicts with the keyword arguments
+        that will be given to `as_unique`. Later calls to
+        `as_unique` with the keys of stored objects will not
+        query the database.
+        """
+        _unique_bulk(
+            session,
+            cls,
+            cls.unique_hash,
+            cls.unique_bulk_filter,
+            keys
+        )
+
 
 class Platform(UniqueObject, ModelBase):
     __tablename__ = 'platforms'
@@ -63,14 +95,24 @@ class Platform(UniqueObject, ModelBase):
     def __repr__(self):
         return self.url
 
+    @classmethod
+    def unique_hash(cls, url):
+        return url
+
     @classmethod
     def unique_filter(cls, query, url):
         return query.filter(Platform.url == url)
 
+    @classmethod
+    def unique_bulk_filter(cls, query, keys):
+        return query.filter(Platform.url.in_([k['url'] for k in keys]))
+
 
 projects_users_table = Table('projects_users', ModelBase.metadata,
     Column('project_id', Integer, ForeignKey('projects.id')),
-    Column('user_id', Integer, ForeignKey('users.id'))
+    Column('user_id', Integer, ForeignKey('users.id')),
+    Index('_projects_users_idx', 'project_id', 'user_id'),
+    Index('_users_projects_idx', 'user_id')
 )
 
 
@@ -99,7 +141,9 @@ class Project(UniqueObject, ModelBase):
     name = Column(String(64))
     url = Column(String(128))
     created_on = Column(DateTime())
+    created_on_tz = Column(Integer)
     updated_on = Column(DateTime())
+    updated_on_tz = Column(Integer)
     platform_id = Column(Integer, ForeignKey('platforms.id'))
 
     # one to one project-platform relationship
@@ -115,13 +159,24 @@ class Project(UniqueObject, ModelBase):
     releases = relationship("Release", backref='project_releases')
 
     __table_args__ = (UniqueConstraint('url', 'platform_id', name='_project_unique'),
+                      Index('_project_platform_idx', 'platform_id'),
                       {'mysql_charset': 'utf8'})
 
+    @classmethod
+    def unique_hash(cls, url, platform):
+        return (url, platform)
+
     @classmethod
     def unique_filter(cls, query, url, platform):
         return query.filter(Project.url == url,
                             Project.platform == platform)
 
+    @classmethod
+    def unique_bulk_filter(cls, query, keys):
+        platforms = set([k['platform'].id for k in keys])
+        return query.filter(Project.url.in_([k['url'] for k in keys]),
+                            Project.platform_id.in_(platforms))
+
     def __repr__(self):
         return self.name
 
@@ -150,10 +205,18 @@ class Repository(UniqueObject, ModelBase):
     __table_args__ = (UniqueConstraint('url', name='_repo_unique'),
                       {'mysql_charset': 'utf8'})
 
+    @classmethod
+    def unique_hash(cls, url):
+        return url
+
     @classmethod
     def unique_filter(cls, query, url):
         return query.filter(Repository.url == url)
 
+    @classmethod
+    def unique_bulk_filter(cls, query, keys):
+        return query.filter(Repository.url.in_([k['url'] for k in keys]))
+
     def __repr__(self):
         return self.url
 
@@ -172,7 +235,81 @@ class RepositoryLog(ModelBase):
 
     repository = relationship("Repository", backref='repo_log')
 
-    __table_args__ = ({'mysql_charset': 'utf8'})
+    __table_args__ = (Index('_repo_log_date_idx', 'repo_id', 'date'),
+                      {'mysql_charset': 'utf8'})
+
+
+class RepositoryLogRollup(object):
+    """Aggregates of the samples of a repository over a period.
+
+    For each metric, the minimum, the maximum and the value
+    of the latest sample of the period are stored.
+    """
+
+    id = Column(Integer, primary_key=True)
+    period = Column(DateTime())
+    samples = Column(Integer)
+    last_date = Column(DateTime())
+    starred_min = Column(Integer)
+    starred_max = Column(Integer)
+    starred_last = Column(Integer)
+    pulls_min = Column(Integer)
+    pulls_max = Column(Integer)
+    pulls_last = Column(Integer)
+    downloads_min = Column(Integer)
+    downloads_max = Column(Integer)
+    downloads_last = Column(Integer)
+    forks_min = Column(Integer)
+    forks_max = Column(Integer)
+    forks_last = Column(Integer)
+    watchers_min = Column(Integer)
+    watchers_max = Column(Integer)
+    watchers_last = Column(Integer)
+
+    @declared_attr
+    def repo_id(cls):
+        return Column(Integer, ForeignKey('repositories.id'))
+
+
+class RepositoryLogDaily(RepositoryLogRollup, ModelBase):
+    __tablename__ = 'repositories_log_daily'
+
+    __table_args__ = (UniqueConstraint('repo_id', 'period', name='_repo_log_daily_unique'),
+                      {'mysql_charset': 'utf8'})
+
+
+class RepositoryLogWeekly(RepositoryLogRollup, ModelBase):
+    __tablename__ = 'repositories_log_weekly'
+
+    __table_args__ = (UniqueConstraint('repo_id', 'period', name='_repo_log_weekly_unique'),
+                      {'mysql_charset': 'utf8'})
+
+
+class RollupState(UniqueObject, ModelBase):
+    __tablename__ = 'rollup_states'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(32))
+    last_id = Column(Integer)
+    updated_on = Column(DateTime())
+
+    __table_args__ = (UniqueConstraint('name', name='_rollup_state_unique'),
+                      {'mysql_charset': 'utf8'})
+
+    @classmethod
+    def unique_hash(cls, name):
+        return name
+
+    @classmethod
+    def unique_filter(cls, query, name):
+        return query.filter(RollupState.name == name)
+
+    @classmethod
+    def unique_bulk_filter(cls, query, keys):
+        return query.filter(RollupState.name.in_([k['name'] for k in keys]))
+
+    def __repr__(self):
+        return self.name
 
 
 class User(UniqueObject, ModelBase):
@@ -187,10 +324,18 @@ class User(UniqueObject, ModelBase):
     __table_args__ = (UniqueConstraint('username', name='_username_unique'),
                       {'mysql_charset': 'utf8'})
 
+    @classmethod
+    def unique_hash(cls, username):
+        return username
+
     @classmethod
     def unique_filter(cls, query, username):
         return query.filter(User.username == username)
 
+    @classmethod
+    def unique_bulk_filter(cls, query, keys):
+        return query.filter(User.username.in_([k['username'] for k in keys]))
+
     def __repr__(self):
         return self.username
 
@@ -204,7 +349,9 @@ class Release(UniqueObject, ModelBase):
     url = Column(String(128))
     file_url = Column(String(128))
     created_on = Column(DateTime())
+    created_on_tz = Column(Integer)
     updated_on = Column(DateTime())
+    updated_on_tz = Column(Integer)
     author_id = Column(Integer, ForeignKey('users.id'))
     project_id = Column(Integer, ForeignKey('projects.id'))
 
@@ -215,25 +362,167 @@ class Release(UniqueObject, ModelBase):
     project = relationship("Project", backref='release_project')
 
     __table_args__ = (UniqueConstraint('url', name='_release_unique'),
+                      Index('_release_project_date_idx', 'project_id', 'created_on'),
                       {'mysql_charset': 'utf8'})
 
+    @classmethod
+    def unique_hash(cls, url):
+        return url
+
     @classmethod
     def unique_filter(cls, query, url):
         return query.filter(Release.url == url)
 
+    @classmethod
+    def unique_bulk_filter(cls, query, keys):
+        return query.filter(Release.url.in_([k['url'] for k in keys]))
+
     def __repr__(self):
         return "%s (%s)" % (self.name, self.version)
 
 
-def _unique(session, cls, queryfunc, constructor, arg, kw):
+class Watermark(UniqueObject, ModelBase):
+    __tablename__ = 'watermarks'
+
+    id = Column(Integer, primary_key=True)
+    # Latest update seen on the platform, in UTC
+    updated_on = Column(DateTime())
+    platform_id = Column(Integer, ForeignKey('platforms.id'))
+
+    # one to one watermark-platform relationship
+    platform = relationship("Platform", backref='watermark_platform')
+
+    __table_args__ = (UniqueConstraint('platform_id', name='_watermark_unique'),
+                      {'mysql_charset': 'utf8'})
+
+    @classmethod
+    def unique_hash(cls, platform):
+        return platform
+
+    @classmethod
+    def unique_filter(cls, query, platform):
+        return query.filter(Watermark.platform == platform)
+
+    @classmethod
+    def unique_bulk_filter(cls, query, keys):
+        return query.filter(Watermark.platform_id.in_([k['platform'].id for k in keys]))
+
+    def __repr__(self):
+        return str(self.updated_on)
+
+
+class Checkpoint(UniqueObject, ModelBase):
+    __tablename__ = 'checkpoints'
+
+    id = Column(Integer, primary_key=True)
+    offset = Column(Integer)
+    last_url = Column(String(128))
+    # Latest update seen before the checkpoint, in UTC
+    latest = Column(DateTime())
+    updated_on = Column(DateTime())
+    platform_id = Column(Integer, ForeignKey('platforms.id'))
+
+    # one to one checkpoint-platform relationship
+    platform = relationship("Platform", backref='checkpoint_platform')
+
+    __table_args__ = (UniqueConstraint('platform_id', name='_checkpoint_unique'),
+                      {'mysql_charset': 'utf8'})
+
+    @classmethod
+    def unique_hash(cls, platform):
+        return platform
+
+    @classmethod
+    def unique_filter(cls, query, platform):
+        return query.filter(Checkpoint.platform == platform)
+
+    @classmethod
+    def unique_bulk_filter(cls, query, keys):
+        return query.filter(Checkpoint.platform_id.in_([k['platform'].id for k in keys]))
+
+    def __repr__(self):
+        return '%s (%s)' % (self.offset, self.last_url)
+
+
+def _unique(session, cls, hashfunc, queryfunc, constructor, arg, kw):
+    cache = _unique_cache(session)
+    key = (cls, hashfunc(*arg, **kw))
+
     with session.no_autoflush:
-        q = session.query(cls)
-        q = queryfunc(q, *arg, **kw)
+        if key in cache:
+            count('unique.hits')
+            obj = cache[key]
+        elif _is_unsaved(arg, kw):
+            obj = None
+        else:
+            count('unique.queries')
 
-        obj = q.first()
+            with timer('unique.query'):
+                q = session.query(cls)
+                q = queryfunc(q, *arg, **kw)
+
+                obj = q.first()
 
         if not obj:
             obj = constructor(*arg, **kw)
 
         session.add(obj)
+
+    cache[key] = obj
     return obj
+
+
+def _unique_bulk(session, cls, hashfunc, queryfunc, keys):
+    cache = _unique_cache(session)
+    pending = {}
+
+    for kw in keys:
+        key = (cls, hashfunc(**kw))
+
+        if key in cache or key in pending:
+            continue
+        elif _is_unsaved((), kw):
+            # Nothing stored can be linked to an unsaved object
+            cache[key] = None
+        else:
+            pending[key] = kw
+
+    if not pending:
+        return
+
+    fields = pending.values()[0].keys()
+    values = pending.values()
+
+    with session.no_autoflush, timer('unique.preload'):
+        for i in range(0, len(values), UNIQUE_BULK_SIZE):
+            q = session.query(cls)
+            q = queryfunc(q, values[i:i + UNIQUE_BULK_SIZE])
+
+            for obj in q:
+                kw = dict([(f, getattr(obj, f)) for f in fields])
+                cache[(cls, hashfunc(**kw))] = obj
+
+    # Keys not found are not cached as missing. The collation of
+    # the database might have matched them with other values
+    # (e.g. 'Foo' for 'foo' on MySQL), so as_unique looks them up.
+
+
+def _unique_cache(session):
+    cache = session.info.get('unique_cache')
+
+    if cache is None:
+        session.info['unique_cache'] = cache = {}
+    return cache
+
+
+def clear_unique_cache(session):
+    """Forget the unique objects resolved on a session"""
+
+    session.info['unique_cache'] = {}
+
+
+def _is_unsaved(arg, kw):
+    for value in list(arg) + kw.values():
+        if isinstance(value, ModelBase) and value.id is None:
+            return True
+    return False
@@ -22,6 +22,25 @@
 
 from sqlalchemy import select
 
+from octopus.model import Platform, Project, Repository, RepositoryLog,\
+    RepositoryLogDaily, RepositoryLogWeekly, Release, GerritRepository
+
+
+# Number of rows fetched at once when streaming results
+BATCH_SIZE = 1000
+
+# Tables to join to reach the platforms table
+PLATFORM_PATHS = {
+    Project : (Platform,),
+    Release : (Project, Platform),
+    Repository : (Project, Platform),
+    RepositoryLog : (Repository, Project, Platform),
+    RepositoryLogDaily : (Repository, Project, Platform),
+    RepositoryLogWeekly : (Repository, Project, Platform),
+    GerritRepository : (Platform,),
+}
+
+
 class Query(object):
     """Use to query database and export data"""
 
@@ -29,5 +48,48 @@ class Query(object):
         self.session = session
         self.alchemy_object = alchemy_object
 
+    def statement(self):
+        return select([self.alchemy_object])
+
     def data(self):
-        return self.session.execute(select([self.alchemy_object]))
+        return self.session.execute(self.statement())
+
+    def stream(self):
+        """Run the query using a server side cursor.
+
+        Rows are sent by the server while they are fetched,
+        so results can be read in batches with `fetchmany`
+        without loading all of them in memory.
+        """
+        stmt = self.statement().execution_options(stream_results=True)
+        return self.session.execute(stmt)
+
+
+class PlatformQuery(Query):
+    """Query the rows of a table that belong to a type of platform.
+
+    When `url` is given, only the rows of that platform are returned.
+    It can also be a list with the URLs of several platforms.
+    """
+
+    def __init__(self, session, alchemy_object, platform_type, url=None):
+        super(PlatformQuery, self).__init__(session, alchemy_object)
+        self.platform_type = platform_type
+        self.url = url
+
+    def statement(self):
+        table = self.alchemy_object.__table__
+
+        joined = table
+        for alchemy_object in PLATFORM_PATHS[self.alchemy_object]:
+            joined = joined.join(alchemy_object.__table__)
+
+        stmt = select([table]).select_from(joined)
+        stmt = stmt.where(Platform.type == self.platform_type)
+
+        if isinstance(self.url, (list, tuple)):
+            stmt = stmt.where(Platform.url.in_(self.url))
+        elif self.url:
+            stmt = stmt.where(Platform.url == self.url)
+
+        return stmt.order_by(table.c.id)
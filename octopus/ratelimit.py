@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import threading
+import time
+
+
+# Remaining requests below which requests are paced
+PACING_THRESHOLD = 100
+
+# Seconds to wait after the reset time to be sure
+# the budget has been restored
+RESET_MARGIN = 1
+
+# Seconds to wait when the server does not say when to retry
+DEFAULT_RETRY_AFTER = 60
+
+
+class RateLimiter(object):
+    """Schedule requests according to the rate limits of servers.
+
+    The budget of requests is read from the `X-RateLimit-Remaining`
+    and `X-RateLimit-Reset` headers of the responses, as GitHub
+    sends them. Budgets are tracked by host and credentials.
+
+    When few requests remain, they are spread along the time left
+    until the reset, so the limit is not reached. If it is reached
+    anyway, requests wait until the reset time. Responses rejected
+    with a `Retry-After` header, like the ones of GitHub secondary
+    rate limits, are retried after the given number of seconds.
+
+    Servers that do not send these headers are not affected.
+    """
+
+    def __init__(self, pacing_threshold=PACING_THRESHOLD,
+                 clock=time.time, sleep=time.sleep):
+        self.pacing_threshold = pacing_threshold
+        self.clock = clock
+        self.sleep = sleep
+        self._budgets = {}
+        self._lock = threading.Lock()
+
+    def wait(self, request):
+        """Wait until the request can be sent"""
+
+        delay = self.delay(request)
+
+        if delay > 0:
+            self.sleep(delay)
+
+    def delay(self, request):
+        """Seconds to wait before sending the request"""
+
+        key = self._key(request)
+        now = self.clock()
+
+        with self._lock:
+            budget = self._budgets.get(key)
+
+            if not budget or budget['reset'] <= now:
+                return 0
+
+            if budget['retry_on'] > now:
+                return budget['retry_on'] - now
+
+            remaining = budget['remaining']
+
+            if remaining <= 0:
+                return budget['reset'] - now + RESET_MARGIN
+            if remaining >= self.pacing_threshold:
+                return 0
+
+            # Spread the remaining requests until the reset
+            interval = (budget['reset'] - now) / remaining
+            delay = max(budget['next_on'] - now, 0)
+
+            budget['next_on'] = max(budget['next_on'], now) + interval
+            budget['remaining'] -= 1
+
+            return delay
+
+    def update(self, request, response):
+        """Update the budget with the headers of a response.
+
+        Returns the number of seconds to wait before retrying
+        the request when it was rejected because of a rate
+        limit or None otherwise.
+        """
+        key = self._key(request)
+        now = self.clock()
+        headers = response.headers
+
+        retry_after = None
+
+        if response.status_code in (403, 429):
+            if 'Retry-After' in headers:
+                retry_after = _to_int(headers['Retry-After'], DEFAULT_RETRY_AFTER)
+            elif headers.get('X-RateLimit-Remaining') == '0':
+                reset = _to_int(headers.get('X-RateLimit-Reset'), now + DEFAULT_RETRY_AFTER)
+                retry_after = max(reset - now, 0) + RESET_MARGIN
+            elif response.status_code == 429:
+                retry_after = DEFAULT_RETRY_AFTER
+
+        with self._lock:
+            budget = self._budgets.setdefault(key, {'remaining' : None,
+                                                    'reset' : 0,
+                                                    'next_on' : 0,
+                                                    'retry_on' : 0})
+
+            if 'X-RateLimit-Remaining' in headers and 'X-RateLimit-Reset' in headers:
+                budget['remaining'] = _to_int(headers['X-RateLimit-Remaining'], None)
+                budget['reset'] = _to_int(headers['X-RateLimit-Reset'], 0)
+
+            if retry_after is not None:
+                budget['retry_on'] = now + retry_after
+                budget['reset'] = max(budget['reset'], budget['retry_on'])
+
+                if budget['remaining'] is None:
+                    budget['remaining'] = 0
+
+            if budget['remaining'] is None:
+                del self._budgets[key]
+
+        return retry_after
+
+    def _key(self, request):
+        host = request.url.split('/')[2] if '://' in request.url else request.url
+        return (host, request.headers.get('Authorization'))
+
+
+def _to_int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import datetime
+
+from sqlalchemy import and_, select
+
+from octopus.model import RepositoryLog, RepositoryLogDaily,\
+    RepositoryLogWeekly, RollupState, UNIQUE_BULK_SIZE
+
+
+# Metrics of the samples that are aggregated
+ROLLUP_METRICS = ('starred', 'pulls', 'downloads', 'forks', 'watchers')
+
+# Name of the state of the repositories log rollup
+ROLLUP_NAME = 'repositories_log'
+
+# Number of samples aggregated on each transaction
+BATCH_SIZE = 5000
+
+
+def day_period(date):
+    return datetime.datetime(date.year, date.month, date.day)
+
+
+def week_period(date):
+    day = day_period(date)
+    return day - datetime.timedelta(days=day.weekday())
+
+
+# Aggregate tables and the function that sets the
+# period of a sample on each of them
+PERIODS = ((RepositoryLogDaily, day_period),
+           (RepositoryLogWeekly, week_period))
+
+
+class Rollup(object):
+    """Compact the samples of the repositories log.
+
+    Samples are aggregated into daily and weekly tables. Each
+    refresh only reads the samples stored after the last one
+    aggregated, which is saved with the aggregates on the same
+    transaction.
+
+    Aggregated samples older than a retention period can be
+    removed with `prune`.
+    """
+
+    def __init__(self, session, batch_size=BATCH_SIZE):
+        self.session = session
+        self.batch_size = batch_size
+
+    def refresh(self):
+        """Aggregate the samples stored since the last refresh.
+
+        Returns the number of samples aggregated.
+        """
+        state = self._state()
+        last_id = state.last_id or 0
+        nsamples = 0
+
+        while True:
+            samples = self._samples(last_id)
+
+            if not samples:
+                break
+
+            for alchemy_object, period in PERIODS:
+                self._aggregate(alchemy_object, period, samples)
+
+            last_id = samples[-1].id
+            state.last_id = last_id
+            state.updated_on = datetime.datetime.now()
+            self._commit()
+
+            nsamples += len(samples)
+
+        return nsamples
+
+    def prune(self, retention_days):
+        """Remove aggregated samples older than `retention_days`.
+
+        Samples not aggregated yet are never removed. Returns
+        the number of samples removed.
+        """
+        state = self._state()
+
+        if not state.last_id:
+            return 0
+
+        limit = datetime.datetime.now() - datetime.timedelta(days=retention_days)
+
+        table = RepositoryLog.__table__
+        stmt = table.delete().where(and_(table.c.id <= state.last_id,
+                                         table.c.date < limit))
+
+        result = self.session.execute(stmt)
+        self._commit()
+
+        return result.rowcount
+
+    def _state(self):
+        return RollupState.as_unique(self.session, name=ROLLUP_NAME)
+
+    def _samples(self, last_id):
+        table = RepositoryLog.__table__
+
+        stmt = select([table]).where(table.c.id > last_id)
+        stmt = stmt.order_by(table.c.id).limit(self.batch_size)
+
+        return self.session.execute(stmt).fetchall()
+
+    def _aggregate(self, alchemy_object, period, samples):
+        groups = {}
+
+        for sample in samples:
+            if sample.repo_id is None or sample.date is None:
+                continue
+
+            key = (sample.repo_id, period(sample.date))
+            groups.setdefault(key, []).append(sample)
+
+        if not groups:
+            return
+
+        aggregates = self._load(alchemy_object, groups.keys())
+
+        for key, group in groups.items():
+            aggregate = aggregates.get(key)
+
+            if aggregate is None:
+                aggregate = alchemy_object(repo_id=key[0], period=key[1],
+                                           samples=0)
+                self.session.add(aggregate)
+
+            for sample in group:
+                update_aggregate(aggregate, sample)
+
+    def _load(self, alchemy_object, keys):
+        repo_ids = list(set([k[0] for k in keys]))
+        periods = [k[1] for k in keys]
+
+        aggregates = {}
+
+        for i in range(0, len(repo_ids), UNIQUE_BULK_SIZE):
+            q = self.session.query(alchemy_object)
+            q = q.filter(alchemy_object.repo_id.in_(repo_ids[i:i + UNIQUE_BULK_SIZE]),
+                         alchemy_object.period >= min(periods),
+                         alchemy_object.period <= max(periods))
+
+            for aggregate in q:
+                aggregates[(aggregate.repo_id, aggregate.period)] = aggregate
+
+        return aggregates
+
+    def _commit(self):
+        try:
+            self.session.commit()
+        except:
+            self.session.rollback()
+            raise
+
+
+def update_aggregate(aggregate, sample):
+    """Add a sample to an aggregate"""
+
+    aggregate.samples += 1
+
+    is_last = aggregate.last_date is None or sample.date >= aggregate.last_date
+
+    if is_last:
+        aggregate.last_date = sample.date
+
+    for metric in ROLLUP_METRICS:
+        value = getattr(sample, metric)
+
+        if is_last:
+            setattr(aggregate, metric + '_last', value)
+
+        if value is None:
+            continue
+
+        current = getattr(aggregate, metric + '_min')
+        if current is None or value < current:
+            setattr(aggregate, metric + '_min', value)
+
+        current = getattr(aggregate, metric + '_max')
+        if current is None or value > current:
+            setattr(aggregate, metric + '_max', value)
+
+
+def set_arguments_subparser(parser):
+    subparser = parser.add_parser('rollup', help='Aggregate the repositories log')
+
+    # Rollup options
+    group = subparser.add_argument_group('Rollup options')
+    group.add_argument('--retention-days', dest='retention_days', type=int,
+                       help='Remove aggregated samples older than N days',
+                       default=None)
+    group.add_argument('--batch-size', dest='rollup_batch_size', type=int,
+                       help='Number of samples aggregated on each transaction',
+                       default=BATCH_SIZE)
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+from sqlalchemy import func
+
+from octopus.instrumentation import count, timer
+from octopus.model import Project, Repository, RepositoryLog
+
+
+# Columns set on each snapshot row
+SNAPSHOT_COLUMNS = ('date', 'starred', 'pulls', 'downloads', 'forks', 'watchers')
+
+# Counters compared to find out whether a repository changed
+SNAPSHOT_METRICS = SNAPSHOT_COLUMNS[1:]
+
+# Maximum number of repositories whose latest snapshot
+# is looked up with a single query
+LATEST_BULK_SIZE = 500
+
+
+class SnapshotBuffer(object):
+    """Snapshots of repositories waiting to be written.
+
+    Snapshots are rows of the repositories log. Instead of adding
+    them to the session one by one, they are kept on this buffer
+    and written with a single multi-row insert, skipping the unit
+    of work of the ORM.
+
+    Only snapshots whose counters changed since the latest one
+    stored are written. The latest counters of each repository
+    are kept in memory; `preload` loads the ones of a platform
+    with a single query.
+    """
+
+    def __init__(self):
+        self._snapshots = []
+        self._latest = {}
+        self._platforms = set()
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def add(self, repo, **values):
+        # Repositories without id were not stored yet
+        self._snapshots.append((repo, values, repo.id is None))
+
+    def preload(self, session, platform):
+        """Load the latest snapshots of the repositories of a platform"""
+
+        if platform.id is None or platform.id in self._platforms:
+            return
+
+        latest = session.query(func.max(RepositoryLog.id).label('id')).\
+            join(Repository, RepositoryLog.repo_id == Repository.id).\
+            join(Project, Repository.project_id == Project.id).\
+            filter(Project.platform_id == platform.id).\
+            group_by(RepositoryLog.repo_id).subquery()
+
+        self._load(session, latest)
+        self._platforms.add(platform.id)
+
+    def write(self, session):
+        """Insert the snapshots on the session transaction.
+
+        The session is flushed first, so new repositories
+        get their ids. Returns the number of rows inserted.
+        """
+        if not self._snapshots:
+            return 0
+
+        with timer('db.flush'):
+            session.flush()
+
+        # Stored repositories not preloaded yet
+        missing = set([repo.id for repo, _, new in self._snapshots
+                       if not new and repo.id not in self._latest])
+        self._load_repositories(session, list(missing))
+
+        rows = []
+
+        for repo, values, _ in self._snapshots:
+            metrics = tuple([values.get(m) for m in SNAPSHOT_METRICS])
+
+            if self._latest.get(repo.id) == metrics:
+                continue
+
+            # All the rows of an executemany must have the same keys
+            row = dict.fromkeys(SNAPSHOT_COLUMNS)
+            row.update(values)
+            row['repo_id'] = repo.id
+            rows.append(row)
+
+            self._latest[repo.id] = metrics
+
+        count('db.snapshots_unchanged', len(self._snapshots) - len(rows))
+
+        if rows:
+            with timer('db.snapshots'):
+                session.execute(RepositoryLog.__table__.insert(), rows)
+            count('db.snapshot_rows', len(rows))
+
+        self.clear()
+
+        return len(rows)
+
+    def clear(self):
+        self._snapshots = []
+
+    def reset(self):
+        """Discard the snapshots and the latest counters loaded"""
+
+        self.clear()
+        self._latest = {}
+        self._platforms = set()
+
+    def _load_repositories(self, session, repo_ids):
+        for i in range(0, len(repo_ids), LATEST_BULK_SIZE):
+            ids = repo_ids[i:i + LATEST_BULK_SIZE]
+
+            latest = session.query(func.max(RepositoryLog.id).label('id')).\
+                filter(RepositoryLog.repo_id.in_(ids)).\
+                group_by(RepositoryLog.repo_id).subquery()
+
+            self._load(session, latest)
+
+            # Repositories without snapshots
+            for repo_id in ids:
+                self._latest.setdefault(repo_id, None)
+
+    def _load(self, session, latest):
+        columns = [getattr(RepositoryLog, m) for m in SNAPSHOT_METRICS]
+
+        with timer('db.snapshots_preload'):
+            q = session.query(RepositoryLog.repo_id, *columns).\
+                join(latest, RepositoryLog.id == latest.c.id)
+
+            for row in q:
+                self._latest[row[0]] = tuple(row[1:])
+
+
+def snapshot_buffer(session):
+    """Return the buffer of snapshots of a session"""
+
+    buf = session.info.get('snapshot_buffer')
+
+    if buf is None:
+        session.info['snapshot_buffer'] = buf = SnapshotBuffer()
+    return buf
+
+
+def add_snapshot(session, repo, **values):
+    """Add a snapshot of a repository to the buffer of a session"""
+
+    snapshot_buffer(session).add(repo, **values)
+
+
+def preload_snapshots(session, platform):
+    """Load the latest snapshots of a platform on the buffer of a session"""
+
+    snapshot_buffer(session).preload(session, platform)
+
+
+def write_snapshots(session):
+    """Write the buffered snapshots of a session"""
+
+    return snapshot_buffer(session).write(session)
+
+
+def clear_snapshots(session):
+    """Discard the buffered snapshots of a session.
+
+    The latest counters are discarded too, because
+    they may have not been stored.
+    """
+    snapshot_buffer(session).reset()
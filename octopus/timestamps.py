@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import datetime
+import re
+
+import dateutil.parser
+
+from octopus.instrumentation import timed
+
+
+# Timestamps sent by the APIs, like '2014-05-14 04:41:21 -0700',
+# '2015-03-04T10:20:30Z' or '2015-03-04T10:20:30.123456+02:00'
+TIMESTAMP_PATTERN = re.compile(r"""
+    ^(\d{4})-(\d{2})-(\d{2})       # date
+    [T ](\d{2}):(\d{2}):(\d{2})    # time
+    (?:\.(\d{1,6})\d*)?            # fraction of a second
+    \s*(?:(Z)|([+-])(\d{2}):?(\d{2}))?$    # time zone
+    """, re.VERBOSE)
+
+
+@timed('timestamp.parse')
+def parse_timestamp(ts):
+    """Parse a timestamp, keeping its time zone.
+
+    Returns a tuple with the naive date and time as written on the
+    timestamp and its offset from UTC in seconds. The offset is None
+    when the timestamp does not include one.
+
+    Common ISO 8601 timestamps are parsed by a regular expression;
+    any other format is given to dateutil.
+    """
+    m = TIMESTAMP_PATTERN.match(ts)
+
+    if not m:
+        return _parse_any(ts)
+
+    year, month, day, hour, minute, second, fraction, utc, sign, tz_hours, tz_minutes = m.groups()
+
+    microsecond = int(fraction.ljust(6, '0')) if fraction else 0
+
+    try:
+        dt = datetime.datetime(int(year), int(month), int(day),
+                               int(hour), int(minute), int(second),
+                               microsecond)
+    except ValueError:
+        # Out of range values, like leap seconds
+        return _parse_any(ts)
+
+    if utc:
+        offset = 0
+    elif sign:
+        offset = int(tz_hours) * 3600 + int(tz_minutes) * 60
+
+        if sign == '-':
+            offset = -offset
+    else:
+        offset = None
+
+    return dt, offset
+
+
+def unmarshal_timestamp(ts):
+    """Parse a timestamp, returning its naive date and time"""
+
+    return parse_timestamp(ts)[0]
+
+
+def to_utc(dt, offset):
+    """Convert a naive date and time with an offset to UTC"""
+
+    if offset is None:
+        return dt
+    return dt - datetime.timedelta(seconds=offset)
+
+
+def _parse_any(ts):
+    dt = dateutil.parser.parse(ts)
+    utcoffset = dt.utcoffset()
+
+    if utcoffset is None:
+        offset = None
+    else:
+        offset = utcoffset.days * 86400 + utcoffset.seconds
+
+    return dt.replace(tzinfo=None), offset
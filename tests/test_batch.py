@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import json
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from sqlalchemy.exc import IntegrityError
+
+from octopus.batch import Batch, ProcessBatch, Target, read_manifest
+from octopus.instrumentation import count, get_profiler
+
+
+class TestReadManifest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filepath = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.filepath)
+
+    def _write(self, content):
+        with open(self.filepath, 'w') as f:
+            json.dump(content, f)
+
+    def test_read(self):
+        self._write([{'backend' : 'docker', 'url' : 'http://example.com', 'owner' : 'library'},
+                     {'backend' : 'github', 'owner' : 'octopus', 'gh_token' : 'XXXX'}])
+
+        targets = read_manifest(self.filepath)
+        self.assertEqual(2, len(targets))
+
+        self.assertEqual('docker', targets[0].backend)
+        self.assertEqual('library', targets[0].options['owner'])
+        self.assertEqual('docker http://example.com library', targets[0].name)
+
+        self.assertEqual('github', targets[1].backend)
+        self.assertEqual('XXXX', targets[1].options['gh_token'])
+
+    def test_invalid_manifest(self):
+        self._write({'backend' : 'docker'})
+        self.assertRaises(ValueError, read_manifest, self.filepath)
+
+        self._write([{'url' : 'http://example.com'}])
+        self.assertRaises(ValueError, read_manifest, self.filepath)
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_run(self):
+        targets = [Target('docker', url='http://example.com', owner=str(i))
+                   for i in range(6)]
+        targets.append(Target('gerrit', gerrit_url='review.example.com'))
+
+        lock = threading.Lock()
+        runs = []
+
+        def run_target(target):
+            with lock:
+                runs.append(target)
+            if target.options.get('owner') == '3':
+                raise Exception('Error')
+
+        results = Batch(targets, run_target, jobs=3).run()
+
+        self.assertEqual(7, len(results))
+        self.assertEqual(7, len(runs))
+        self.assertEqual(1, len([r for r in results if not r.ok]))
+
+        # First targets of each platform run before the rest
+        self.assertEqual(targets[0], runs[0])
+        self.assertEqual(targets[6], runs[1])
+
+    def test_retry_integrity_errors(self):
+        targets = [Target('docker', url='http://example.com', owner=str(i))
+                   for i in range(3)]
+        runs = []
+
+        def run_target(target):
+            runs.append(target)
+            if runs.count(target) == 1 and target.options['owner'] == '2':
+                raise IntegrityError('INSERT', {}, Exception('Duplicate'))
+
+        results = Batch(targets, run_target, jobs=2).run()
+
+        self.assertEqual(4, len(runs))
+        for result in results:
+            self.assertEqual(True, result.ok)
+
+
+class TestProcessBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+        self.profiler = get_profiler()
+        self.profiler.enabled = True
+        self.profiler.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+        self.profiler.enabled = False
+        self.profiler.reset()
+
+    def test_run(self):
+        """Check whether targets run on their own processes"""
+
+        targets = [Target(backend, url='http://example.com')
+                   for backend in ('docker', 'github', 'puppet', 'gerrit')]
+        parent = os.getpid()
+
+        def run_target(target):
+            if os.getpid() == parent:
+                raise Exception('Run by the main process')
+
+            count('targets')
+            time.sleep(0.5)
+
+            if target.backend == 'puppet':
+                raise Exception('Error')
+            elif target.backend == 'gerrit':
+                os._exit(3)
+
+        start = time.time()
+        results = ProcessBatch(targets, run_target, jobs=4).run()
+
+        # Backends of different platforms run at the same time
+        self.assertLess(time.time() - start, 1.5)
+
+        self.assertEqual([r.target for r in results], targets)
+        self.assertEqual([r.ok for r in results], [True, True, False, False])
+        self.assertEqual([r.exitcode for r in results], [0, 0, 1, 3])
+        self.assertEqual(str(results[2].error), 'Error')
+        self.assertEqual(str(results[3].error), 'process exited with status 3')
+
+        for result in results:
+            self.assertGreaterEqual(result.seconds, 0.5)
+
+        # Profiles of the processes that finished are merged
+        self.assertEqual(self.profiler.report()['counters'], {'targets' : 3})
+
+    def test_retry_integrity_errors(self):
+        """Check whether targets failed by integrity errors run again"""
+
+        targets = [Target('docker', url='http://example.com', owner=str(i))
+                   for i in range(3)]
+        marker = os.path.join(self.tmpdir, 'marker')
+
+        def run_target(target):
+            with open(os.path.join(self.tmpdir, target.options['owner']), 'a') as f:
+                f.write('run\n')
+
+            if target.options['owner'] == '2' and not os.path.exists(marker):
+                open(marker, 'w').close()
+                raise IntegrityError('INSERT', {}, Exception('Duplicate'))
+
+        results = ProcessBatch(targets, run_target, jobs=2).run()
+
+        for result in results:
+            self.assertEqual(True, result.ok)
+
+        with open(os.path.join(self.tmpdir, '2')) as f:
+            self.assertEqual(2, len(f.readlines()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import json
+import sys
+import unittest
+import urlparse
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from BaseHTTPServer import BaseHTTPRequestHandler
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from octopus.backends.docker import DockerRegistry, DOCKER_PAGE_SIZE
+from octopus.httpclient import HTTPClient
+from octopus.model import ModelBase, Repository
+
+from mock_http_server import MockHTTPServer
+
+
+# HTTP server configuration
+HTTP_HOST = 'localhost'
+HTTP_PORT = 9995
+MOCK_HTTP_SERVER_URL = 'http://' + HTTP_HOST + ':' + str(HTTP_PORT)
+
+# Number of repositories of the mock owner; the last page is not full
+NREPOS = 2 * DOCKER_PAGE_SIZE + 50
+
+
+class MockDockerHubHTTPHandler(BaseHTTPRequestHandler):
+    """Mock Docker Hub requests handler"""
+
+    def do_GET(self):
+        parts = urlparse.urlparse(self.path)
+
+        if parts.path == '/u/library':
+            self.send_json({})
+            return
+
+        qs = urlparse.parse_qs(parts.query)
+        page = int(qs['page'][0])
+        page_size = int(qs['page_size'][0])
+
+        self.server.pages.append(page)
+
+        if page == self.server.failed_page:
+            self.send_error(500, 'Internal error')
+            return
+
+        start = (page - 1) * page_size
+        end = min(start + page_size, NREPOS)
+
+        results = [{'name' : 'repo%s' % i,
+                    'star_count' : i,
+                    'pull_count' : i * 10}
+                   for i in range(start, end)]
+        next_url = self.path if end < NREPOS else None
+
+        self.send_json({'count' : NREPOS,
+                        'next' : next_url,
+                        'results' : results})
+
+    def send_json(self, data):
+        body = json.dumps(data)
+
+        self.send_response(200, 'Ok')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestDockerRegistry(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = MockHTTPServer(HTTP_HOST, HTTP_PORT, None,
+                                   MockDockerHubHTTPHandler)
+        cls.httpd.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.stop()
+
+    def setUp(self):
+        self.httpd.pages = []
+        self.httpd.failed_page = None
+
+    def _fetch(self, jobs):
+        engine = create_engine('sqlite://')
+        ModelBase.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+
+        backend = DockerRegistry(session, MOCK_HTTP_SERVER_URL, 'library',
+                                 client=HTTPClient(), jobs=jobs)
+        platform = backend.fetch()
+        session.add(platform)
+        session.commit()
+
+        return [(r.name, r.starred, r.pulls)
+                for r in session.query(Repository).order_by(Repository.id)]
+
+    def test_fetch_concurrently(self):
+        """Check whether pages fetched by workers are stored in order"""
+
+        repos = self._fetch(jobs=3)
+
+        self.assertEqual(sorted(self.httpd.pages), [1, 2, 3])
+        self.assertEqual(len(repos), NREPOS)
+        self.assertEqual(repos[-1], ('repo249', 249, 2490))
+
+        self.httpd.pages = []
+        self.assertEqual(self._fetch(jobs=1), repos)
+        self.assertEqual(self.httpd.pages, [1, 2, 3])
+
+    def test_failed_page(self):
+        """Check whether an error on a page fetched by a worker is raised"""
+
+        self.httpd.failed_page = 2
+
+        self.assertRaisesRegexp(Exception, 'Docker - repositories library',
+                                self._fetch, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
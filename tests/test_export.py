@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import datetime
+import json
+import sys
+import unittest
+import StringIO
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from octopus.export import JSON_LINES, CSV, export
+from octopus.model import ModelBase, Platform, Project
+from octopus.query import PlatformQuery
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        ModelBase.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+
+        platform = Platform(url='http://example.com', type='puppet')
+        other = Platform(url='http://example.org', type='puppet')
+
+        for i in range(5):
+            Project(name=u'prj%s' % i, url='http://example.com/p/%s' % i,
+                    created_on=datetime.datetime(2014, 5, 14, 4, 41, i),
+                    platform=platform)
+        Project(name=u'other', url='http://example.org/p/1', platform=other)
+
+        self.session.add_all([platform, other])
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_json_lines(self):
+        query = PlatformQuery(self.session, Project, 'puppet', 'http://example.com')
+        output = StringIO.StringIO()
+
+        nrows = export(query, output, JSON_LINES, batch_size=2)
+        self.assertEqual(5, nrows)
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual(5, len(lines))
+
+        project = json.loads(lines[0])
+        self.assertEqual('prj0', project['name'])
+        self.assertEqual('2014-05-14T04:41:00', project['created_on'])
+
+    def test_csv(self):
+        query = PlatformQuery(self.session, Project, 'puppet')
+        output = StringIO.StringIO()
+
+        nrows = export(query, output, CSV, batch_size=4)
+        self.assertEqual(6, nrows)
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual(7, len(lines))
+        self.assertEqual('id,name,url,created_on,created_on_tz,updated_on,updated_on_tz,platform_id',
+                         lines[0])
+        self.assertEqual('6,other,http://example.org/p/1,,,,,2', lines[6])
+
+    def test_other_platform_type(self):
+        query = PlatformQuery(self.session, Project, 'docker')
+        output = StringIO.StringIO()
+
+        nrows = export(query, output, JSON_LINES)
+        self.assertEqual(0, nrows)
+        self.assertEqual('', output.getvalue())
+
+    def test_unknown_format(self):
+        query = PlatformQuery(self.session, Project, 'puppet')
+        self.assertRaises(ValueError, export, query, StringIO.StringIO(), 'xml')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import json
+import os
+import shutil
+import stat
+import StringIO
+import sys
+import tempfile
+import time
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from octopus.backends.gerrit import Gerrit, iter_json_object
+from octopus.model import ModelBase, Platform, GerritRepository
+
+
+# Fake ssh command. It logs its arguments and writes the projects
+# of the server slowly, in small pieces, like a remote command.
+FAKE_SSH = """#!%(python)s
+import json, os, sys, time
+
+args = sys.argv[1:]
+
+with open(os.environ['FAKE_SSH_LOG'], 'a') as f:
+    f.write(json.dumps(args) + '\\n')
+
+host = args[-5]
+
+if host == 'broken.example.com':
+    sys.stderr.write('Connection refused\\n')
+    sys.exit(255)
+
+projects = json.load(open(os.path.join(os.environ['FAKE_SSH_DATA'], host)))
+output = json.dumps(projects, indent=2)
+
+time.sleep(float(os.environ.get('FAKE_SSH_DELAY', 0)))
+
+for i in range(0, len(output), 7):
+    sys.stdout.write(output[i:i + 7])
+    sys.stdout.flush()
+"""
+
+
+class ChunkedStream(object):
+    """Stream that returns a few bytes on each read"""
+
+    def __init__(self, data, size):
+        self.stream = StringIO.StringIO(data)
+        self.size = size
+
+    def read(self, size):
+        return self.stream.read(min(size, self.size))
+
+
+class TestIterJSONObject(unittest.TestCase):
+
+    def test_members(self):
+        """Check whether members are decoded from any kind of chunks"""
+
+        data = '{"All-Projects": {"id": "All-Projects"}, "a/b": {"id": "a%2Fb"},' \
+               ' "c\\u00f1": {}, "n": 10, "t": true}\n'
+
+        for size in (1, 2, 5, 1024):
+            members = list(iter_json_object(ChunkedStream(data, size)))
+            self.assertEqual(members, [(u'All-Projects', {u'id' : u'All-Projects'}),
+                                       (u'a/b', {u'id' : u'a%2Fb'}),
+                                       (u'c\xf1', {}),
+                                       (u'n', 10),
+                                       (u't', True)])
+
+    def test_empty(self):
+        """Check whether empty objects are decoded"""
+
+        self.assertEqual(list(iter_json_object(StringIO.StringIO(' {}\n'))), [])
+
+    def test_invalid(self):
+        """Check whether errors are raised for invalid data"""
+
+        for data in ('', '[1, 2]', '{"a": 1', '{"a" 1}', '{1: 2}', '{"a": 1,}'):
+            stream = ChunkedStream(data, 2)
+            self.assertRaises(ValueError, list, iter_json_object(stream))
+
+
+class TestGerrit(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+        bindir = os.path.join(self.tmpdir, 'bin')
+        datadir = os.path.join(self.tmpdir, 'data')
+        os.mkdir(bindir)
+        os.mkdir(datadir)
+
+        ssh = os.path.join(bindir, 'ssh')
+
+        with open(ssh, 'w') as f:
+            f.write(FAKE_SSH % {'python' : sys.executable})
+        os.chmod(ssh, stat.S_IRWXU)
+
+        for i in range(4):
+            host = 'gerrit%s.example.com' % i
+            projects = dict([(name, {'id' : name})
+                             for name in ['All-Projects'] + ['%s/p%s' % (host, j)
+                                                             for j in range(i + 1)]])
+            self._write_projects(host, projects)
+
+        self.environ = os.environ.copy()
+        os.environ['PATH'] = bindir + os.pathsep + os.environ['PATH']
+        os.environ['FAKE_SSH_LOG'] = os.path.join(self.tmpdir, 'ssh.log')
+        os.environ['FAKE_SSH_DATA'] = datadir
+
+        engine = create_engine('sqlite://')
+        ModelBase.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tmpdir)
+
+    def _write_projects(self, host, projects):
+        with open(os.path.join(self.tmpdir, 'data', host), 'w') as f:
+            json.dump(projects, f)
+
+    def _ssh_calls(self):
+        with open(os.environ['FAKE_SSH_LOG']) as f:
+            return [json.loads(line) for line in f]
+
+    def _names(self, url):
+        q = self.session.query(GerritRepository.name).join(Platform)
+        q = q.filter(Platform.url == url)
+        return sorted([name for name, in q])
+
+    def backend(self, urls, **kwargs):
+        return Gerrit(self.session, 'octopus', urls,
+                      control_dir=os.path.join(self.tmpdir, 'ssh'), **kwargs)
+
+    def test_fetch(self):
+        """Check whether projects are listed using a master connection"""
+
+        platform = self.backend('gerrit1.example.com').fetch()
+        self.session.commit()
+
+        self.assertEqual(platform.url, 'gerrit1.example.com')
+        self.assertEqual(platform.type, 'gerrit')
+        self.assertEqual(self._names('gerrit1.example.com'),
+                         ['All-Projects', 'gerrit1.example.com/p0',
+                          'gerrit1.example.com/p1'])
+
+        control_path = os.path.join(self.tmpdir, 'ssh', '%C')
+
+        calls = self._ssh_calls()
+        self.assertEqual(calls, [['-p', '29418', '-o', 'BatchMode=yes',
+                                  '-l', 'octopus',
+                                  '-o', 'ControlMaster=auto',
+                                  '-o', 'ControlPath=' + control_path,
+                                  '-o', 'ControlPersist=600',
+                                  'gerrit1.example.com',
+                                  'gerrit', 'ls-projects', '--format', 'JSON']])
+        self.assertTrue(os.path.isdir(os.path.join(self.tmpdir, 'ssh')))
+
+    def test_fetch_again(self):
+        """Check whether new projects are added and missing ones deleted"""
+
+        self.backend('gerrit1.example.com').fetch()
+        self.session.commit()
+
+        self._write_projects('gerrit1.example.com',
+                             {'All-Projects' : {}, 'gerrit1.example.com/p1' : {},
+                              'new' : {}})
+
+        self.backend('gerrit1.example.com', control_persist=0).fetch()
+        self.session.commit()
+
+        self.assertEqual(self._names('gerrit1.example.com'),
+                         ['All-Projects', 'gerrit1.example.com/p1', 'new'])
+
+        # Master connections were disabled
+        self.assertNotIn('ControlMaster=auto', self._ssh_calls()[1])
+
+    def test_fetch_servers(self):
+        """Check whether several servers are listed at the same time"""
+
+        os.environ['FAKE_SSH_DELAY'] = '0.5'
+
+        urls = ['gerrit%s.example.com' % i for i in range(4)]
+
+        start = time.time()
+        platform = self.backend(urls, jobs=4).fetch()
+        self.session.commit()
+
+        self.assertLess(time.time() - start, 1.5)
+
+        self.assertEqual(platform.url, urls[0])
+        self.assertEqual(self.session.query(Platform).count(), 4)
+
+        for i, url in enumerate(urls):
+            self.assertEqual(len(self._names(url)), i + 2)
+
+    def test_ssh_error(self):
+        """Check whether servers are updated when others cannot be listed"""
+
+        broken = Platform(url='broken.example.com', type='gerrit')
+        self.session.add(GerritRepository(name='stored', platform=broken))
+        self.session.commit()
+
+        urls = ['broken.example.com', 'gerrit1.example.com', 'gerrit2.example.com']
+        backend = self.backend(urls, jobs=2)
+        platform = backend.fetch()
+        self.session.commit()
+
+        self.assertEqual(platform.url, 'gerrit1.example.com')
+        self.assertEqual(backend.errors,
+                         ['Gerrit - broken.example.com. Error: Connection refused'])
+
+        self.assertEqual(len(self._names('gerrit1.example.com')), 3)
+        self.assertEqual(len(self._names('gerrit2.example.com')), 4)
+        self.assertEqual(self._names('broken.example.com'), ['stored'])
+
+    def test_all_servers_fail(self):
+        """Check whether an error is raised when no server is listed"""
+
+        backend = self.backend(['broken.example.com'])
+        self.assertRaisesRegexp(Exception, 'broken.example.com. Error: Connection refused',
+                                backend.fetch)
+
+    def test_existing_control_dir(self):
+        """Check whether control directories created by others are used"""
+
+        os.makedirs(os.path.join(self.tmpdir, 'ssh'))
+
+        self.backend('gerrit1.example.com').fetch()
+        self.assertEqual(len(self._ssh_calls()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
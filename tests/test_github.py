@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import json
+import sys
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from BaseHTTPServer import BaseHTTPRequestHandler
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from octopus.backends.github import GitHubPlatform
+from octopus.httpclient import HTTPClient
+from octopus.model import ModelBase, Platform, Project, Repository,\
+    RepositoryLog
+from octopus.snapshots import write_snapshots
+
+from mock_http_server import MockHTTPServer
+
+
+# HTTP server configuration
+HTTP_HOST = 'localhost'
+HTTP_PORT = 9996
+MOCK_HTTP_SERVER_URL = 'http://' + HTTP_HOST + ':' + str(HTTP_PORT) + '/'
+
+# Number of repositories of the mock organization
+NREPOS = 150
+
+
+class MockGraphQLHTTPHandler(BaseHTTPRequestHandler):
+    """Mock GitHub GraphQL endpoint"""
+
+    def do_POST(self):
+        length = int(self.headers.getheader('Content-Length'))
+        request = json.loads(self.rfile.read(length))
+        self.server.requests.append((self.path,
+                                     self.headers.getheader('Authorization'),
+                                     request['variables']))
+
+        variables = request['variables']
+
+        if variables['owner'] != 'octopus':
+            data = {'organization' : None}
+        elif 'name' in variables:
+            data = {'organization' : {'url' : 'https://github.com/octopus'},
+                    'repository' : self.node(int(variables['name'][4:]))}
+        else:
+            data = {'organization' : self.organization(variables)}
+
+        body = json.dumps({'data' : data})
+
+        self.send_response(200, 'Ok')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def organization(self, variables):
+        start = int(variables['cursor'] or 0)
+        end = min(start + variables['first'], NREPOS)
+
+        return {'url' : 'https://github.com/octopus',
+                'repositories' : {'pageInfo' : {'hasNextPage' : end < NREPOS,
+                                                'endCursor' : str(end)},
+                                  'nodes' : [self.node(i) for i in range(start, end)]}}
+
+    def node(self, i):
+        # Starred repositories got a new star
+        stars = i + 1 if i in self.server.starred else i
+
+        return {'name' : 'repo%s' % i,
+                'url' : 'https://github.com/octopus/repo%s' % i,
+                'stargazers' : {'totalCount' : stars},
+                'forkCount' : i * 2,
+                'watchers' : {'totalCount' : i * 3}}
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestGitHubGraphQL(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = MockHTTPServer(HTTP_HOST, HTTP_PORT, None,
+                                   MockGraphQLHTTPHandler)
+        cls.httpd.requests = []
+        cls.httpd.starred = set()
+        cls.httpd.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.stop()
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        ModelBase.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.httpd.requests[:] = []
+        self.httpd.starred.clear()
+
+    def backend(self, owner='octopus', repository=None):
+        return GitHubPlatform(self.session, owner, repository,
+                              url=MOCK_HTTP_SERVER_URL, oauth_token='TOKEN',
+                              client=HTTPClient(), graphql=True)
+
+    def test_fetch(self):
+        """Check whether repositories are fetched in pages of 100"""
+
+        platform = self.backend().fetch()
+        self.session.commit()
+
+        self.assertEqual(len(self.httpd.requests), 2)
+
+        path, auth, variables = self.httpd.requests[1]
+        self.assertEqual(path, '/api/graphql')
+        self.assertEqual(auth, 'bearer TOKEN')
+        self.assertEqual(variables['first'], 100)
+        self.assertEqual(variables['cursor'], '100')
+
+        project = self.session.query(Project).one()
+        self.assertEqual(project.url, 'https://github.com/octopus')
+        self.assertEqual(project.name, 'octopus')
+        self.assertEqual(project.platform, platform)
+
+        repos = self.session.query(Repository).order_by(Repository.id).all()
+        self.assertEqual(len(repos), NREPOS)
+
+        repo = repos[120]
+        self.assertEqual(repo.name, 'repo120')
+        self.assertEqual(repo.url, 'https://github.com/octopus/repo120')
+        self.assertEqual(repo.clone_url, 'https://github.com/octopus/repo120.git')
+        self.assertEqual(repo.type, 'git')
+        self.assertEqual(repo.starred, 120)
+        self.assertEqual(repo.forks, 240)
+        # Watchers are the stargazers, like on the REST API
+        self.assertEqual(repo.watchers, 120)
+        self.assertEqual(repo.project, project)
+
+    def test_fetch_again(self):
+        """Check whether stored repositories are updated"""
+
+        self.backend().fetch()
+        self.session.commit()
+
+        self.backend().fetch()
+        self.session.commit()
+
+        self.assertEqual(self.session.query(Platform).count(), 1)
+        self.assertEqual(self.session.query(Repository).count(), NREPOS)
+
+    def test_snapshots(self):
+        """Check whether snapshots are only written when counters change"""
+
+        self.backend().fetch()
+        write_snapshots(self.session)
+        self.session.commit()
+
+        self.assertEqual(self.session.query(RepositoryLog).count(), NREPOS)
+
+        log = self.session.query(RepositoryLog).filter(RepositoryLog.id == 121).one()
+        self.assertEqual(log.repository.name, 'repo120')
+        self.assertEqual((log.starred, log.forks, log.watchers), (120, 240, 120))
+        self.assertEqual(log.pulls, None)
+
+        # Next run, with the latest snapshots preloaded
+        self.httpd.starred.update([3, 120])
+        self.session = sessionmaker(bind=self.engine)()
+
+        self.backend().fetch()
+        write_snapshots(self.session)
+        self.session.commit()
+
+        logs = self.session.query(RepositoryLog).filter(RepositoryLog.id > NREPOS).\
+            order_by(RepositoryLog.id).all()
+        self.assertEqual([l.repository.name for l in logs], ['repo3', 'repo120'])
+        self.assertEqual([l.starred for l in logs], [4, 121])
+
+    def test_fetch_repository(self):
+        """Check whether a single repository is fetched"""
+
+        self.backend(repository='repo7').fetch()
+        self.session.commit()
+
+        self.assertEqual(len(self.httpd.requests), 1)
+
+        repo = self.session.query(Repository).one()
+        self.assertEqual(repo.name, 'repo7')
+        self.assertEqual(repo.forks, 14)
+
+    def test_unknown_organization(self):
+        """Check whether an error is raised for unknown organizations"""
+
+        backend = self.backend(owner='unknown')
+        self.assertRaisesRegexp(Exception, 'organization unknown does not exist',
+                                backend.fetch)
+
+
+if __name__ == "__main__":
+    unittest.main()
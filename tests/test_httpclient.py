@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from BaseHTTPServer import BaseHTTPRequestHandler
+
+import requests
+
+from octopus.httpcache import HTTPCache
+from octopus.httpclient import DEFAULT_TIMEOUT, HTTPClient, USER_AGENT,\
+    get_client, make_timeout, set_client
+
+from mock_http_server import MockHTTPServer
+
+
+# HTTP server configuration
+HTTP_HOST = 'localhost'
+HTTP_PORT = 9997
+MOCK_HTTP_SERVER_URL = 'http://' + HTTP_HOST + ':' + str(HTTP_PORT)
+
+
+class MockEchoHTTPHandler(BaseHTTPRequestHandler):
+    """Returns the User-Agent of the request in the body"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = self.headers.getheader('User-Agent')
+
+        self.send_response(200, 'Ok')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockETagHTTPHandler(BaseHTTPRequestHandler):
+    """Returns a body of 1000 bytes tagged by its path"""
+
+    protocol_version = 'HTTP/1.1'
+    requests = []
+
+    def do_GET(self):
+        etag = '"' + self.path + '"'
+        self.requests.append((self.path, self.headers.getheader('If-None-Match')))
+
+        if self.headers.getheader('If-None-Match') == etag:
+            self.send_response(304, 'Not Modified')
+            self.send_header('X-Mock', 'not-modified')
+            self.end_headers()
+            return
+
+        body = (self.path * 1000)[:1000]
+
+        self.send_response(200, 'Ok')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHTTPClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = MockHTTPServer(HTTP_HOST, HTTP_PORT, None,
+                                   MockEchoHTTPHandler)
+        cls.httpd.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.stop()
+
+    def test_user_agent(self):
+        client = HTTPClient()
+
+        r = client.get(MOCK_HTTP_SERVER_URL)
+        self.assertEqual(USER_AGENT, r.text)
+
+    def test_default_timeout(self):
+        client = HTTPClient(timeout=5)
+        self.assertEqual(5, client.adapter.timeout)
+
+    def test_make_timeout(self):
+        # The command line default is the same as the library one
+        self.assertEqual(DEFAULT_TIMEOUT, make_timeout())
+        self.assertEqual(DEFAULT_TIMEOUT, HTTPClient().adapter.timeout)
+
+        self.assertEqual((10, 120), make_timeout(120))
+        self.assertEqual((5, 5), make_timeout(5))
+
+    def test_pool_size(self):
+        client = HTTPClient(max_connections=4)
+        self.assertEqual(4, client.adapter._pool_maxsize)
+        self.assertEqual(True, client.adapter._pool_block)
+
+    def test_mount(self):
+        client = HTTPClient()
+        session = requests.Session()
+        client.mount(session)
+
+        self.assertEqual(client.adapter, session.get_adapter(MOCK_HTTP_SERVER_URL))
+        self.assertEqual(USER_AGENT, session.headers['User-Agent'])
+
+        r = session.get(MOCK_HTTP_SERVER_URL)
+        self.assertEqual(USER_AGENT, r.text)
+
+    def test_shared_client(self):
+        client = HTTPClient()
+        set_client(client)
+        self.assertEqual(client, get_client())
+
+        set_client(None)
+        self.assertIsInstance(get_client(), HTTPClient)
+        self.assertNotEqual(client, get_client())
+
+
+class TestHTTPCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = MockHTTPServer(HTTP_HOST, HTTP_PORT, None,
+                                   MockETagHTTPHandler)
+        cls.httpd.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.stop()
+
+    def setUp(self):
+        self.dirpath = tempfile.mkdtemp()
+        del MockETagHTTPHandler.requests[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.dirpath)
+
+    def test_not_modified(self):
+        cache = HTTPCache(self.dirpath)
+        client = HTTPClient(cache=cache)
+
+        r = client.get(MOCK_HTTP_SERVER_URL + '/a')
+        self.assertEqual(200, r.status_code)
+        self.assertEqual(1000, cache.size)
+
+        r = client.get(MOCK_HTTP_SERVER_URL + '/a')
+        self.assertEqual(200, r.status_code)
+        self.assertEqual(('/a' * 500), r.text)
+        self.assertEqual('not-modified', r.headers['X-Mock'])
+        self.assertEqual('text/plain', r.headers['Content-Type'])
+        self.assertEqual(True, r.from_cache)
+
+        expected = [('/a', None), ('/a', '"/a"')]
+        self.assertListEqual(expected, MockETagHTTPHandler.requests)
+
+    def test_missing_body(self):
+        cache = HTTPCache(self.dirpath)
+        client = HTTPClient(cache=cache)
+
+        client.get(MOCK_HTTP_SERVER_URL + '/a')
+
+        for name in os.listdir(self.dirpath):
+            if name.endswith('.body'):
+                os.remove(os.path.join(self.dirpath, name))
+
+        # The server replies 304, so the request is sent again
+        r = client.get(MOCK_HTTP_SERVER_URL + '/a')
+        self.assertEqual(200, r.status_code)
+        self.assertEqual(('/a' * 500), r.text)
+        self.assertEqual(False, getattr(r, 'from_cache', False))
+
+        expected = [('/a', None), ('/a', '"/a"'), ('/a', None)]
+        self.assertListEqual(expected, MockETagHTTPHandler.requests)
+
+        # The response was stored again
+        self.assertEqual(1000, cache.size)
+        r = client.get(MOCK_HTTP_SERVER_URL + '/a')
+        self.assertEqual(True, r.from_cache)
+
+    def test_persistent_cache(self):
+        client = HTTPClient(cache=HTTPCache(self.dirpath))
+        client.get(MOCK_HTTP_SERVER_URL + '/a')
+
+        cache = HTTPCache(self.dirpath)
+        self.assertEqual(1000, cache.size)
+
+        client = HTTPClient(cache=cache)
+        r = client.get(MOCK_HTTP_SERVER_URL + '/a')
+        self.assertEqual(True, r.from_cache)
+
+    def test_eviction(self):
+        cache = HTTPCache(self.dirpath, max_size=2500)
+        client = HTTPClient(cache=cache)
+
+        for path in ('/a', '/b', '/c'):
+            client.get(MOCK_HTTP_SERVER_URL + path)
+
+        # The least recently used response was removed
+        self.assertEqual(2000, cache.size)
+
+        del MockETagHTTPHandler.requests[:]
+        client.get(MOCK_HTTP_SERVER_URL + '/a')
+        client.get(MOCK_HTTP_SERVER_URL + '/c')
+
+        expected = [('/a', None), ('/c', '"/c"')]
+        self.assertListEqual(expected, MockETagHTTPHandler.requests)
+
+
+    def test_shared_eviction(self):
+        """Check whether entries stored by other processes are evicted"""
+
+        cache = HTTPCache(self.dirpath, max_size=2500)
+        other = HTTPCache(self.dirpath, max_size=2500)
+
+        client = HTTPClient(cache=cache)
+        client.get(MOCK_HTTP_SERVER_URL + '/a')
+        client.get(MOCK_HTTP_SERVER_URL + '/b')
+
+        # The mock server handles a single connection at a time
+        client.session.close()
+        other_client = HTTPClient(cache=other)
+        other_client.get(MOCK_HTTP_SERVER_URL + '/c')
+        other_client.session.close()
+
+        # Bodies written by the other cache are counted too
+        client.get(MOCK_HTTP_SERVER_URL + '/d')
+        self.assertEqual(2000, cache.size)
+        self.assertEqual(2000, HTTPCache(self.dirpath).size)
+
+    def test_evicted_by_others(self):
+        """Check whether bodies removed while evicting are skipped"""
+
+        class RacingHTTPCache(HTTPCache):
+            # Lists a body that another process has just removed
+            def _bodies(self):
+                bodies = super(RacingHTTPCache, self)._bodies()
+                return bodies + [os.path.join(self.dirpath, 'removed.body')]
+
+        cache = RacingHTTPCache(self.dirpath, max_size=2500)
+        client = HTTPClient(cache=cache)
+
+        for path in ('/a', '/b', '/c'):
+            r = client.get(MOCK_HTTP_SERVER_URL + path)
+            self.assertEqual(200, r.status_code)
+
+        self.assertEqual(2000, cache.size)
+
+if __name__ == "__main__":
+    unittest.main()
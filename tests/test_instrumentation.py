@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from octopus.instrumentation import Profiler
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_disabled(self):
+        """Check whether nothing is recorded while disabled"""
+
+        profiler = Profiler()
+
+        with profiler.timer('fetch'):
+            pass
+        profiler.count('requests')
+
+        self.assertEqual(profiler.report(), {'timers' : {}, 'counters' : {}})
+
+    def test_timers_and_counters(self):
+        """Check the values of timers and counters"""
+
+        profiler = Profiler()
+        profiler.enabled = True
+
+        with profiler.timer('fetch'):
+            pass
+        profiler.add_time('fetch', 2.0)
+        profiler.add_time('fetch', 1.0)
+
+        profiler.count('requests')
+        profiler.count('requests', 4)
+
+        report = profiler.report()
+
+        self.assertEqual(report['timers']['fetch']['calls'], 3)
+        self.assertAlmostEqual(report['timers']['fetch']['total'], 3.0, places=2)
+        self.assertEqual(report['timers']['fetch']['max'], 2.0)
+        self.assertEqual(report['counters'], {'requests' : 5})
+
+        table = profiler.format_table()
+        self.assertIn('fetch', table)
+        self.assertIn('requests', table)
+
+        profiler.reset()
+        self.assertEqual(profiler.report(), {'timers' : {}, 'counters' : {}})
+
+    def test_timer_on_errors(self):
+        """Check whether calls that fail are timed too"""
+
+        profiler = Profiler()
+        profiler.enabled = True
+
+        def fail():
+            with profiler.timer('store'):
+                raise ValueError
+
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(profiler.report()['timers']['store']['calls'], 1)
+
+    def test_write_json(self):
+        """Check whether the report is written as JSON"""
+
+        profiler = Profiler()
+        profiler.enabled = True
+        profiler.count('requests', 2)
+
+        tmpdir = tempfile.mkdtemp()
+        filepath = os.path.join(tmpdir, 'profile.json')
+
+        try:
+            profiler.write_json(filepath)
+
+            with open(filepath) as f:
+                report = json.load(f)
+        finally:
+            shutil.rmtree(tmpdir)
+
+        self.assertEqual(report['counters'], {'requests' : 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from StringIO import StringIO
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from octopus.database import POOL_MAX_OVERFLOW, POOL_RECYCLE, POOL_SIZE
+from octopus.httpclient import POOL_MAX_CONNECTIONS
+from octopus.instrumentation import get_profiler
+from octopus.main import main, parse_args
+
+
+class TestMainBatch(unittest.TestCase):
+    """Exit status of batch runs"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.argv = sys.argv
+
+    def tearDown(self):
+        sys.argv = self.argv
+        shutil.rmtree(self.tmpdir)
+
+    def _run(self, targets, *options, **kwargs):
+        manifest = os.path.join(self.tmpdir, 'manifest.json')
+
+        with open(manifest, 'w') as f:
+            json.dump(targets, f)
+
+        db_url = 'sqlite:///' + os.path.join(self.tmpdir, 'octopus.db')
+        sys.argv = ['octopus', '--db-url', db_url] + kwargs.get('global_options', []) + \
+            ['batch'] + list(options) + [manifest]
+
+        return main()
+
+    def test_failed_targets(self):
+        """Check whether a batch with failed targets exits with an error"""
+
+        status = self._run([{'backend' : 'unknown'}])
+        self.assertEqual(status, 1)
+
+    def test_failed_processes(self):
+        """Check whether targets failed on other processes make the batch fail"""
+
+        targets = [{'backend' : 'unknown', 'url' : 'http://example.com/%s' % i}
+                   for i in range(2)]
+
+        status = self._run(targets, '--processes', '--jobs', '2')
+        self.assertEqual(status, 1)
+
+    def test_empty_batch(self):
+        """Check whether a batch without failures exits without errors"""
+
+        self.assertEqual(self._run([]), 0)
+
+    def test_resume_without_commits(self):
+        """Check whether targets resumed without checkpoints are rejected"""
+
+        targets = [{'backend' : 'unknown', 'resume' : True}]
+        self.assertRaises(ValueError, self._run, targets)
+
+        # Commit options may be set on the target or for the whole batch
+        targets = [{'backend' : 'unknown', 'resume' : True, 'commit_every' : 10}]
+        self.assertEqual(self._run(targets), 1)
+
+        targets = [{'backend' : 'unknown', 'resume' : True}]
+        self.assertEqual(self._run(targets, global_options=['--commit-every', '10']), 1)
+
+    def test_profile_table(self):
+        """Check whether the profile table is not written to stdout"""
+
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO(), StringIO()
+
+        try:
+            self._run([], global_options=['--profile'])
+            output, errors = sys.stdout.getvalue(), sys.stderr.getvalue()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+            get_profiler().enabled = False
+
+        table = get_profiler().format_table()
+        self.assertNotIn(table, output)
+        self.assertEqual(errors, table + '\n')
+
+
+class TestMainArguments(unittest.TestCase):
+    """Defaults of the command line options"""
+
+    def setUp(self):
+        self.argv = sys.argv
+
+    def tearDown(self):
+        sys.argv = self.argv
+
+    def test_library_defaults(self):
+        """Check whether defaults are the ones of the library"""
+
+        sys.argv = ['octopus', 'rollup']
+        args = parse_args()
+
+        self.assertEqual(args.db_pool_size, POOL_SIZE)
+        self.assertEqual(args.db_max_overflow, POOL_MAX_OVERFLOW)
+        self.assertEqual(args.db_pool_recycle, POOL_RECYCLE)
+        self.assertEqual(args.http_connections, POOL_MAX_CONNECTIONS)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import sys
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from sqlalchemy import create_engine, inspect
+
+from octopus.migrations import MIGRATIONS, migrate, schema_version,\
+    schema_version_table
+from octopus.model import ModelBase, RepositoryLog
+
+
+def index_names(engine, table):
+    return [index['name'] for index in inspect(engine).get_indexes(table)]
+
+
+class TestMigrate(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+
+    def test_migrate_old_schema(self):
+        """Check whether missing indexes are created on old schemas"""
+
+        ModelBase.metadata.create_all(self.engine)
+
+        # Schemas created by previous versions have no indexes
+        for table in ModelBase.metadata.tables.values():
+            for index in table.indexes:
+                index.drop(self.engine)
+
+        self.assertNotIn('_repo_log_date_idx',
+                         index_names(self.engine, 'repositories_log'))
+
+        migrate(self.engine)
+
+        self.assertIn('_repo_log_date_idx',
+                      index_names(self.engine, 'repositories_log'))
+        self.assertIn('_release_project_date_idx',
+                      index_names(self.engine, 'releases'))
+        self.assertIn('_project_platform_idx',
+                      index_names(self.engine, 'projects'))
+        self.assertIn('_projects_users_idx',
+                      index_names(self.engine, 'projects_users'))
+
+        conn = self.engine.connect()
+        self.assertEqual(schema_version(conn), MIGRATIONS[-1][0])
+        conn.close()
+
+    def test_migrate_timezones(self):
+        """Check whether time zone columns are added to old schemas"""
+
+        ModelBase.metadata.create_all(self.engine)
+
+        # Old schemas store the dates without their offset
+        self.engine.execute('CREATE TABLE old_releases AS SELECT id, name, '
+                            'version, url, file_url, created_on, updated_on, '
+                            'author_id, project_id FROM releases')
+        self.engine.execute('DROP TABLE releases')
+        self.engine.execute('ALTER TABLE old_releases RENAME TO releases')
+
+        migrate(self.engine)
+
+        columns = [c['name'] for c in inspect(self.engine).get_columns('releases')]
+        self.assertIn('created_on_tz', columns)
+        self.assertIn('updated_on_tz', columns)
+
+        columns = [c['name'] for c in inspect(self.engine).get_columns('projects')]
+        self.assertIn('updated_on_tz', columns)
+
+    def test_migrate_new_schema(self):
+        """Check whether new schemas are only stamped"""
+
+        ModelBase.metadata.create_all(self.engine)
+        migrate(self.engine)
+
+        # Running it again does nothing
+        migrate(self.engine)
+
+        conn = self.engine.connect()
+        rows = conn.execute(schema_version_table.select()).fetchall()
+        conn.close()
+
+        self.assertEqual(len(rows), len(MIGRATIONS))
+        self.assertEqual(index_names(self.engine, 'repositories_log'),
+                         ['_repo_log_date_idx'])
+
+
+if __name__ == "__main__":
+    unittest.main()
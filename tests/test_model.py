@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import sys
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from octopus.model import UNIQUE_BULK_SIZE, ModelBase, Platform, Project, Release, User
+
+
+class TestUniqueObject(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        ModelBase.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+
+        self.platform = Platform(url='http://example.com', type='test')
+        self.session.add(self.platform)
+        self.session.add(User(username='jsmith'))
+        self.session.add(Release(url='http://example.com/r/1'))
+        self.session.commit()
+
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+
+    def tearDown(self):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+        self.session.close()
+
+    def _count(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def test_as_unique(self):
+        user = User.as_unique(self.session, username='jsmith')
+        self.assertIsNotNone(user.id)
+        self.assertEqual(1, len(self.statements))
+
+        # The second time, the object is not requested to the database
+        self.assertEqual(user, User.as_unique(self.session, username='jsmith'))
+        self.assertEqual(1, len(self.statements))
+
+        user = User.as_unique(self.session, username='jdoe')
+        self.assertIsNone(user.id)
+        self.assertEqual(user, User.as_unique(self.session, username='jdoe'))
+
+    def test_preload(self):
+        keys = [{'url' : 'http://example.com/r/' + str(i)} for i in range(20)]
+
+        Release.preload(self.session, keys)
+        self.assertEqual(1, len(self.statements))
+
+        # Stored objects are not requested again
+        release = Release.as_unique(self.session, **keys[1])
+        self.assertIsNotNone(release.id)
+        self.assertEqual(1, len(self.statements))
+
+        # Keys not found are looked up one by one
+        releases = [Release.as_unique(self.session, **kw) for kw in keys]
+        self.assertEqual(20, len(self.statements))
+
+        self.assertEqual(release, releases[1])
+        for release in releases[:1] + releases[2:]:
+            self.assertIsNone(release.id)
+
+        # Objects created by as_unique are also reused
+        self.session.flush()
+        self.assertEqual(20, self.session.query(Release).count())
+
+    def test_preload_unsaved_object(self):
+        platform = Platform(url='http://example.org')
+        keys = [{'url' : 'http://example.org/p/1', 'platform' : platform}]
+
+        Project.preload(self.session, keys)
+        project = Project.as_unique(self.session, **keys[0])
+
+        self.assertEqual(0, len(self.statements))
+        self.assertIsNone(project.id)
+        self.assertEqual(platform, project.platform)
+
+    def test_preload_projects(self):
+        project = Project(url='http://example.com/p/1', platform=self.platform)
+        self.session.add(project)
+        self.session.commit()
+        self.session.refresh(self.platform)
+        self.statements = []
+
+        keys = [{'url' : 'http://example.com/p/1', 'platform' : self.platform},
+                {'url' : 'http://example.com/p/2', 'platform' : self.platform}]
+        Project.preload(self.session, keys)
+        self.assertEqual(1, len(self.statements))
+
+        self.assertEqual(project, Project.as_unique(self.session, **keys[0]))
+        self.assertEqual(1, len(self.statements))
+        self.assertIsNone(Project.as_unique(self.session, **keys[1]).id)
+
+    def test_preload_chunks(self):
+        """Check whether long lists of keys are queried in chunks"""
+
+        nkeys = UNIQUE_BULK_SIZE + 10
+        keys = [{'username' : 'user' + str(i)} for i in range(nkeys)]
+
+        self.session.add_all([User(**kw) for kw in keys])
+        self.session.commit()
+        self.session.expunge_all()
+        self.statements = []
+
+        User.preload(self.session, keys)
+        self.assertEqual(2, len(self.statements))
+
+        users = [User.as_unique(self.session, **kw) for kw in keys]
+        self.assertEqual(2, len(self.statements))
+        self.assertEqual(nkeys, len(set(users)))
+        self.assertNotIn(None, [user.id for user in users])
+
+    def test_preload_collation(self):
+        """Check whether keys matched by the collation are not duplicated"""
+
+        # Like MySQL, match usernames without case
+        self.session.execute('DROP TABLE users')
+        self.session.execute('CREATE TABLE users (id INTEGER PRIMARY KEY, '
+                             'username VARCHAR(32) COLLATE NOCASE UNIQUE, '
+                             'email VARCHAR(128))')
+        self.session.execute("INSERT INTO users (username) VALUES ('JSmith')")
+        self.session.commit()
+
+        User.preload(self.session, [{'username' : 'jsmith'}])
+        user = User.as_unique(self.session, username='jsmith')
+
+        self.assertEqual('JSmith', user.username)
+        self.session.flush()
+        self.assertEqual(1, self.session.query(User).count())
+
+
+if __name__ == "__main__":
+    unittest.main()
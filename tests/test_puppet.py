@@ -20,6 +20,7 @@
 #     Santiago Dueñas <sduenas@bitergia.com>
 #
 
+import datetime
 import os.path
 import sys
 import unittest
@@ -28,12 +29,20 @@ import urlparse
 if not '..' in sys.path:
     sys.path.insert(0, '..')
 
+from argparse import ArgumentParser
 from BaseHTTPServer import BaseHTTPRequestHandler
+from StringIO import StringIO
+from multiprocessing.pool import ThreadPool
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
 
 from octopus.backends import Backend
 from octopus.backends.puppet import PuppetForge, PuppetForgeFetcher,\
     PuppetForgeProjectsIterator, PuppetForgeReleasesIterator
-from octopus.model import Project, User, Release
+from octopus.database import ChunkedWriter
+from octopus.model import Checkpoint, ModelBase, Platform, Project, User, Release,\
+    Watermark
 
 from mock_http_server import MockHTTPServer
 from utils import read_file
@@ -449,5 +458,328 @@ class TestPuppetForgeReleasesIterator(unittest.TestCase):
         self.assertEqual('2014-05-10 01:23:51', str(release.updated_on))
 
 
+class TestPuppetForgePrefetch(unittest.TestCase):
+    """Iterators downloading the next pages in the background"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = MockHTTPServer(HTTP_HOST, HTTP_PORT, TEST_FILES_DIRNAME,
+                                   MockPuppetForgeHTTPHandler)
+        cls.httpd.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.stop()
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        ModelBase.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        self.platform = Platform(url=MOCK_HTTP_SERVER_URL, type='puppet')
+        self.pool = ThreadPool(2)
+
+    def tearDown(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def test_projects_prefetch(self):
+        """Check whether prefetched pages are returned in order"""
+
+        iterator = PuppetForgeProjectsIterator(MOCK_HTTP_SERVER_URL,
+                                               self.platform, self.session,
+                                               pool=self.pool)
+        projects = [p.name for p in iterator]
+
+        expected = [p.name for p in PuppetForgeProjectsIterator(MOCK_HTTP_SERVER_URL,
+                                                                self.platform,
+                                                                self.session)]
+        self.assertEqual(39, len(projects))
+        self.assertEqual(expected, projects)
+
+    def test_releases_prefetch(self):
+        """Check whether prefetched releases are returned in order"""
+
+        project = Project(name='stdlib', url=MOCK_HTTP_SERVER_URL + '/stdlib')
+        user = User(username='puppetlabs')
+
+        iterator = PuppetForgeReleasesIterator(MOCK_HTTP_SERVER_URL, project,
+                                               user, self.session, pool=self.pool)
+        releases = [r.version for r in iterator]
+
+        expected = [r.version for r in PuppetForgeReleasesIterator(MOCK_HTTP_SERVER_URL,
+                                                                   project, user,
+                                                                   self.session)]
+        self.assertEqual(expected, releases)
+        self.assertEqual(iterator.offset, 20)
+
+    def test_fetch_jobs(self):
+        """Check whether releases fetched by several jobs keep the order"""
+
+        def fetch(jobs):
+            engine = create_engine('sqlite://')
+            ModelBase.metadata.create_all(engine)
+            session = sessionmaker(bind=engine)()
+
+            backend = PuppetForge(session, MOCK_HTTP_SERVER_URL, jobs=jobs)
+            platform = backend.fetch()
+
+            return [(p.name, p.users[0].username,
+                     [(r.version, r.file_url) for r in p.releases])
+                    for p in platform.projects]
+
+        expected = fetch(1)
+        projects = fetch(3)
+
+        self.assertEqual(39, len(projects))
+        self.assertEqual(expected, projects)
+        self.assertEqual(33, sum([len(r) for _, _, r in projects]))
+
+    def test_page_size(self):
+        """Check whether page sizes over the limit are rejected"""
+
+        self.assertRaises(ValueError, PuppetForge, self.session,
+                          MOCK_HTTP_SERVER_URL, page_size=101)
+        self.assertRaises(ValueError, PuppetForge, self.session,
+                          MOCK_HTTP_SERVER_URL, page_size=0)
+
+        backend = PuppetForge(self.session, MOCK_HTTP_SERVER_URL, page_size=100)
+        self.assertEqual(backend.page_size, 100)
+
+
+    def test_page_size_argument(self):
+        """Check whether page sizes over the limit are rejected when parsed"""
+
+        parser = ArgumentParser()
+        PuppetForge.set_arguments_subparser(parser.add_subparsers())
+
+        args = parser.parse_args(['puppet', '--page-size', '100', MOCK_HTTP_SERVER_URL])
+        self.assertEqual(args.page_size, 100)
+
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+
+        try:
+            for value in ('101', '0', 'ten'):
+                self.assertRaises(SystemExit, parser.parse_args,
+                                  ['puppet', '--page-size', value, MOCK_HTTP_SERVER_URL])
+            errors = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+
+        self.assertIn('must be between 1 and 100', errors)
+
+class StubPuppetForgeFetcher(object):
+    """Fetcher serving `npages` pages of one module each.
+
+    Only the module of the last page was updated after
+    2014-05-14; the rest were last updated on 2014-01-01.
+    """
+
+    def __init__(self, npages):
+        self.npages = npages
+
+    def projects(self, offset, limit):
+        i = offset / limit
+        updated_at = '2014-06-01 00:00:00 -0700' if i == self.npages - 1 \
+            else '2014-01-01 00:00:00 -0700'
+
+        if i < self.npages - 1:
+            next_page = '/v3/modules?offset=%s&limit=%s' % (offset + limit, limit)
+        else:
+            next_page = None
+
+        module = {'uri' : '/v3/modules/user-module%s' % i,
+                  'name' : 'module%s' % i,
+                  'created_at' : '2014-01-01 00:00:00 -0700',
+                  'updated_at' : updated_at,
+                  'owner' : {'username' : 'user'}}
+
+        return {'pagination' : {'next' : next_page},
+                'results' : [module]}
+
+
+class TestPuppetForgeIncremental(unittest.TestCase):
+    """Fetch only the modules updated since the previous run"""
+
+    # Modules of both pages updated since 2014-05-14 04:40:00 -0700,
+    # listed between others that were not updated
+    UPDATED = ['stdlib', 'firewall', 'ntp', 'postgresql', 'mysql', 'java_ks',
+               'collectd', 'elasticsearch', 'logstash', 'netatalk',
+               'types', 'inittab', 'influxdb']
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = MockHTTPServer(HTTP_HOST, HTTP_PORT, TEST_FILES_DIRNAME,
+                                   MockPuppetForgeHTTPHandler)
+        cls.httpd.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.stop()
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        ModelBase.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        # Watermarks are in UTC
+        self.since = datetime.datetime(2014, 5, 14, 11, 40, 0)
+
+    def test_updated_since(self):
+        """Check whether every page is listed when modules are not sorted"""
+
+        platform = Platform(url=MOCK_HTTP_SERVER_URL, type='puppet')
+        iterator = PuppetForgeProjectsIterator(MOCK_HTTP_SERVER_URL, platform,
+                                               self.session, since=self.since)
+
+        self.assertEqual([p.name for p in iterator], self.UPDATED)
+
+    def test_fetch_incremental(self):
+        """Check whether the watermark selects the modules fetched"""
+
+        platform = Platform(url=MOCK_HTTP_SERVER_URL, type='puppet')
+        self.session.add(Watermark(platform=platform, updated_on=self.since))
+        self.session.commit()
+
+        backend = PuppetForge(self.session, MOCK_HTTP_SERVER_URL, incremental=True)
+        backend.fetch()
+        self.session.commit()
+
+        names = [p.name for p in self.session.query(Project).order_by(Project.id)]
+        self.assertEqual(names, self.UPDATED)
+
+        # The latest update of the modules is the next watermark
+        watermark = self.session.query(Watermark).one()
+        self.assertEqual(watermark.updated_on,
+                         datetime.datetime(2014, 5, 14, 11, 41, 50))
+
+
+    def test_many_pages_without_updates(self):
+        """Check whether long runs of pages without updates are skipped"""
+
+        platform = Platform(url=MOCK_HTTP_SERVER_URL, type='puppet')
+        iterator = PuppetForgeProjectsIterator(MOCK_HTTP_SERVER_URL, platform,
+                                               self.session, since=self.since,
+                                               page_size=1)
+        iterator.fetcher = StubPuppetForgeFetcher(1500)
+
+        self.assertEqual([p.name for p in iterator], ['module1499'])
+
+    def test_many_pages_without_releases(self):
+        """Check whether long runs of empty pages of releases are skipped"""
+
+        project = Project(name='stdlib', url=MOCK_HTTP_SERVER_URL + '/stdlib')
+        user = User(username='puppetlabs')
+
+        release = {'uri' : '/v3/releases/puppetlabs-stdlib-1.0.0',
+                   'file_uri' : '/v3/files/puppetlabs-stdlib-1.0.0.tar.gz',
+                   'created_at' : '2014-01-01 00:00:00 -0700',
+                   'updated_at' : '2014-01-01 00:00:00 -0700',
+                   'metadata' : {'version' : '1.0.0'}}
+        pages = [{'pagination' : {'next' : '/v3/releases'}, 'results' : []}] * 1500
+        pages.append({'pagination' : {'next' : None}, 'results' : [release]})
+
+        iterator = PuppetForgeReleasesIterator(MOCK_HTTP_SERVER_URL, project,
+                                               user, self.session, pages=pages)
+
+        self.assertEqual([r.version for r in iterator], ['1.0.0'])
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptedWriter(ChunkedWriter):
+    """Writer that fails after storing some projects"""
+
+    def __init__(self, session, nprojects):
+        super(InterruptedWriter, self).__init__(session, chunk_size=1)
+        self.nprojects = nprojects
+
+    def add(self, *objs):
+        if isinstance(objs[0], Project):
+            if self.nprojects == 0:
+                raise Interrupted()
+            self.nprojects -= 1
+        super(InterruptedWriter, self).add(*objs)
+
+
+class TestPuppetForgeResume(unittest.TestCase):
+    """Resume interrupted runs from their checkpoints"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = MockHTTPServer(HTTP_HOST, HTTP_PORT, TEST_FILES_DIRNAME,
+                                   MockPuppetForgeHTTPHandler)
+        cls.httpd.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.stop()
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        ModelBase.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+
+    def test_listing_after(self):
+        """Check whether projects up to the given one are skipped"""
+
+        platform = Platform(url=MOCK_HTTP_SERVER_URL, type='puppet')
+        projects = [p.url for p in PuppetForgeProjectsIterator(MOCK_HTTP_SERVER_URL,
+                                                               platform, self.session)]
+
+        iterator = PuppetForgeProjectsIterator(MOCK_HTTP_SERVER_URL, platform,
+                                               self.session, offset=20,
+                                               after=projects[24])
+        self.assertEqual([p.url for p in iterator], projects[25:])
+
+        # Unknown projects do not skip anything
+        iterator = PuppetForgeProjectsIterator(MOCK_HTTP_SERVER_URL, platform,
+                                               self.session, offset=20,
+                                               after='http://example.com/')
+        self.assertEqual([p.url for p in iterator], projects[20:])
+
+    def test_resume(self):
+        """Check whether an interrupted run continues from its checkpoint"""
+
+        backend = PuppetForge(self.session, MOCK_HTTP_SERVER_URL)
+        writer = InterruptedWriter(self.session, 25)
+
+        self.assertRaises(Interrupted, backend.fetch, writer)
+        self.session.rollback()
+
+        # The last project stored was the 25th, on the second page
+        platform = Platform(url=MOCK_HTTP_SERVER_URL, type='puppet')
+        projects = [p.url for p in PuppetForgeProjectsIterator(MOCK_HTTP_SERVER_URL,
+                                                               platform, self.session)]
+        self.session.rollback()
+
+        checkpoint = self.session.query(Checkpoint).one()
+        self.assertEqual(checkpoint.offset, 20)
+        self.assertEqual(checkpoint.last_url, projects[24])
+        last_url = checkpoint.last_url
+
+        offsets = []
+
+        class ResumedPuppetForge(PuppetForge):
+            def _projects(self, url, platform, session, since=None, offset=0,
+                          after=None):
+                offsets.append((offset, after))
+                return super(ResumedPuppetForge, self)._projects(url, platform, session,
+                                                                 since, offset, after)
+
+        backend = ResumedPuppetForge(self.session, MOCK_HTTP_SERVER_URL, resume=True)
+        writer = ChunkedWriter(self.session, chunk_size=10)
+        backend.fetch(writer)
+        writer.close()
+
+        self.assertEqual(offsets, [(20, last_url)])
+        self.assertEqual(self.session.query(Project).count(), 39)
+
+        # Finished runs leave nothing to resume
+        checkpoint = self.session.query(Checkpoint).one()
+        self.assertEqual(checkpoint.offset, None)
+        self.assertEqual(checkpoint.last_url, None)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import sys
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+import requests
+
+from octopus.ratelimit import RateLimiter, RESET_MARGIN
+
+
+API_URL = 'https://api.github.com/orgs/octopus'
+
+
+class FakeClock(object):
+
+    def __init__(self, now):
+        self.now = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def build_request(url=API_URL, token='token-a'):
+    request = requests.Request('GET', url, headers={'Authorization' : token})
+    return request.prepare()
+
+
+def build_response(status_code=200, **headers):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers)
+    return response
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock(1000)
+        self.limiter = RateLimiter(pacing_threshold=10,
+                                   clock=self.clock.time,
+                                   sleep=self.clock.sleep)
+
+    def test_no_headers(self):
+        request = build_request()
+
+        retry = self.limiter.update(request, build_response())
+        self.assertIsNone(retry)
+        self.assertEqual(0, self.limiter.delay(request))
+
+    def test_enough_budget(self):
+        request = build_request()
+        response = build_response(**{'X-RateLimit-Remaining' : '4000',
+                                     'X-RateLimit-Reset' : '2000'})
+
+        self.limiter.update(request, response)
+        self.limiter.wait(request)
+        self.assertListEqual([], self.clock.slept)
+
+    def test_pacing(self):
+        request = build_request()
+        response = build_response(**{'X-RateLimit-Remaining' : '5',
+                                     'X-RateLimit-Reset' : '1100'})
+        self.limiter.update(request, response)
+
+        # Requests are spread until the reset time
+        for _ in range(3):
+            self.limiter.wait(request)
+        self.assertListEqual([20, 25], self.clock.slept)
+
+    def test_wait_until_reset(self):
+        request = build_request()
+        response = build_response(**{'X-RateLimit-Remaining' : '0',
+                                     'X-RateLimit-Reset' : '1300'})
+        self.limiter.update(request, response)
+
+        self.limiter.wait(request)
+        self.assertListEqual([300 + RESET_MARGIN], self.clock.slept)
+
+        # Once the reset time has passed, requests are not delayed
+        self.assertEqual(0, self.limiter.delay(request))
+
+    def test_budget_by_credentials(self):
+        response = build_response(**{'X-RateLimit-Remaining' : '0',
+                                     'X-RateLimit-Reset' : '1300'})
+        self.limiter.update(build_request(token='token-a'), response)
+
+        self.assertEqual(0, self.limiter.delay(build_request(token='token-b')))
+        self.assertEqual(0, self.limiter.delay(build_request(url='http://example.com/',
+                                                             token='token-a')))
+
+    def test_retry_after(self):
+        request = build_request()
+        response = build_response(403, **{'Retry-After' : '30'})
+
+        retry = self.limiter.update(request, response)
+        self.assertEqual(30, retry)
+
+        self.limiter.wait(request)
+        self.assertListEqual([30], self.clock.slept)
+
+    def test_rate_limit_exceeded(self):
+        request = build_request()
+        response = build_response(403, **{'X-RateLimit-Remaining' : '0',
+                                          'X-RateLimit-Reset' : '1060'})
+
+        retry = self.limiter.update(request, response)
+        self.assertEqual(60 + RESET_MARGIN, retry)
+
+    def test_forbidden(self):
+        request = build_request()
+        response = build_response(403, **{'X-RateLimit-Remaining' : '20',
+                                          'X-RateLimit-Reset' : '1060'})
+
+        retry = self.limiter.update(request, response)
+        self.assertIsNone(retry)
+
+
+if __name__ == "__main__":
+    unittest.main()
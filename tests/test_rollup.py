@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import datetime
+import sys
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from octopus.model import ModelBase, Repository, RepositoryLog,\
+    RepositoryLogDaily, RepositoryLogWeekly
+from octopus.rollup import Rollup, day_period, week_period
+
+
+def date(day, hour):
+    return datetime.datetime(2015, 3, day, hour)
+
+
+class TestPeriods(unittest.TestCase):
+
+    def test_periods(self):
+        """Check the periods of a date"""
+
+        # 2015-03-04 was a Wednesday
+        self.assertEqual(day_period(date(4, 13)), datetime.datetime(2015, 3, 4))
+        self.assertEqual(week_period(date(4, 13)), datetime.datetime(2015, 3, 2))
+        self.assertEqual(week_period(date(2, 0)), datetime.datetime(2015, 3, 2))
+
+
+class TestRollup(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        ModelBase.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+
+        self.repo = Repository(name='ubuntu', url='ubuntu')
+        self.session.add(self.repo)
+        self.session.commit()
+
+    def add_samples(self, *samples):
+        for dt, starred, pulls in samples:
+            self.session.add(RepositoryLog(repo_id=self.repo.id, date=dt,
+                                           starred=starred, pulls=pulls))
+        self.session.commit()
+
+    def daily(self):
+        q = self.session.query(RepositoryLogDaily)
+        return q.order_by(RepositoryLogDaily.period).all()
+
+    def test_refresh(self):
+        """Check whether samples are aggregated by day and week"""
+
+        self.add_samples((date(4, 10), 10, 100),
+                         (date(4, 12), 8, 150),
+                         (date(4, 11), 12, 120),
+                         (date(5, 10), 13, None))
+
+        rollup = Rollup(self.session, batch_size=2)
+        self.assertEqual(rollup.refresh(), 4)
+
+        daily = self.daily()
+        self.assertEqual(len(daily), 2)
+
+        self.assertEqual(daily[0].period, datetime.datetime(2015, 3, 4))
+        self.assertEqual(daily[0].samples, 3)
+        self.assertEqual(daily[0].starred_min, 8)
+        self.assertEqual(daily[0].starred_max, 12)
+        self.assertEqual(daily[0].starred_last, 8)
+        self.assertEqual(daily[0].pulls_last, 150)
+        self.assertEqual(daily[0].last_date, date(4, 12))
+
+        self.assertEqual(daily[1].samples, 1)
+        self.assertEqual(daily[1].pulls_min, None)
+        self.assertEqual(daily[1].pulls_last, None)
+
+        weekly = self.session.query(RepositoryLogWeekly).all()
+        self.assertEqual(len(weekly), 1)
+        self.assertEqual(weekly[0].period, datetime.datetime(2015, 3, 2))
+        self.assertEqual(weekly[0].samples, 4)
+        self.assertEqual(weekly[0].starred_min, 8)
+        self.assertEqual(weekly[0].starred_max, 13)
+        self.assertEqual(weekly[0].starred_last, 13)
+        self.assertEqual(weekly[0].pulls_max, 150)
+
+    def test_incremental_refresh(self):
+        """Check whether only new samples are aggregated"""
+
+        self.add_samples((date(4, 10), 10, 100))
+
+        rollup = Rollup(self.session)
+        self.assertEqual(rollup.refresh(), 1)
+        self.assertEqual(rollup.refresh(), 0)
+
+        self.add_samples((date(4, 20), 5, 200))
+        self.assertEqual(rollup.refresh(), 1)
+
+        daily = self.daily()
+        self.assertEqual(len(daily), 1)
+        self.assertEqual(daily[0].samples, 2)
+        self.assertEqual(daily[0].starred_min, 5)
+        self.assertEqual(daily[0].starred_max, 10)
+        self.assertEqual(daily[0].pulls_last, 200)
+
+    def test_prune(self):
+        """Check whether only old aggregated samples are removed"""
+
+        now = datetime.datetime.now()
+        old = now - datetime.timedelta(days=60)
+
+        self.add_samples((old, 1, 1), (now, 2, 2))
+
+        rollup = Rollup(self.session)
+
+        # Nothing was aggregated yet
+        self.assertEqual(rollup.prune(30), 0)
+
+        rollup.refresh()
+        self.add_samples((old, 3, 3))
+
+        self.assertEqual(rollup.prune(30), 1)
+
+        starred = [s.starred for s in self.session.query(RepositoryLog)]
+        self.assertEqual(sorted(starred), [2, 3])
+
+        # Aggregates are kept
+        self.assertEqual(len(self.daily()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import datetime
+import sys
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from octopus.database import ChunkedWriter
+from octopus.model import ModelBase, Platform, Project, Repository,\
+    RepositoryLog
+from octopus.snapshots import add_snapshot, clear_snapshots,\
+    preload_snapshots, snapshot_buffer, write_snapshots
+
+
+class TestSnapshotBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        ModelBase.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+
+    def test_write(self):
+        """Check whether snapshots are written with a single statement"""
+
+        repos = [Repository(name='r%s' % i, url='r%s' % i) for i in range(3)]
+        self.session.add_all(repos)
+
+        date = datetime.datetime(2015, 3, 4)
+
+        for i, repo in enumerate(repos):
+            add_snapshot(self.session, repo, date=date, starred=i)
+        add_snapshot(self.session, repos[0], date=date, pulls=10)
+
+        inserts = []
+
+        def count_inserts(conn, cursor, statement, params, context, executemany):
+            if statement.startswith('INSERT INTO repositories_log'):
+                inserts.append(executemany)
+
+        event.listen(self.engine, 'before_cursor_execute', count_inserts)
+
+        nrows = write_snapshots(self.session)
+        self.session.commit()
+
+        self.assertEqual(nrows, 4)
+        self.assertEqual(inserts, [True])
+        self.assertEqual(len(snapshot_buffer(self.session)), 0)
+
+        logs = self.session.query(RepositoryLog).order_by(RepositoryLog.id).all()
+        self.assertEqual([l.repo_id for l in logs],
+                         [repos[0].id, repos[1].id, repos[2].id, repos[0].id])
+        self.assertEqual([l.starred for l in logs], [0, 1, 2, None])
+        self.assertEqual(logs[3].pulls, 10)
+
+        # Nothing else to write
+        self.assertEqual(write_snapshots(self.session), 0)
+
+    def test_unchanged(self):
+        """Check whether snapshots equal to the latest stored are skipped"""
+
+        repo = Repository(name='r', url='r')
+        self.session.add(repo)
+        self.session.flush()
+        self.session.add(RepositoryLog(repo_id=repo.id, starred=1, pulls=2))
+        self.session.commit()
+
+        # The latest snapshot is looked up when it was not preloaded
+        add_snapshot(self.session, repo, starred=1, pulls=2)
+        self.assertEqual(write_snapshots(self.session), 0)
+
+        add_snapshot(self.session, repo, starred=1, pulls=3)
+        add_snapshot(self.session, repo, starred=1, pulls=3)
+        self.assertEqual(write_snapshots(self.session), 1)
+        self.session.commit()
+
+        add_snapshot(self.session, repo, starred=1, pulls=3)
+        self.assertEqual(write_snapshots(self.session), 0)
+
+        logs = self.session.query(RepositoryLog).order_by(RepositoryLog.id).all()
+        self.assertEqual([(l.starred, l.pulls) for l in logs], [(1, 2), (1, 3)])
+
+    def test_preload(self):
+        """Check whether the latest snapshots of a platform are preloaded"""
+
+        platform = Platform(url='p', type='docker')
+        other = Platform(url='o', type='docker')
+        project = Project(url='p', name='p', platform=platform)
+        repos = [Repository(name='r%s' % i, url='r%s' % i, project=project)
+                 for i in range(3)]
+        unknown = Repository(name='u', url='u',
+                             project=Project(url='o', name='o', platform=other))
+        self.session.add_all(repos + [unknown])
+        self.session.flush()
+
+        for starred in range(3):
+            for repo in repos + [unknown]:
+                self.session.add(RepositoryLog(repo_id=repo.id, starred=starred))
+        self.session.commit()
+
+        # Refresh the objects expired by the commit
+        for obj in [platform, project, unknown] + repos:
+            self.session.refresh(obj)
+
+        queries = []
+
+        def count_queries(conn, cursor, statement, params, context, executemany):
+            if statement.startswith('SELECT'):
+                queries.append(statement)
+
+        event.listen(self.engine, 'before_cursor_execute', count_queries)
+
+        preload_snapshots(self.session, platform)
+        preload_snapshots(self.session, platform)
+        self.assertEqual(len(queries), 1)
+
+        for i, repo in enumerate(repos):
+            add_snapshot(self.session, repo, starred=2 + i % 2)
+        new = Repository(name='n', url='n', project=project)
+        self.session.add(new)
+        add_snapshot(self.session, new, starred=2)
+
+        # Neither preloaded nor new repositories need a query
+        self.assertEqual(write_snapshots(self.session), 2)
+        self.assertEqual(len(queries), 1)
+
+        add_snapshot(self.session, unknown, starred=2)
+        self.assertEqual(write_snapshots(self.session), 0)
+        self.assertEqual(len(queries), 2)
+
+        self.session.commit()
+
+        logs = self.session.query(RepositoryLog).filter(RepositoryLog.id > 12).\
+            order_by(RepositoryLog.id).all()
+        self.assertEqual([(l.repo_id, l.starred) for l in logs],
+                         [(repos[1].id, 3), (new.id, 2)])
+
+    def test_clear(self):
+        """Check whether latest counters are discarded on errors"""
+
+        repo = Repository(name='r', url='r')
+        self.session.add(repo)
+        add_snapshot(self.session, repo, starred=1)
+        write_snapshots(self.session)
+
+        # The transaction is rolled back
+        self.session.rollback()
+        clear_snapshots(self.session)
+
+        self.session.add(repo)
+        add_snapshot(self.session, repo, starred=1)
+        self.assertEqual(write_snapshots(self.session), 1)
+
+    def test_writer(self):
+        """Check whether snapshots are written when chunks are committed"""
+
+        writer = ChunkedWriter(self.session, chunk_size=2)
+
+        for i in range(3):
+            repo = Repository(name='r%s' % i, url='r%s' % i)
+            add_snapshot(self.session, repo, starred=i)
+            writer.add(repo)
+
+            # One chunk is committed after adding two repositories
+            nlogs = self.engine.execute('SELECT COUNT(*) FROM repositories_log').scalar()
+            self.assertEqual(nlogs, 2 if i > 0 else 0)
+
+        writer.close()
+
+        nlogs = self.engine.execute('SELECT COUNT(*) FROM repositories_log').scalar()
+        self.assertEqual(nlogs, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Santiago Dueñas <sduenas@bitergia.com>
+#
+
+import datetime
+import sys
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from octopus.timestamps import parse_timestamp, to_utc, unmarshal_timestamp
+
+
+class TestParseTimestamp(unittest.TestCase):
+
+    def test_puppet_format(self):
+        """Check timestamps sent by the Puppet Forge"""
+
+        dt, offset = parse_timestamp('2014-05-14 04:41:21 -0700')
+        self.assertEqual(dt, datetime.datetime(2014, 5, 14, 4, 41, 21))
+        self.assertEqual(offset, -7 * 3600)
+
+    def test_iso_format(self):
+        """Check ISO 8601 timestamps"""
+
+        dt, offset = parse_timestamp('2015-03-04T10:20:30Z')
+        self.assertEqual(dt, datetime.datetime(2015, 3, 4, 10, 20, 30))
+        self.assertEqual(offset, 0)
+
+        dt, offset = parse_timestamp('2015-03-04T10:20:30.1234567+05:30')
+        self.assertEqual(dt, datetime.datetime(2015, 3, 4, 10, 20, 30, 123456))
+        self.assertEqual(offset, 5 * 3600 + 30 * 60)
+
+        dt, offset = parse_timestamp('2015-03-04 10:20:30')
+        self.assertEqual(dt, datetime.datetime(2015, 3, 4, 10, 20, 30))
+        self.assertEqual(offset, None)
+
+    def test_other_formats(self):
+        """Check whether other formats are parsed too"""
+
+        dt, offset = parse_timestamp('Wed, 04 Mar 2015 10:20:30 +0100')
+        self.assertEqual(dt, datetime.datetime(2015, 3, 4, 10, 20, 30))
+        self.assertEqual(offset, 3600)
+
+        dt, offset = parse_timestamp('2015/03/04')
+        self.assertEqual(dt, datetime.datetime(2015, 3, 4))
+        self.assertEqual(offset, None)
+
+        self.assertRaises(ValueError, parse_timestamp, 'not a date')
+
+    def test_same_as_dateutil(self):
+        """Check whether results match the ones of the previous parser"""
+
+        import dateutil.parser
+
+        for ts in ('2011-05-24 18:34:58 -0700', '2014-12-31T23:59:59Z',
+                   '2015-03-04T10:20:30.5-02:00'):
+            expected = dateutil.parser.parse(ts).replace(tzinfo=None)
+            self.assertEqual(unmarshal_timestamp(ts), expected)
+
+    def test_to_utc(self):
+        """Check the conversion to UTC"""
+
+        dt, offset = parse_timestamp('2014-05-14 20:41:21 -0700')
+        self.assertEqual(to_utc(dt, offset), datetime.datetime(2014, 5, 15, 3, 41, 21))
+        self.assertEqual(to_utc(dt, None), dt)
+
+
+if __name__ == "__main__":
+    unittest.main()